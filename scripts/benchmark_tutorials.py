@@ -0,0 +1,434 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Benchmarks the Python test harnesses of the tutorials (tutorials/*/testing.py).
+
+Every reference implementation (*_ref), random input generator, comparator and message formatter
+of the LinearAlgebra and ComplexArithmetic harnesses is timed on a ladder of input sizes:
+the matrix or vector dimension (or the number of qubits of a state vector) for LinearAlgebra,
+and the number of inputs processed in one batch for ComplexArithmetic, whose functions work on single numbers.
+
+The results are written as JSON together with the machine metadata, and compared against
+a baseline: the script exits with code 1 if any benchmark got slower than the baseline
+by more than the threshold. A missing baseline is an error in CI builds (or with --require-baseline).
+
+Timings taken by separate runs differ by much more than the threshold on a shared machine (such as a CI agent),
+so the pull request pipeline compares the trees with --against instead: the harnesses of both checkouts are loaded
+in the same process and timed in alternating rounds on the same inputs, and a benchmark only counts as a regression
+if the median of its per-round ratios exceeds both the threshold and the noise of that median
+(--noise-factor times the interquartile range of the ratios divided by the square root of the number of rounds).
+
+Usage:
+
+    python scripts/benchmark_tutorials.py --output results.json
+    python scripts/benchmark_tutorials.py --save-baseline              # record the baseline on this machine
+    python scripts/benchmark_tutorials.py --against ../main            # compare against another checkout, interleaved
+    python scripts/benchmark_tutorials.py --threshold 0.5 --filter matrix_mult
+"""
+
+import argparse
+import contextlib
+import datetime
+import gc
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, "scripts", "benchmark-tutorials-baseline.json")
+
+# ------------------------------------------------------
+# The shared modules that testing.py imports from utilities/TutorialHarness
+HARNESS_MODULES = ("tutorial_harness", "grading_protocol")
+
+# Loads the testing.py of a tutorial as a separate module (all of them are called "testing"),
+# hiding the "Success!" message it prints on import. The testing.py of each checkout imports
+# the shared harness modules of the same checkout, so that two checkouts can be loaded side by side.
+def load_harness(tutorial, root = ROOT):
+    path = os.path.join(root, "tutorials", tutorial, "testing.py")
+    spec = importlib.util.spec_from_file_location(tutorial + "_testing", path)
+    module = importlib.util.module_from_spec(spec)
+    saved_modules = { name : sys.modules.pop(name) for name in HARNESS_MODULES if name in sys.modules }
+    saved_path = list(sys.path)
+    sys.path.insert(0, os.path.join(root, "utilities", "TutorialHarness"))
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            spec.loader.exec_module(module)
+    finally:
+        for name in HARNESS_MODULES:
+            sys.modules.pop(name, None)
+        sys.modules.update(saved_modules)
+        sys.path[:] = saved_path
+    return module
+
+# ------------------------------------------------------
+# Benchmark cases: (name, sizes, setup), where setup(module, size) prepares the inputs
+# and returns the function to time called with them (a function without arguments).
+# The inputs are generated before the timing starts, so that only the benchmarked function is measured.
+
+def matrices(t, n, count):
+    return [t.gen_complex_matrix(n, n) for i in range(count)]
+
+def column(t, n):
+    return t.gen_complex_matrix(n, 1)
+
+def call(fun, *args):
+    return lambda: fun(*args)
+
+MATRIX_SIZES = (2, 4, 8, 16, 32)
+VECTOR_SIZES = (2, 8, 32, 128)
+DETERMINANT_SIZES = (2, 3, 4, 5, 6)
+QUBIT_COUNTS = (4, 8, 12, 16, 20)
+
+linear_algebra_cases = [
+    # Reference implementations
+    ("matrix_add_ref", MATRIX_SIZES, lambda t, n: call(t.matrix_add_ref, *matrices(t, n, 2))),
+    ("scalar_mult_ref", MATRIX_SIZES, lambda t, n: call(t.scalar_mult_ref, t.randcomplex(), t.gen_complex_matrix(n, n))),
+    ("matrix_mult_ref", MATRIX_SIZES, lambda t, n: call(t.matrix_mult_ref, *matrices(t, n, 2))),
+    ("matrix_inverse_ref", (2,), lambda t, n: call(t.matrix_inverse_ref, t.gen_unitary_matrix(n))),
+    ("transpose_ref", MATRIX_SIZES, lambda t, n: call(t.transpose_ref, t.gen_complex_matrix(n, n))),
+    ("conjugate_ref", MATRIX_SIZES, lambda t, n: call(t.conjugate_ref, t.gen_complex_matrix(n, n))),
+    ("adjoint_ref", MATRIX_SIZES, lambda t, n: call(t.adjoint_ref, t.gen_complex_matrix(n, n))),
+    ("is_matrix_unitary_ref", MATRIX_SIZES, lambda t, n: call(t.is_matrix_unitary_ref, t.gen_unitary_matrix(n))),
+    ("inner_prod_ref", VECTOR_SIZES, lambda t, n: call(t.inner_prod_ref, column(t, n), column(t, n))),
+    ("normalize_ref", VECTOR_SIZES, lambda t, n: call(t.normalize_ref, column(t, n))),
+    ("outer_prod_ref", VECTOR_SIZES, lambda t, n: call(t.outer_prod_ref, column(t, n), column(t, n))),
+    ("tensor_product_ref", (2, 4, 8), lambda t, n: call(t.tensor_product_ref, *matrices(t, n, 2))),
+    ("find_eigenvector_ref", DETERMINANT_SIZES, lambda t, n: call(t.find_eigenvector_ref, *t.gen_eigenmatrix(n))),
+    ("determinant", DETERMINANT_SIZES, lambda t, n: call(t.determinant, t.gen_complex_matrix(n, n))),
+    ("apply_gate_ref", QUBIT_COUNTS, lambda t, n: call(t.apply_gate_ref, t.gen_state_vector(n), *t.gen_gate_application(n))),
+    # Generators
+    ("gen_complex_matrix", MATRIX_SIZES, lambda t, n: call(t.gen_complex_matrix, n, n)),
+    ("gen_unitary_matrix", (2, 4, 8, 16), lambda t, n: call(t.gen_unitary_matrix, n)),
+    ("gen_eigenmatrix", DETERMINANT_SIZES, lambda t, n: call(t.gen_eigenmatrix, n)),
+    ("gen_state_vector", QUBIT_COUNTS, lambda t, n: call(t.gen_state_vector, n)),
+    # Comparators: equal matrices are the worst case, since every element is compared
+    ("matrix_equal", MATRIX_SIZES, lambda t, n: (lambda a: call(t.matrix_equal, a, t.matrix_copy(a)))(t.gen_complex_matrix(n, n))),
+    # Message formatters
+    ("gen_matrix_message", MATRIX_SIZES,
+     lambda t, n: call(t.gen_matrix_message, matrices(t, n, 3), ["A: ", "B: ", "Expected: ", "You returned: "])),
+    ("gen_labeled_message", MATRIX_SIZES,
+     lambda t, n: call(t.gen_labeled_message, matrices(t, n, 3), ["A: ", "Expected: ", "You returned: "])),
+    ("format_matrix", MATRIX_SIZES, lambda t, n: call(t.format_matrix, t.gen_complex_matrix(n, n), "A: ")),
+]
+
+# The ComplexArithmetic functions work on single numbers, so they are timed on batches of inputs
+BATCH_SIZES = (1, 10, 100, 1000)
+
+def batch(fun, inputs):
+    return lambda: [fun(*args) for args in inputs]
+
+def cartesian_pairs(t, n):
+    return [(t.prep_random_cartesian(), t.prep_random_cartesian()) for i in range(n)]
+
+def cartesians(t, n):
+    return [(t.prep_random_cartesian(),) for i in range(n)]
+
+def polars(t, n):
+    return [(t.prep_random_polar(),) for i in range(n)]
+
+def nonzero_divisors(t, n):
+    pairs = cartesian_pairs(t, n)
+    return [(x, y if y != (0, 0) else (1, 0)) for (x, y) in pairs]
+
+def expected_actual(t, n, prepare):
+    # The actual values are slightly off, as a learner's floating point computations would be
+    inputs = [prepare() for i in range(n)]
+    return [(x, (x[0] * (1 + 1e-9), x[1]), "message") for x in inputs]
+
+complex_arithmetic_cases = [
+    # Reference implementations
+    ("imaginary_power_ref", BATCH_SIZES, lambda t, n: batch(t.imaginary_power_ref, [(2 * random.randint(-25, 25),) for i in range(n)])),
+    ("complex_add_ref", BATCH_SIZES, lambda t, n: batch(t.complex_add_ref, cartesian_pairs(t, n))),
+    ("complex_mult_ref", BATCH_SIZES, lambda t, n: batch(t.complex_mult_ref, cartesian_pairs(t, n))),
+    ("conjugate_ref", BATCH_SIZES, lambda t, n: batch(t.conjugate_ref, cartesians(t, n))),
+    ("complex_div_ref", BATCH_SIZES, lambda t, n: batch(t.complex_div_ref, nonzero_divisors(t, n))),
+    ("modulus_ref", BATCH_SIZES, lambda t, n: batch(t.modulus_ref, cartesians(t, n))),
+    ("complex_exp_ref", BATCH_SIZES, lambda t, n: batch(t.complex_exp_ref, cartesians(t, n))),
+    ("complex_exp_real_ref", BATCH_SIZES,
+     lambda t, n: batch(t.complex_exp_real_ref, [(random.random() * random.randint(1, 100), t.prep_random_cartesian()) for i in range(n)])),
+    ("polar_convert_ref", BATCH_SIZES, lambda t, n: batch(t.polar_convert_ref, cartesians(t, n))),
+    ("cartesian_convert_ref", BATCH_SIZES, lambda t, n: batch(t.cartesian_convert_ref, polars(t, n))),
+    ("polar_mult_ref", BATCH_SIZES, lambda t, n: batch(t.polar_mult_ref, [(t.prep_random_polar(), t.prep_random_polar()) for i in range(n)])),
+    ("complex_exp_arbitrary_ref", BATCH_SIZES, lambda t, n: batch(t.complex_exp_arbitrary_ref, cartesian_pairs(t, n))),
+    # Generators
+    ("prep_random_cartesian", BATCH_SIZES, lambda t, n: batch(t.prep_random_cartesian, [()] * n)),
+    ("prep_random_polar", BATCH_SIZES, lambda t, n: batch(t.prep_random_polar, [()] * n)),
+    # Comparators
+    ("assert_tuple", BATCH_SIZES, lambda t, n: batch(t.assert_tuple, cartesians(t, n))),
+    ("assert_cartesian", BATCH_SIZES, lambda t, n: batch(t.assert_cartesian, expected_actual(t, n, t.prep_random_cartesian))),
+    ("assert_polar", BATCH_SIZES, lambda t, n: batch(t.assert_polar, expected_actual(t, n, t.prep_random_polar))),
+    # Message formatters
+    ("format_cartesian", BATCH_SIZES, lambda t, n: batch(t.format_cartesian, cartesians(t, n))),
+    ("format_polar", BATCH_SIZES, lambda t, n: batch(t.format_polar, polars(t, n))),
+]
+
+suites = {
+    "LinearAlgebra" : linear_algebra_cases,
+    "ComplexArithmetic" : complex_arithmetic_cases,
+}
+
+# ------------------------------------------------------
+# Returns the number of loops for which one repetition of the function takes at least min_time seconds
+def calibrate(fun, min_time):
+    loops = 1
+    while time_loops(fun, loops) * loops < min_time:
+        loops *= 2
+    return loops
+
+# Returns the per-call time of the function over the given number of loops; the garbage collector is paused
+# while it runs (as timeit does), so that a collection triggered by earlier benchmarks isn't charged to this one
+def time_loops(fun, loops):
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for i in range(loops):
+            fun()
+        return (time.perf_counter() - start) / loops
+    finally:
+        if enabled:
+            gc.enable()
+
+# Times the function: the number of loops is doubled until one repetition takes at least min_time seconds,
+# then the repetition is run `repeat` times. Returns the per-call times of all repetitions.
+def measure(fun, repeat, min_time):
+    loops = calibrate(fun, min_time)
+    return (loops, [time_loops(fun, loops) for i in range(repeat)])
+
+# Times the two functions in alternating rounds (starting with each of them in turn), so that whatever slows down
+# the machine during the run affects both alike. Returns the number of loops and the per-call times of each function.
+def measure_interleaved(baseline_fun, current_fun, rounds, min_time):
+    loops = max(calibrate(baseline_fun, min_time), calibrate(current_fun, min_time))
+    (baseline_times, current_times) = ([], [])
+    for i in range(rounds):
+        if i % 2 == 0:
+            baseline_times.append(time_loops(baseline_fun, loops))
+            current_times.append(time_loops(current_fun, loops))
+        else:
+            current_times.append(time_loops(current_fun, loops))
+            baseline_times.append(time_loops(baseline_fun, loops))
+    return (loops, baseline_times, current_times)
+
+# Returns the benchmarks to run: (tutorial, name, size, setup)
+def selected_cases(selected, quick):
+    for (tutorial, cases) in suites.items():
+        for (name, sizes, setup) in cases:
+            if selected and not any(s in tutorial + "." + name for s in selected):
+                continue
+            for size in (sizes[:2] if quick else sizes):
+                yield (tutorial, name, size, setup)
+
+# Prepares the inputs of the benchmark and returns the function to time, or None if the harness doesn't define it;
+# the harnesses use the global random generator, so seeding it makes the inputs reproducible
+def prepare(module, tutorial, name, size, setup, seed):
+    random.seed("{0}.{1}.{2}.{3}".format(seed, tutorial, name, size))
+    try:
+        return setup(module, size)
+    except AttributeError:
+        return None
+
+def run_benchmarks(selected, repeat, min_time, seed, quick, root = ROOT):
+    results = []
+    modules = { tutorial : load_harness(tutorial, root) for tutorial in suites }
+    for (tutorial, name, size, setup) in selected_cases(selected, quick):
+        fun = prepare(modules[tutorial], tutorial, name, size, setup, seed)
+        if fun is None:
+            # Another checkout (such as the target branch of a pull request) may not define all the benchmarked functions yet
+            if root == ROOT:
+                raise AttributeError("{0} doesn't define {1}".format(tutorial, name))
+            print("{0:<18} {1:<26} {2:>5} skipped, not defined in {3}".format(tutorial, name, size, root))
+            continue
+        (loops, times) = measure(fun, repeat, min_time)
+        results.append({
+            "tutorial" : tutorial,
+            "function" : name,
+            "size" : size,
+            "loops" : loops,
+            "min" : min(times),
+            "median" : statistics.median(times),
+            "max" : max(times),
+        })
+        print("{0:<18} {1:<26} {2:>5} {3:>12.3f} us".format(tutorial, name, size, min(times) * 1e6))
+    return results
+
+# Times the harnesses of this checkout against those of another one (interleaved, in this process).
+# Each result holds the median of the per-round ratios (current / baseline), their interquartile range
+# and the noise of the median estimated from it.
+def run_interleaved(selected, rounds, min_time, seed, quick, baseline_root, root = ROOT):
+    results = []
+    baseline_modules = { tutorial : load_harness(tutorial, baseline_root) for tutorial in suites }
+    modules = { tutorial : load_harness(tutorial, root) for tutorial in suites }
+    for (tutorial, name, size, setup) in selected_cases(selected, quick):
+        fun = prepare(modules[tutorial], tutorial, name, size, setup, seed)
+        if fun is None:
+            raise AttributeError("{0} doesn't define {1}".format(tutorial, name))
+        baseline_fun = prepare(baseline_modules[tutorial], tutorial, name, size, setup, seed)
+        if baseline_fun is None:
+            # The target branch of a pull request may not define all the benchmarked functions yet
+            print("{0:<18} {1:<26} {2:>5} skipped, not defined in {3}".format(tutorial, name, size, baseline_root))
+            continue
+        (loops, baseline_times, times) = measure_interleaved(baseline_fun, fun, rounds, min_time)
+        ratios = [current / previous for (previous, current) in zip(baseline_times, times)]
+        quartiles = statistics.quantiles(ratios, n = 4)
+        results.append({
+            "tutorial" : tutorial,
+            "function" : name,
+            "size" : size,
+            "loops" : loops,
+            "baseline_median" : statistics.median(baseline_times),
+            "median" : statistics.median(times),
+            "ratio" : statistics.median(ratios),
+            "spread" : quartiles[2] - quartiles[0],
+            "noise" : (quartiles[2] - quartiles[0]) / rounds ** 0.5,
+        })
+        print("{0:<18} {1:<26} {2:>5} {3:>12.3f} us {4:>12.3f} us {5:>6.2f}x +- {6:.2f}".format(
+            tutorial, name, size, results[-1]["baseline_median"] * 1e6, results[-1]["median"] * 1e6,
+            results[-1]["ratio"], results[-1]["noise"]))
+    return results
+
+# ------------------------------------------------------
+def git_commit(root):
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd = root, capture_output = True,
+                              text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def harness_hashes(root):
+    hashes = {}
+    for tutorial in suites:
+        with open(os.path.join(root, "tutorials", tutorial, "testing.py"), "rb") as f:
+            hashes[tutorial] = hashlib.sha256(f.read()).hexdigest()
+    return hashes
+
+def machine_metadata(root = ROOT):
+    return {
+        "timestamp" : datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "platform" : platform.platform(),
+        "machine" : platform.machine(),
+        "processor" : platform.processor(),
+        "cpu_count" : os.cpu_count(),
+        "python" : platform.python_version(),
+        "implementation" : platform.python_implementation(),
+        "git_commit" : git_commit(root),
+        "harnesses" : harness_hashes(root),
+    }
+
+# ------------------------------------------------------
+# Compares the results against the baseline by the fastest repetition, which is the least noisy estimate.
+# Returns the list of (key, baseline, current, ratio) of the benchmarks that got slower than allowed.
+def compare(results, baseline, threshold):
+    previous = {}
+    for entry in baseline["results"]:
+        previous[(entry["tutorial"], entry["function"], entry["size"])] = entry["min"]
+    regressions = []
+    for entry in results:
+        key = (entry["tutorial"], entry["function"], entry["size"])
+        if key not in previous or previous[key] <= 0:
+            continue
+        ratio = entry["min"] / previous[key]
+        if ratio > 1 + threshold:
+            regressions.append((key, previous[key], entry["min"], ratio))
+    return regressions
+
+# Returns the list of (key, baseline, current, ratio) of the interleaved benchmarks whose median ratio exceeds
+# both the threshold and the noise of the median
+def interleaved_regressions(results, threshold, noise_factor):
+    regressions = []
+    for entry in results:
+        if entry["ratio"] > 1 + max(threshold, noise_factor * entry["noise"]):
+            regressions.append(((entry["tutorial"], entry["function"], entry["size"]),
+                                entry["baseline_median"], entry["median"], entry["ratio"]))
+    return regressions
+
+def print_regressions(regressions, threshold):
+    print("Performance regressions (more than {0:.0%} slower than the baseline):".format(threshold))
+    for ((tutorial, name, size), before, after, ratio) in regressions:
+        print("  {0}.{1} size {2}: {3:.3f} us -> {4:.3f} us ({5:.2f}x)".format(tutorial, name, size, before * 1e6, after * 1e6, ratio))
+
+# Azure Pipelines sets TF_BUILD and most other CI services set CI
+def running_in_ci():
+    return bool(os.environ.get("TF_BUILD") or os.environ.get("CI"))
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmarks the reference implementations, generators, "
+                                                   "comparators and formatters of the tutorial test harnesses.")
+    parser.add_argument("--output", help = "write the results to this JSON file")
+    parser.add_argument("--baseline", default = DEFAULT_BASELINE, help = "the baseline JSON file to compare against")
+    parser.add_argument("--save-baseline", action = "store_true", help = "store the results as the new baseline instead of comparing")
+    parser.add_argument("--threshold", type = float, default = 0.25,
+                        help = "the allowed slowdown relative to the baseline (0.25 = 25%%)")
+    parser.add_argument("--filter", action = "append", default = [],
+                        help = "only run the benchmarks whose Tutorial.function name contains this string (can be repeated)")
+    parser.add_argument("--against", metavar = "TREE",
+                        help = "compare against the harnesses of this checkout, timed in the same process in alternating rounds")
+    parser.add_argument("--rounds", type = int, default = 15, help = "the number of alternating rounds with --against")
+    parser.add_argument("--noise-factor", type = float, default = 3.0,
+                        help = "with --against, a slowdown only counts if it also exceeds this many times the noise of the median ratio")
+    parser.add_argument("--repeat", type = int, default = 5, help = "the number of timed repetitions")
+    parser.add_argument("--min-time", type = float, default = 0.02, help = "the minimal duration of one repetition, in seconds")
+    parser.add_argument("--seed", default = "0", help = "the seed of the generated inputs")
+    parser.add_argument("--quick", action = "store_true", help = "only run the two smallest sizes of each benchmark")
+    parser.add_argument("--tree", default = ROOT,
+                        help = "benchmark the harnesses of this checkout of the repository (e.g., to record the baseline of the target branch)")
+    parser.add_argument("--require-baseline", action = "store_true", default = running_in_ci(),
+                        help = "fail if there is no baseline to compare against (the default in CI builds)")
+    args = parser.parse_args()
+
+    if args.against:
+        report = {
+            "metadata" : dict(machine_metadata(args.tree), baseline = machine_metadata(args.against), rounds = args.rounds,
+                              min_time = args.min_time, seed = args.seed),
+            "results" : run_interleaved(args.filter, args.rounds, args.min_time, args.seed, args.quick, args.against, args.tree),
+        }
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent = 2)
+        regressions = interleaved_regressions(report["results"], args.threshold, args.noise_factor)
+        if regressions:
+            print_regressions(regressions, args.threshold)
+            return 1
+        print("No regressions against " + args.against)
+        return 0
+
+    report = {
+        "metadata" : dict(machine_metadata(args.tree), repeat = args.repeat, min_time = args.min_time, seed = args.seed),
+        "results" : run_benchmarks(args.filter, args.repeat, args.min_time, args.seed, args.quick, args.tree),
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent = 2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent = 2)
+        print("Baseline saved to " + args.baseline)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        if args.require_baseline:
+            print("Error: no baseline found at " + args.baseline)
+            return 2
+        print("No baseline found at " + args.baseline + ", skipping the comparison")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(report["results"], baseline, args.threshold)
+    if baseline["metadata"].get("platform") != report["metadata"]["platform"]:
+        print("Warning: the baseline was recorded on a different platform ({0})".format(baseline["metadata"].get("platform")))
+    if regressions:
+        print_regressions(regressions, args.threshold)
+        return 1
+    print("No regressions against the baseline")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Restores, builds and prebuilds the katas and tutorials for the Docker image.
+
+Instead of restoring every solution one after another and then running prebuild-kata.sh for each kata in turn,
+the build is split into steps which run concurrently on a bounded number of workers:
+
+  * restore: the package references of all project files (.csproj) are collected, and their union
+    is restored first into the NuGet global packages folder, through generated projects which reference
+    all of them (one project per version, if several versions of the same package are referenced), which downloads
+    most of the packages at once. A restore resolves the dependencies of all its references as one graph,
+    so it doesn't get every version a single project resolves to; every project is then restored on its own,
+    one after another (a restore also writes the obj folders of the referenced projects, which the katas share),
+    so that the cache holds everything each of them needs once the online sources are removed;
+  * build: once all the projects are restored, each project of the prebuilt katas is built, without restoring again,
+    once the projects it references are built (for example, utilities/Common before the katas that use it);
+  * prebuild: the notebook of each kata is executed once its projects are built, as prebuild-kata.sh does,
+    so that the first use of the kata starts faster.
+
+Each step runs as a separate process; its output is printed in one block when it completes, followed by
+a summary of the time taken by each step. If a step fails, the steps that depend on it are skipped,
+and the script exits with code 1.
+
+Usage (the katas are given as folders, or as notebook paths for the folders with several notebooks):
+
+    python scripts/build_katas.py BasicGates Superposition tutorials/Qubit/Qubit.ipynb --workers 4
+    python scripts/build_katas.py --restore-only
+    python scripts/build_katas.py Superposition --dry-run --report build-times.json
+    python scripts/build_katas.py Superposition BasicGates --profile notebook-profile
+
+With --profile, the notebooks are prebuilt by profile_notebooks.py, which records the time, the peak kernel memory
+and the output size of each cell in the given folder, and the ranked report of the slowest cells is written there.
+"""
+
+import argparse
+import concurrent.futures
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ElementTree
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SKIPPED_FOLDERS = { ".git", "bin", "obj", "node_modules", ".ipynb_checkpoints" }
+
+# ------------------------------------------------------
+def find_projects(root):
+    for (folder, subfolders, files) in os.walk(root):
+        subfolders[:] = sorted(s for s in subfolders if s not in SKIPPED_FOLDERS)
+        for file_name in sorted(files):
+            if file_name.endswith(".csproj"):
+                yield os.path.join(folder, file_name)
+
+def parse_project(path):
+    """Returns the SDK, the target frameworks, the package references ({ name : version })
+    and the referenced projects (absolute paths) of a project file
+    """
+    project = ElementTree.parse(path).getroot()
+    frameworks = set()
+    for element in project.iter():
+        if element.tag in ("TargetFramework", "TargetFrameworks") and element.text:
+            frameworks.update(f.strip() for f in element.text.split(";") if f.strip())
+    packages = { reference.get("Include") : reference.get("Version")
+                 for reference in project.iter("PackageReference") if reference.get("Include") }
+    folder = os.path.dirname(path)
+    references = [os.path.normpath(os.path.join(folder, reference.get("Include").replace("\\", "/")))
+                  for reference in project.iter("ProjectReference")]
+    return { "path" : path, "sdk" : project.get("Sdk"), "frameworks" : sorted(frameworks),
+             "packages" : packages, "references" : references }
+
+def union_references(projects):
+    """Returns the SDKs, the target frameworks and the package versions ({ name : [versions] }) used by the projects"""
+    sdks = sorted(set(p["sdk"] for p in projects if p["sdk"]))
+    frameworks = sorted(set(f for p in projects for f in p["frameworks"]))
+    packages = {}
+    for project in projects:
+        for (name, version) in project["packages"].items():
+            versions = packages.setdefault(name, [])
+            if version not in versions:
+                versions.append(version)
+    return (sdks, frameworks, { name : sorted(versions, key = str) for (name, versions) in sorted(packages.items()) })
+
+def restore_projects(sdks, frameworks, packages):
+    """Returns the contents of the projects to restore to get all the SDKs and package versions into the NuGet cache.
+    A project can't reference two versions of the same package, so the versions are spread across several projects,
+    and each SDK is used by at least one of them.
+    """
+    count = max([len(sdks)] + [len(versions) for versions in packages.values()])
+    projects = []
+    for i in range(count):
+        lines = [f'<Project Sdk="{sdks[min(i, len(sdks) - 1)] if sdks else "Microsoft.NET.Sdk"}">',
+                 "  <PropertyGroup>",
+                 f"    <TargetFrameworks>{';'.join(frameworks)}</TargetFrameworks>",
+                 "  </PropertyGroup>",
+                 "  <ItemGroup>"]
+        for (name, versions) in packages.items():
+            # The projects beyond the number of versions of a package reference its latest version again
+            version = versions[min(i, len(versions) - 1)]
+            lines.append(f'    <PackageReference Include="{name}"' + (f' Version="{version}"' if version else "") + " />")
+        lines += ["  </ItemGroup>", "</Project>", ""]
+        projects.append("\n".join(lines))
+    return projects
+
+# ------------------------------------------------------
+def kata_notebook(kata):
+    """Returns the folder and the notebook of a kata given as a folder (the notebook is named after the folder)
+    or as the path of a notebook
+    """
+    if kata.endswith(".ipynb"):
+        return (os.path.dirname(kata), kata)
+    folder = kata.rstrip("/")
+    return (folder, os.path.join(folder, os.path.basename(folder) + ".ipynb"))
+
+def plan_steps(root, katas, restore_folder, restore_contents, projects, profile_folder = None):
+    """Returns the steps of the build: { name : (command, working folder, names of the steps it depends on) }.
+    If profile_folder is set, the notebooks are executed by profile_notebooks.py, which writes their profiles there.
+    """
+    steps = {}
+    restore_steps = []
+    for (index, contents) in enumerate(restore_contents):
+        path = os.path.join(restore_folder, f"Restore{index}", f"Restore{index}.csproj")
+        name = f"restore {index + 1}/{len(restore_contents)}"
+        steps[name] = (["dotnet", "restore", path, "--configfile", os.path.join(root, "NuGet.config")], root, [])
+        restore_steps.append(name)
+
+    by_path = { p["path"] : p for p in projects }
+    # Every project is restored, whether or not it is built, so that the katas which aren't prebuilt can be restored
+    # offline later. Restoring a project writes the obj folders of the projects it references too, so two concurrent
+    # restores of katas which share a reference (such as utilities/Common) would write the same files. The projects
+    # are restored one after another, which is quick once the packages are in the cache, and the builds (which read
+    # the same obj folders) start after the last restore, without restoring again.
+    last_restore = restore_steps
+    for project in projects:
+        restore_name = "restore " + os.path.relpath(project["path"], root).replace(os.sep, "/")
+        steps[restore_name] = (["dotnet", "restore", project["path"], "--configfile", os.path.join(root, "NuGet.config")],
+                               root, last_restore)
+        last_restore = [restore_name]
+
+    def add_build(path):
+        relative_path = os.path.relpath(path, root).replace(os.sep, "/")
+        name = "build " + relative_path
+        if name not in steps:
+            dependencies = [add_build(reference) for reference in by_path[path]["references"] if reference in by_path]
+            # The referenced projects are built by their own steps, so they are not built again (concurrently) here
+            steps[name] = (["dotnet", "build", path, "--no-restore", "-p:BuildProjectReferences=false"], root,
+                           last_restore + dependencies)
+        return name
+
+    last_prebuild = {}
+    for kata in katas:
+        (folder, notebook) = kata_notebook(kata)
+        dependencies = [add_build(path) for path in sorted(glob.glob(os.path.join(root, folder, "*.csproj")))] or last_restore
+        # The notebooks of the same folder load the same project, so they are executed one after another
+        if folder in last_prebuild:
+            dependencies = dependencies + [last_prebuild[folder]]
+        last_prebuild[folder] = "prebuild " + notebook
+        if profile_folder is None:
+            command = ["jupyter", "nbconvert", notebook, "--execute", "--to", "markdown", "--allow-errors", "--ExecutePreprocessor.timeout=120"]
+        else:
+            command = [sys.executable, os.path.join(root, "scripts", "profile_notebooks.py"), "run", notebook,
+                       "--allow-errors", "--timeout", "120", "--output-dir", profile_folder]
+        steps["prebuild " + notebook] = (command, root, dependencies)
+    return steps
+
+def run_steps(steps, workers, dry_run = False):
+    """Runs each step once the steps it depends on succeed. Returns { name : (status, start, seconds) }."""
+    results = {}
+    lock = threading.Lock()
+    started = time.perf_counter()
+
+    def run(name):
+        (command, folder, dependencies) = steps[name]
+        start = time.perf_counter() - started
+        if dry_run:
+            with lock:
+                print(f"{name}: {' '.join(command)}" + (f" (after {', '.join(dependencies)})" if dependencies else ""))
+            return ("ok", start, 0.0)
+        process = subprocess.run(command, cwd = folder, stdout = subprocess.PIPE, stderr = subprocess.STDOUT,
+                                 universal_newlines = True)
+        seconds = time.perf_counter() - started - start
+        status = "ok" if process.returncode == 0 else "failed"
+        with lock:
+            print(f"[{status}] {name} ({seconds:.1f} s)\n{process.stdout}", flush = True)
+        return (status, start, seconds)
+
+    pending = dict(steps)
+    with concurrent.futures.ThreadPoolExecutor(max_workers = workers) as pool:
+        running = {}
+        while pending or running:
+            changed = True
+            while changed:
+                changed = False
+                for (name, (command, folder, dependencies)) in list(pending.items()):
+                    if any(results[d][0] != "ok" for d in dependencies if d in results):
+                        results[name] = ("skipped", None, 0.0)
+                    elif all(d in results for d in dependencies):
+                        running[pool.submit(run, name)] = name
+                    else:
+                        continue
+                    del pending[name]
+                    changed = True
+            if not running:
+                if pending:
+                    raise ValueError(f"The steps {', '.join(pending)} depend on each other")
+                break
+            (done, _) = concurrent.futures.wait(running, return_when = concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future)] = future.result()
+    return results
+
+def format_summary(results, total):
+    width = max([len("Step")] + [len(name) for name in results])
+    lines = [f"{'Step':<{width}} {'Status':<8} {'Start':>8} {'Time':>8}"]
+    for (name, (status, start, seconds)) in sorted(results.items(), key = lambda r: (r[1][1] is None, r[1][1] or 0)):
+        lines.append(f"{name:<{width}} {status:<8} " + (f"{start:>7.1f}s {seconds:>7.1f}s" if start is not None else f"{'-':>8} {'-':>8}"))
+    busy = sum(seconds for (status, start, seconds) in results.values())
+    lines.append(f"Total: {total:.1f} s ({busy:.1f} s of work in all steps)")
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description = "Restores, builds and prebuilds the katas concurrently.")
+    parser.add_argument("katas", nargs = "*", help = "the kata folders or notebooks to build and prebuild")
+    parser.add_argument("--workers", type = int, default = min(4, os.cpu_count() or 1), help = "the number of steps that run at the same time")
+    parser.add_argument("--restore-only", action = "store_true", help = "only restore the packages of all projects")
+    parser.add_argument("--dry-run", action = "store_true", help = "print the steps without running them")
+    parser.add_argument("--report", help = "the JSON file to write the step times to")
+    parser.add_argument("--profile", help = "the folder to write the profiles of the prebuilt notebooks' cells to")
+    args = parser.parse_args()
+
+    projects = [parse_project(path) for path in find_projects(ROOT)]
+    (sdks, frameworks, packages) = union_references(projects)
+    print(f"{len(projects)} projects reference {sum(len(v) for v in packages.values())} package versions "
+          f"({len(packages)} packages) and {len(sdks)} SDKs")
+    restore_contents = restore_projects(sdks, frameworks, packages)
+
+    with tempfile.TemporaryDirectory(prefix = "restore-katas-") as restore_folder:
+        for (index, contents) in enumerate(restore_contents):
+            os.makedirs(os.path.join(restore_folder, f"Restore{index}"))
+            with open(os.path.join(restore_folder, f"Restore{index}", f"Restore{index}.csproj"), "w") as f:
+                f.write(contents)
+        profile_folder = os.path.abspath(args.profile) if args.profile else None
+        steps = plan_steps(ROOT, [] if args.restore_only else args.katas, restore_folder, restore_contents, projects, profile_folder)
+        started = time.perf_counter()
+        results = run_steps(steps, args.workers, args.dry_run)
+        total = time.perf_counter() - started
+
+    print(format_summary(results, total))
+    if profile_folder is not None and not args.dry_run and os.path.isdir(profile_folder):
+        subprocess.run([sys.executable, os.path.join(ROOT, "scripts", "profile_notebooks.py"), "report", profile_folder,
+                        "--output", os.path.join(profile_folder, "notebook-report")])
+    if args.report is not None:
+        with open(args.report, "w") as f:
+            json.dump({ "total" : total, "workers" : args.workers,
+                        "steps" : { name : { "status" : status, "start" : start, "seconds" : seconds }
+                                    for (name, (status, start, seconds)) in results.items() } }, f, indent = 2)
+    return 0 if all(status == "ok" for (status, start, seconds) in results.values()) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
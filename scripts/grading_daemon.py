@@ -0,0 +1,491 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""A local daemon that grades the exercises of the Python tutorials (tutorials/*/testing.py) for many kernels at once.
+
+The kernels send the submitted functions over a Unix socket (see "Remote grading" in utilities/TutorialHarness),
+and the daemon runs the tests in a bounded pool of worker processes:
+
+  * each worker keeps the inputs generated for an exercise (the calls to the generators such as gen_complex_matrix,
+    together with the state of the random number generator after each call) and the results of the reference
+    implementations warm, so all the submissions of the exercise it grades replay the same shared inputs
+    and expected values instead of generating and computing them again; these are only recorded by grading
+    the reference implementation, in the worker itself;
+  * each submission is graded in a child process forked from the worker, so the learner's code never runs
+    in the worker: whatever it changes (the tests, the reference implementations, the random module)
+    is gone when the child exits, and can't affect the submissions graded after it;
+  * the submissions of the same exercise which arrive while the workers are busy are coalesced into one batch,
+    which is graded by one worker (preferably one that already has the exercise warm);
+  * at most --max-pending requests are accepted at a time: a request takes a slot before its body is read,
+    and when no slot is free the daemon answers "busy" without reading it, so the kernel grades the exercise itself;
+  * each submission is graded within --timeout seconds, or within the time its kernel has left to wait
+    (the deadline it sends), whichever is shorter: a child still running after that (for example, stuck
+    in an infinite loop) is killed, and only that submission is reported as having timed out;
+    a submission whose deadline has passed before it is graded is answered "expired", and the kernel grades it itself;
+  * a worker that doesn't answer within the time limits of its whole batch is replaced.
+
+The tests run with a fixed seed per exercise, so that all the submissions get the same inputs.
+The socket is only accessible to the user who started the daemon, since the submissions are code it runs.
+
+Usage:
+
+    python scripts/grading_daemon.py --socket /tmp/katas-grading.sock --workers 4 --warm
+    KATAS_GRADING_SOCKET=/tmp/katas-grading.sock jupyter notebook
+"""
+
+import argparse
+import asyncio
+import contextlib
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import pickle
+import random
+import select
+import signal
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "utilities", "TutorialHarness"))
+from grading_protocol import FRAME_HEADER, encode_frame
+TUTORIALS = ("LinearAlgebra", "ComplexArithmetic")
+
+# The functions of each harness that generate random inputs
+GENERATORS = {
+    "LinearAlgebra" : ("gen_complex_matrix", "gen_unitary_matrix", "gen_state_vector", "gen_gate_application", "gen_eigenmatrix"),
+    "ComplexArithmetic" : ("prep_random_cartesian", "prep_random_polar"),
+}
+
+# Generated inputs and reference results larger than this (pickled) are computed every time instead of being kept
+MAX_SHARED_BYTES = 1 << 20
+# The number of reference results kept per exercise
+MAX_MEMO_ENTRIES = 10_000
+# The time (in seconds) a worker gets beyond the time limits of its batch before it is replaced
+WORKER_GRACE = 10
+
+# ------------------------------------------------------
+# Worker processes
+
+def load_harness(tutorial):
+    path = os.path.join(ROOT, "tutorials", tutorial, "testing.py")
+    spec = importlib.util.spec_from_file_location(tutorial + "_testing", path)
+    module = importlib.util.module_from_spec(spec)
+    with contextlib.redirect_stdout(io.StringIO()):
+        spec.loader.exec_module(module)
+    # The daemon grades the exercises itself
+    module.remote_grading["socket"] = None
+    return module
+
+def exercise_seed(tutorial, exercise):
+    return f"grading-daemon:{tutorial}:{exercise}"
+
+class SharedCases:
+    """The generated inputs and the reference results of one exercise, shared by all the submissions a worker grades.
+
+    The generators are replaced by a tape: the k-th generator call of a test returns the k-th recorded result,
+    and restores the state the random number generator had after the recorded call, so that the test goes on
+    exactly as it did when the result was recorded. Since every test of the exercise starts from the same seed,
+    the recorded calls are a prefix of the calls of every test; once a test makes a call that doesn't match
+    the tape, it computes its inputs itself. The reference implementations are memoized by their arguments.
+    """
+
+    def __init__(self, harness, tutorial, exercise):
+        self.harness = harness
+        self.tutorial = tutorial
+        self.exercise = exercise
+        self.tape = []
+        self.memo = {}
+        self.position = None
+        self.depth = 0
+        self.stats = { "replayed" : 0, "generated" : 0, "memo_hits" : 0, "memo_misses" : 0 }
+        # Whether the reference implementation has been graded, recording the tape and the memo
+        self.warm = False
+
+    def rewind(self):
+        random.seed(exercise_seed(self.tutorial, self.exercise))
+        self.position = 0
+
+    def taped(self, name, generator):
+        def wrapper(*args, **kwargs):
+            if self.depth > 0 or self.position is None:
+                return generator(*args, **kwargs)
+            key = pickle.dumps((name, args, kwargs))
+            if self.position < len(self.tape) and self.tape[self.position][0] == key:
+                (key, result, state) = self.tape[self.position]
+                self.position += 1
+                if result is not None:
+                    self.stats["replayed"] += 1
+                    random.setstate(state)
+                    return pickle.loads(result)
+                # The result was too large to keep: generate it again from the same state
+                return self.generate(generator, args, kwargs)
+            result = self.generate(generator, args, kwargs)
+            if self.position == len(self.tape):
+                data = pickle.dumps(result)
+                self.tape.append((key, data if len(data) <= MAX_SHARED_BYTES else None, random.getstate()))
+                self.position += 1
+            else:
+                # The test diverged from the tape, so the rest of it can't be replayed
+                self.position = None
+            return result
+        return wrapper
+
+    def generate(self, generator, args, kwargs):
+        self.stats["generated"] += 1
+        self.depth += 1
+        try:
+            return generator(*args, **kwargs)
+        finally:
+            self.depth -= 1
+
+    def memoized(self, reference):
+        def wrapper(*args, **kwargs):
+            key = pickle.dumps((reference.__name__, args, kwargs))
+            if key in self.memo:
+                self.stats["memo_hits"] += 1
+                return pickle.loads(self.memo[key])
+            self.stats["memo_misses"] += 1
+            result = reference(*args, **kwargs)
+            data = pickle.dumps(result)
+            if len(key) + len(data) <= MAX_SHARED_BYTES and len(self.memo) < MAX_MEMO_ENTRIES:
+                self.memo[key] = data
+            return result
+        wrapper.__name__ = reference.__name__
+        return wrapper
+
+    @contextlib.contextmanager
+    def installed(self):
+        """Replaces the generators and the reference implementations of the harness while the tests run"""
+        originals = {}
+        for name in GENERATORS[self.tutorial]:
+            originals[name] = getattr(self.harness, name)
+            setattr(self.harness, name, self.taped(name, originals[name]))
+        for name in dir(self.harness):
+            if name.endswith("_ref"):
+                originals[name] = getattr(self.harness, name)
+                setattr(self.harness, name, self.memoized(originals[name]))
+        try:
+            yield originals
+        finally:
+            for (name, value) in originals.items():
+                setattr(self.harness, name, value)
+            self.position = None
+
+def run_submission(harness, exercise, fun, shared):
+    """Runs the test of the exercise and returns its output"""
+    shared.rewind()
+    harness.thread_output.stream = io.StringIO()
+    try:
+        harness.run_test(fun)
+        return harness.thread_output.stream.getvalue()
+    except Exception as e:
+        return harness.thread_output.stream.getvalue() + "Your function raised an exception: {0!r}\n".format(e)
+    finally:
+        harness.thread_output.stream = None
+
+def grade_submission(harness, exercise, portable, shared):
+    """Rebuilds and grades the submitted function; returns the response"""
+    try:
+        fun = harness.rebuild_function(portable)
+    except Exception as e:
+        return { "status" : "error", "message" : f"Can't rebuild the submitted function: {e!r}" }
+    return { "status" : "ok", "output" : run_submission(harness, exercise, fun, shared) }
+
+def read_within(fd, limit):
+    """Reads the pipe until it is closed; returns None if that takes longer than `limit` seconds"""
+    deadline = time.monotonic() + limit
+    chunks = []
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+            return None
+        chunk = os.read(fd, 1 << 16)
+        if not chunk:
+            return b"".join(chunks)
+        chunks.append(chunk)
+
+def grade_isolated(harness, exercise, portable, shared, limit):
+    """Grades the submission in a child process forked from the worker, which inherits the warm shared cases;
+    nothing the learner's code changes outlives the child. The response comes back through a pipe as JSON,
+    so that the child can't make the worker run code by what it sends. The child is killed if it doesn't
+    answer within `limit` seconds.
+    """
+    (read_end, write_end) = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        try:
+            response = grade_submission(harness, exercise, portable, shared)
+            with os.fdopen(write_end, "w") as f:
+                json.dump(response, f)
+        finally:
+            os._exit(0)
+    os.close(write_end)
+    try:
+        data = read_within(read_end, limit)
+    finally:
+        os.close(read_end)
+    if data is None:
+        os.kill(pid, signal.SIGKILL)
+    os.waitpid(pid, 0)
+    if data is None:
+        return { "status" : "ok", "output" : "Your function didn't finish within {0:.0f} seconds.\n".format(limit) }
+    try:
+        response = json.loads(data)
+    except ValueError:
+        return { "status" : "error", "message" : "The grading process exited without a result" }
+    if not isinstance(response, dict) or response.get("status") != "ok" or not isinstance(response.get("output"), str):
+        return { "status" : "error", "message" : "The grading process returned an invalid result" }
+    return response
+
+def grade_reference(harness, exercise, shared, originals):
+    """Grades the reference implementation in the worker itself, which records the shared cases of the exercise"""
+    reference = originals.get(exercise + "_ref")
+    if reference is not None:
+        fun = lambda *args, **kwargs: reference(*args, **kwargs)
+        fun.__name__ = exercise
+        run_submission(harness, exercise, fun, shared)
+    shared.warm = True
+
+def grade_batch(harnesses, shared_cases, tutorial, exercise, submissions, timeout):
+    """Grades the submissions of one exercise, given as (function, deadline) pairs; a function of None grades
+    the reference implementation, which warms up the shared cases. Each submission gets `timeout` seconds,
+    or the time left until its deadline (if it has one), whichever is shorter.
+    """
+    harness = harnesses[tutorial]
+    key = (tutorial, exercise)
+    if key not in shared_cases:
+        shared_cases[key] = SharedCases(harness, tutorial, exercise)
+    shared = shared_cases[key]
+    responses = []
+    with shared.installed() as originals:
+        for (portable, deadline) in submissions:
+            if portable is None:
+                grade_reference(harness, exercise, shared, originals)
+                responses.append({ "status" : "ok", "output" : "" })
+                continue
+            # The shared cases are recorded from the reference implementation only, never from a submission
+            if not shared.warm:
+                grade_reference(harness, exercise, shared, originals)
+            limit = timeout if deadline is None else min(timeout, deadline - time.time())
+            if limit <= 0:
+                # The kernel has stopped waiting for this submission
+                responses.append({ "status" : "expired", "message" : "The submission waited past its deadline" })
+                continue
+            responses.append(grade_isolated(harness, exercise, portable, shared, limit))
+    return responses
+
+def worker_main(connection):
+    harnesses = { tutorial : load_harness(tutorial) for tutorial in TUTORIALS }
+    shared_cases = {}
+    while True:
+        try:
+            (tutorial, exercise, submissions, timeout) = connection.recv()
+        except EOFError:
+            return
+        connection.send(grade_batch(harnesses, shared_cases, tutorial, exercise, submissions, timeout))
+
+class Worker:
+    """A worker process, with the exercises it has warm"""
+
+    def __init__(self, context):
+        self.context = context
+        self.busy = False
+        self.start()
+
+    def start(self):
+        (self.connection, child) = self.context.Pipe()
+        self.process = self.context.Process(target = worker_main, args = (child,), daemon = True)
+        self.process.start()
+        child.close()
+        self.warm = set()
+
+    def call(self, request, timeout):
+        """Sends a batch to the worker and waits for the responses (on a separate thread).
+        Replaces the worker process if it doesn't respond in time or dies.
+        """
+        try:
+            self.connection.send(request)
+            if self.connection.poll(timeout):
+                return self.connection.recv()
+        except (EOFError, OSError):
+            pass
+        self.stop()
+        self.start()
+        raise TimeoutError()
+
+    def stop(self):
+        self.process.terminate()
+        self.process.join()
+        self.connection.close()
+
+# ------------------------------------------------------
+# The daemon
+
+class GradingDaemon:
+    def __init__(self, workers, max_pending, max_batch, timeout, max_request):
+        context = multiprocessing.get_context("spawn")
+        self.workers = [Worker(context) for i in range(workers)]
+        self.harnesses = { tutorial : load_harness(tutorial) for tutorial in TUTORIALS }
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.max_request = max_request
+        self.slots = asyncio.Semaphore(max_pending)
+        # The submissions waiting for a worker, by exercise, in the order in which the exercises were first submitted
+        self.pending = {}
+        self.changed = asyncio.Event()
+        self.stats = { "submissions" : 0, "batches" : 0, "largest_batch" : 0, "timeouts" : 0, "turned_away" : 0 }
+
+    def exercises(self):
+        return [(tutorial, exercise) for (tutorial, harness) in self.harnesses.items() for exercise in sorted(harness.tests)]
+
+    def warm_up(self):
+        """Queues the reference implementation of every exercise, so that the workers warm up their shared cases"""
+        for (tutorial, exercise) in self.exercises():
+            self.pending.setdefault((tutorial, exercise), []).append((None, None, None))
+        self.changed.set()
+
+    async def grade(self, tutorial, exercise, portable, deadline):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.setdefault((tutorial, exercise), []).append((portable, deadline, future))
+        self.stats["submissions"] += 1
+        self.changed.set()
+        return await future
+
+    def choose(self):
+        """Returns the exercise to grade next and the worker to grade it on, or None if there is nothing to do now"""
+        idle = [worker for worker in self.workers if not worker.busy]
+        if not idle or not self.pending:
+            return None
+        for key in self.pending:
+            for worker in idle:
+                if key in worker.warm:
+                    return (key, worker)
+        return (next(iter(self.pending)), idle[0])
+
+    async def dispatch(self):
+        while True:
+            choice = self.choose()
+            if choice is None:
+                self.changed.clear()
+                await self.changed.wait()
+                continue
+            (key, worker) = choice
+            # The submissions are spread over the workers rather than all graded by the first one to be idle
+            size = min(self.max_batch, -(-len(self.pending[key]) // len(self.workers)))
+            batch = self.pending[key][:size]
+            del self.pending[key][:size]
+            if not self.pending[key]:
+                del self.pending[key]
+            worker.busy = True
+            asyncio.get_running_loop().create_task(self.run_batch(worker, key, batch))
+
+    async def run_batch(self, worker, key, batch):
+        self.stats["batches"] += 1
+        self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+        submissions = [(portable, deadline) for (portable, deadline, future) in batch]
+        try:
+            # Each submission is timed out by the worker itself; this only catches a worker that stops answering
+            # (one more time limit covers grading the reference implementation of a cold exercise)
+            responses = await asyncio.to_thread(worker.call, (*key, submissions, self.timeout),
+                                                self.timeout * (len(batch) + 1) + WORKER_GRACE)
+            worker.warm.add(key)
+        except TimeoutError:
+            self.stats["timeouts"] += 1
+            responses = [{ "status" : "error", "message" : "Grading timed out or the worker failed" }] * len(batch)
+        finally:
+            worker.busy = False
+            self.changed.set()
+        for ((portable, deadline, future), response) in zip(batch, responses):
+            if future is not None and not future.done():
+                future.set_result(response)
+
+    async def handle(self, request):
+        if request.get("type") == "stats":
+            return dict(self.stats, status = "ok", pending = sum(len(batch) for batch in self.pending.values()),
+                        busy = sum(worker.busy for worker in self.workers))
+        if request.get("python") != sys.version:
+            return { "status" : "error", "message" : "The daemon runs a different version of Python" }
+        (tutorial, exercise) = (request.get("tutorial"), request.get("exercise"))
+        if tutorial not in self.harnesses or exercise not in self.harnesses[tutorial].tests:
+            return { "status" : "error", "message" : f"Unknown exercise {tutorial}/{exercise}" }
+        deadline = request.get("deadline")
+        if deadline is not None and not isinstance(deadline, (int, float)):
+            return { "status" : "error", "message" : "The deadline must be a time in seconds since the epoch" }
+        return await self.grade(tutorial, exercise, request["function"], deadline)
+
+    async def serve_connection(self, reader, writer):
+        try:
+            while True:
+                header = await reader.readexactly(FRAME_HEADER.size)
+                size = FRAME_HEADER.unpack(header)[0]
+                # The body of a request is only read once it has a slot, so the requests beyond --max-pending
+                # are turned away before they take any memory; the connection is closed, since its body is left unread
+                if self.slots.locked():
+                    self.stats["turned_away"] += 1
+                    writer.write(encode_frame({ "status" : "busy", "message" : "The grading daemon is busy" }))
+                    await writer.drain()
+                    return
+                if size > self.max_request:
+                    writer.write(encode_frame({ "status" : "error", "message" : "The request is too large" }))
+                    await writer.drain()
+                    return
+                async with self.slots:
+                    request = pickle.loads(await asyncio.wait_for(reader.readexactly(size), self.timeout))
+                    # The next request of the connection isn't read until this one is answered
+                    response = await self.handle(request)
+                writer.write(encode_frame(response))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, pickle.UnpicklingError):
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        for worker in self.workers:
+            worker.stop()
+
+async def serve(args):
+    daemon = GradingDaemon(args.workers, args.max_pending, args.max_batch, args.timeout, args.max_request_bytes)
+    if os.path.exists(args.socket):
+        os.remove(args.socket)
+    old_umask = os.umask(0o177)
+    try:
+        server = await asyncio.start_unix_server(daemon.serve_connection, path = args.socket)
+    finally:
+        os.umask(old_umask)
+    if args.warm:
+        daemon.warm_up()
+    dispatcher = asyncio.get_running_loop().create_task(daemon.dispatch())
+    print(f"Grading {len(daemon.exercises())} exercises on {args.workers} workers at {args.socket}", flush = True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        dispatcher.cancel()
+        daemon.close()
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+
+def main():
+    parser = argparse.ArgumentParser(description = "Grades the exercises of the Python tutorials for the kernels that connect to it.")
+    parser.add_argument("--socket", default = os.environ.get("KATAS_GRADING_SOCKET", "/tmp/katas-grading.sock"),
+                        help = "the path of the Unix socket to listen on")
+    parser.add_argument("--workers", type = int, default = min(4, os.cpu_count() or 1), help = "the number of worker processes")
+    parser.add_argument("--max-pending", type = int, default = 64, help = "the number of requests accepted at a time")
+    parser.add_argument("--max-request-bytes", type = int, default = 16 << 20, help = "the largest request accepted, in bytes")
+    parser.add_argument("--max-batch", type = int, default = 16, help = "the largest number of submissions graded in one batch")
+    parser.add_argument("--timeout", type = float, default = 30, help = "the time limit for grading one submission, in seconds")
+    parser.add_argument("--warm", action = "store_true", help = "warm up all the exercises when the daemon starts")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
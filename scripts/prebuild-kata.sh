@@ -10,4 +10,10 @@ then
 dotnet build $KATA_FOLDER
 fi
 
+# Set KATAS_PROFILE_NOTEBOOKS to a folder to record the time, memory and output size of each cell there
+if [ -n "$KATAS_PROFILE_NOTEBOOKS" ]
+then
+python3 $(dirname $0)/profile_notebooks.py run $KATA_FOLDER/$KATA_NOTEBOOK --allow-errors --timeout 120 --output-dir $KATAS_PROFILE_NOTEBOOKS
+else
 jupyter nbconvert $KATA_FOLDER/$KATA_NOTEBOOK --execute --to markdown  --allow-errors  --ExecutePreprocessor.timeout=120
+fi
@@ -0,0 +1,361 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Profiles the resource use of the operations of a kata, comparing the reference implementations
+(ReferenceImplementation.qs) with the learner's solutions (Tasks.qs).
+
+Each operation is run on a ladder of input sizes N through the qsharp Python package:
+a wrapper operation allocates the qubit arguments (N qubits for each Qubit[] parameter),
+calls the operation, and resets the qubits. For each run, the tool collects the metrics
+tracked by the CounterSimulator used in the kata tests, as far as the resource estimator provides them
+(the number of primitive operations, the number of multi-qubit (CNOT) operations and the peak number of qubits),
+together with the full resource estimates and the simulation time.
+
+The runs are distributed across worker processes, and the results are cached per operation and N,
+keyed by the hash of all the Q# files and the project file of the kata, so the operations are profiled again
+whenever the kata changes. The operations which can't be profiled (because their signatures can't be parsed
+or they have parameters which can't be generated) are listed as skipped, with the reason.
+
+Usage (requires the qsharp and numpy Python packages; matplotlib is needed for the plots):
+
+    python scripts/profile_kata_resources.py UnitaryPatterns --sizes 1-10 --workers 4 --output-dir profile
+    python scripts/profile_kata_resources.py DeutschJozsaAlgorithm --operations Oracle_Zero,Oracle_MajorityFunction
+"""
+
+import argparse
+import concurrent.futures
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPLEMENTATIONS = { 'reference' : "ReferenceImplementation.qs", 'task' : "Tasks.qs" }
+
+# The Q# expressions passed for the parameters of the profiled operations; operations with parameters
+# of other types (such as oracles) are skipped. Integer parameters named N get the size, the other ones get 0.
+ARGUMENTS = {
+    'Int' : "0",
+    'Double' : "0.0",
+    'Bool' : "false",
+    'Int[]' : "[0, size = N]",
+    'Bool[]' : "[false, size = N]",
+    'Double[]' : "[0.0, size = N]",
+}
+
+# ------------------------------------------------------
+def strip_comments(source):
+    return re.sub(r"//[^\n]*", "", source)
+
+class Unprofilable(Exception):
+    """Raised for an operation which can't be profiled, with the reason as the message"""
+
+def top_level(text):
+    """Returns the text with the contents of all parentheses and brackets blanked out (keeping the positions),
+    so that the separators and keywords of nested types, such as the "," and "is" of ((Qubit[], Int) => Unit is Adj),
+    only match at the top level
+    """
+    depth = 0
+    masked = []
+    for c in text:
+        if c in "([":
+            depth += 1
+        elif c in ")]":
+            depth -= 1
+        elif depth > 0:
+            c = " "
+        masked.append(c)
+    return "".join(masked)
+
+def closing_parenthesis(text, start):
+    """Returns the index of the parenthesis which closes the one at the start index, or None if it isn't closed"""
+    depth = 0
+    for index in range(start, len(text)):
+        if text[index] == "(":
+            depth += 1
+        elif text[index] == ")":
+            depth -= 1
+            if depth == 0:
+                return index
+    return None
+
+def parse_signature(source, start):
+    """Parses the signature of an operation from its opening parenthesis to its body.
+    Returns the list of (parameter, type) and the return type.
+    """
+    end = closing_parenthesis(source, start)
+    if end is None:
+        raise Unprofilable("the parameter list isn't closed")
+    parameters = source[start + 1 : end]
+    parsed = []
+    separators = [index for (index, c) in enumerate(top_level(parameters)) if c == ","]
+    for (low, high) in zip([-1] + separators, separators + [len(parameters)]):
+        parameter = parameters[low + 1 : high].strip()
+        if not parameter:
+            continue
+        (parameter_name, colon, parameter_type) = parameter.partition(":")
+        if not colon:
+            raise Unprofilable(f"can't parse the parameter \"{parameter}\"")
+        parsed.append((parameter_name.strip(), " ".join(parameter_type.split())))
+    body = source.find("{", end)
+    if body < 0:
+        raise Unprofilable("the operation has no body")
+    # The return type is followed by the characteristics of the operation (is Adj + Ctl), if any
+    returns = re.match(r"\s*:\s*(.*?)\s*(?:\bis\b.*)?$", top_level(source[end + 1 : body]), re.S)
+    if returns is None:
+        raise Unprofilable("can't parse the return type")
+    return (parsed, " ".join(source[end + 1 + returns.start(1) : end + 1 + returns.end(1)].split()))
+
+def parse_operations(path):
+    """Returns the namespace of the Q# file, the list of (name, [(parameter, type)], return type) of its operations
+    and the list of (name, reason) of the operations whose signatures couldn't be parsed
+    """
+    with open(path, encoding = "utf-8-sig") as f:
+        source = strip_comments(f.read())
+    namespace = re.search(r"namespace\s+([\w.]+)", source)
+    operations = []
+    unparsed = []
+    for match in re.finditer(r"\boperation\s+(\w+)\s*(?:<[^>]*>\s*)?\(", source):
+        name = match.group(1)
+        try:
+            (parameters, returns) = parse_signature(source, match.end() - 1)
+        except Unprofilable as e:
+            unparsed.append((name, str(e)))
+            continue
+        operations.append((name, parameters, returns))
+    return (namespace.group(1) if namespace else None, operations, unparsed)
+
+def wrapper_program(namespace, name, parameters, returns):
+    """Returns the Q# code of an operation ProfileWrapper(N : Int) that calls the operation
+    with freshly allocated qubits; raises Unprofilable if the operation has parameters of unsupported types
+    """
+    lines = []
+    arguments = []
+    qubits = []
+    for (index, (parameter, kind)) in enumerate(parameters):
+        if kind == "Qubit[]":
+            lines.append(f"use q{index} = Qubit[N];")
+            qubits.append(f"q{index}")
+            arguments.append(f"q{index}")
+        elif kind == "Qubit":
+            lines.append(f"use q{index} = Qubit();")
+            qubits.append(f"[q{index}]")
+            arguments.append(f"q{index}")
+        elif kind == "Int" and parameter in ("N", "n"):
+            arguments.append("N")
+        elif kind in ARGUMENTS:
+            arguments.append(ARGUMENTS[kind])
+        else:
+            raise Unprofilable(f"can't generate the parameter {parameter} : {kind}")
+    if not qubits:
+        raise Unprofilable("the operation has no qubit parameters")
+    call = f"{namespace}.{name}({', '.join(arguments)})"
+    lines.append(f"{call};" if returns == "Unit" else f"let _ = {call};")
+    lines.append(f"ResetAll({' + '.join(qubits)});")
+    body = "\n            ".join(lines)
+    return f"""
+        open Microsoft.Quantum.Intrinsic;
+
+        operation ProfileWrapper(N : Int) : Unit {{
+            {body}
+        }}
+    """
+
+def file_hash(*paths):
+    h = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+def kata_sources(folder):
+    """Returns the Q# files of the kata (outside the build output) and its project files"""
+    sources = [path for path in glob.glob(os.path.join(folder, "**", "*.qs"), recursive = True)
+               if not set(os.path.relpath(path, folder).split(os.sep)) & {"bin", "obj"}]
+    return sorted(sources) + sorted(glob.glob(os.path.join(folder, "*.csproj")))
+
+def enumerate_jobs(kata, sizes, selected):
+    """Returns the profiling jobs for the operations of the kata which have both a reference implementation
+    and a task, as well as the list of (task, reason) of the operations which can't be profiled
+    """
+    folder = os.path.join(ROOT, kata)
+    # An operation can call the operations of any Q# file of the kata, so the results depend on all of them
+    source_hash = file_hash(*kata_sources(folder))
+    implementations = {}
+    for (implementation, file_name) in IMPLEMENTATIONS.items():
+        (namespace, operations, unparsed) = parse_operations(os.path.join(folder, file_name))
+        for (name, parameters, returns) in operations + [(name, None, reason) for (name, reason) in unparsed]:
+            task = name[:-len("_Reference")] if implementation == 'reference' and name.endswith("_Reference") else name
+            try:
+                if parameters is None:
+                    raise Unprofilable(f"can't parse the signature in {file_name}: {returns}")
+                (program, reason) = (wrapper_program(namespace, name, parameters, returns), None)
+            except Unprofilable as e:
+                (program, reason) = (None, str(e))
+            implementations.setdefault(task, {})[implementation] = (name, program, reason)
+
+    jobs = []
+    skipped = []
+    for (task, found) in sorted(implementations.items()):
+        if len(found) != len(IMPLEMENTATIONS) or (selected and task not in selected):
+            continue
+        reasons = [reason for (_, program, reason) in found.values() if program is None]
+        if reasons:
+            skipped.append((task, reasons[0]))
+            continue
+        for (implementation, (name, program, _)) in found.items():
+            for n in sizes:
+                key = hashlib.sha256(f"{kata}:{name}:{n}:{source_hash}".encode()).hexdigest()
+                jobs.append({ 'kata' : kata, 'task' : task, 'implementation' : implementation, 'operation' : name,
+                              'N' : n, 'program' : program, 'key' : key })
+    return (jobs, skipped)
+
+# ------------------------------------------------------
+def start_worker(folder):
+    # The qsharp package compiles the Q# files of the current folder
+    os.chdir(folder)
+    import qsharp  # noqa: F401
+
+def run_job(job):
+    """Estimates the resources and measures the simulation time of one operation for one N. Runs in a worker process."""
+    import qsharp
+
+    result = { key : job[key] for key in ('kata', 'task', 'implementation', 'operation', 'N', 'key') }
+    try:
+        wrapper = qsharp.compile(job['program'])
+        estimates = wrapper.estimate_resources(N = job['N'])
+        start = time.perf_counter()
+        wrapper.simulate(N = job['N'])
+        result['seconds'] = time.perf_counter() - start
+        result['estimates'] = estimates
+        # The metrics tracked by CounterSimulator
+        result['operations'] = sum(estimates.get(kind, 0) for kind in ("CNOT", "QubitClifford", "R", "Measure", "T"))
+        result['multi_qubit_operations'] = estimates.get("CNOT", 0)
+        result['peak_qubits'] = estimates.get("QubitCount", estimates.get("Width"))
+        result['status'] = 'ok'
+    except Exception as e:
+        result['status'] = f"failed: {e}"
+    return result
+
+def profile(kata, jobs, workers, cache_path):
+    cache = {}
+    if os.path.exists(cache_path):
+        with open(cache_path) as f:
+            cache = json.load(f)
+    results = [cache[job['key']] for job in jobs if job['key'] in cache]
+    missing = [job for job in jobs if job['key'] not in cache]
+    print(f"{len(results)} results cached, profiling {len(missing)} runs")
+    if missing:
+        # The qsharp package talks to the IQ# kernel, whose connection can't be shared with forked processes
+        with concurrent.futures.ProcessPoolExecutor(max_workers = workers, mp_context = multiprocessing.get_context('spawn'),
+                                                    initializer = start_worker, initargs = (os.path.join(ROOT, kata),)) as pool:
+            for result in pool.map(run_job, missing):
+                results.append(result)
+                # Failed runs (for example, tasks which aren't solved yet) are profiled again next time
+                if result['status'] == 'ok':
+                    cache[result['key']] = result
+        os.makedirs(os.path.dirname(cache_path), exist_ok = True)
+        temp_path = cache_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump(cache, f)
+        os.replace(temp_path, cache_path)
+    return results
+
+# ------------------------------------------------------
+METRICS = ('operations', 'multi_qubit_operations', 'peak_qubits', 'seconds')
+
+def comparison_table(results):
+    """Formats the results as a table with a row per task and N, comparing the task with the reference implementation"""
+    rows = {}
+    for result in results:
+        rows.setdefault((result['task'], result['N']), {})[result['implementation']] = result
+    lines = [f"{'task':<32} {'N':>3}  " + "  ".join(f"{metric + ' (ref / task)':>36}" for metric in METRICS)]
+    for ((task, n), row) in sorted(rows.items()):
+        cells = []
+        for metric in METRICS:
+            values = []
+            for implementation in IMPLEMENTATIONS:
+                result = row.get(implementation)
+                if result is None or result['status'] != 'ok':
+                    values.append("failed")
+                elif metric == 'seconds':
+                    values.append(f"{result[metric]:.4f}")
+                else:
+                    values.append(str(result[metric]))
+            cells.append(f"{' / '.join(values):>36}")
+        lines.append(f"{task:<32} {n:>3}  " + "  ".join(cells))
+    return "\n".join(lines)
+
+def scaling_plots(results, output_dir):
+    """Plots each metric against N for every task, one figure per task"""
+    from matplotlib import pyplot
+
+    series = {}
+    for result in results:
+        if result['status'] == 'ok':
+            series.setdefault(result['task'], {}).setdefault(result['implementation'], []).append(result)
+    for (task, implementations) in sorted(series.items()):
+        (figure, axes) = pyplot.subplots(1, len(METRICS), figsize = (5 * len(METRICS), 4))
+        for (ax, metric) in zip(axes, METRICS):
+            for (implementation, points) in sorted(implementations.items()):
+                points.sort(key = lambda result: result['N'])
+                ax.plot([p['N'] for p in points], [p[metric] for p in points], marker = 'o', label = implementation)
+            ax.set_xlabel("N")
+            ax.set_title(metric)
+            if metric in ('operations', 'multi_qubit_operations', 'seconds'):
+                ax.set_yscale('symlog')
+            ax.legend()
+        figure.suptitle(task)
+        figure.tight_layout()
+        figure.savefig(os.path.join(output_dir, f"{task}.png"))
+        pyplot.close(figure)
+
+def parse_sizes(text):
+    sizes = []
+    for part in text.split(","):
+        (low, _, high) = part.partition("-")
+        sizes += range(int(low), int(high or low) + 1)
+    return sizes
+
+def main():
+    parser = argparse.ArgumentParser(description = "Profiles the resource use of the reference implementations and the tasks of a kata.")
+    parser.add_argument("kata", help = "the kata folder, relative to the repository root (for example, UnitaryPatterns)")
+    parser.add_argument("--sizes", default = "1-12", help = "the values of N to run the operations on, for example 1-12 or 2,4,8")
+    parser.add_argument("--operations", help = "a comma-separated list of the tasks to profile (all of them by default)")
+    parser.add_argument("--workers", type = int, default = None, help = "the number of worker processes")
+    parser.add_argument("--output-dir", default = None, help = "the folder to write the results and the plots to")
+    parser.add_argument("--cache", default = None, help = "the cache file (obj/resource-profile.json in the kata folder by default)")
+    parser.add_argument("--no-plots", action = "store_true", help = "don't plot the scaling of the metrics")
+    args = parser.parse_args()
+
+    selected = set(args.operations.split(",")) if args.operations else None
+    (jobs, skipped) = enumerate_jobs(args.kata, parse_sizes(args.sizes), selected)
+    for (task, reason) in skipped:
+        print(f"Skipping {task}: {reason}")
+    cache_path = args.cache or os.path.join(ROOT, args.kata, "obj", "resource-profile.json")
+    results = profile(args.kata, jobs, args.workers, cache_path)
+
+    table = comparison_table(results)
+    print(table)
+    failed = [r for r in results if r['status'] != 'ok']
+    for result in failed:
+        print(f"{result['operation']} (N = {result['N']}) {result['status']}")
+    if args.output_dir is not None:
+        os.makedirs(args.output_dir, exist_ok = True)
+        with open(os.path.join(args.output_dir, "results.json"), "w") as f:
+            json.dump(results, f, indent = 2)
+        with open(os.path.join(args.output_dir, "comparison.txt"), "w") as f:
+            f.write(table + "\n")
+            for (task, reason) in skipped:
+                f.write(f"Skipped {task}: {reason}\n")
+        if not args.no_plots:
+            scaling_plots(results, args.output_dir)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,343 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Profiles the execution of the Jupyter notebooks of the katas and tutorials cell by cell.
+
+The "run" command executes notebooks the way validate-notebooks.ps1 (--check-kata) or prebuild-kata.sh does,
+and records for every cell its start and end time, the peak resident memory of the kernel process while it ran
+(sampled every few milliseconds, through psutil if it is installed, or /proc on Linux) and the size of its outputs.
+The profile of each notebook is written to a separate JSON file in the output folder, so that several runners
+can write to the same folder.
+
+The "report" command aggregates the profiles of all notebooks into a ranked list of the cells, slowest first,
+written as JSON and as an HTML table, and compares it with the previous report: each cell is matched by its notebook,
+position and source, and the change of its time is shown.
+
+Usage:
+
+    python scripts/profile_notebooks.py run Superposition/Superposition.ipynb --check-kata --output-dir notebook-profile
+    python scripts/profile_notebooks.py report notebook-profile --output notebook-report
+    python scripts/profile_notebooks.py report notebook-profile --output notebook-report --baseline previous-report.json
+
+validate-notebooks.ps1 -ProfileFolder <folder> and prebuild-kata.sh (with the KATAS_PROFILE_NOTEBOOKS environment variable
+set to a folder) run the notebooks through this script instead of jupyter nbconvert.
+"""
+
+import argparse
+import hashlib
+import html
+import json
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The tags of the cells which validate-notebooks.ps1 doesn't run; see the contribution guide
+EXCLUDED_TAGS = ["multicell_solution", "randomized_solution", "timeout", "invalid_code", "azure_quantum", "work_in_progress"]
+
+# A cell is reported as slower or faster than in the previous report if its time changed by more than this fraction
+CHANGE_THRESHOLD = 0.25
+
+# ------------------------------------------------------
+# Memory of the kernel process
+
+def process_rss(pid):
+    """Returns the resident memory of the process in bytes, or None if it can't be measured"""
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except ImportError:
+        pass
+    except Exception:
+        return None
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+class PeakMemorySampler:
+    """Samples the resident memory of a process on a background thread, keeping the peak since the last reset"""
+
+    def __init__(self, pid, interval = 0.01):
+        self.pid = pid
+        self.interval = interval
+        self.peak = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target = self.run, daemon = True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        rss = process_rss(self.pid)
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+
+    def reset(self):
+        self.peak = None
+        self.sample()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+def kernel_pid(kernel_manager):
+    # jupyter_client 7 and later start the kernel through a provisioner; earlier versions keep the process
+    provisioner = getattr(kernel_manager, "provisioner", None)
+    process = getattr(provisioner, "process", None) or getattr(kernel_manager, "kernel", None)
+    return getattr(process, "pid", None)
+
+# ------------------------------------------------------
+# Running the notebooks
+
+def source_label(source):
+    """Returns the first non-empty line of the cell's source, to identify it in the report"""
+    for line in source.splitlines():
+        if line.strip():
+            return line.strip()[:120]
+    return ""
+
+def profiling_client(notebook, records, **kwargs):
+    from nbclient import NotebookClient
+
+    class ProfilingClient(NotebookClient):
+        """Executes the notebook like NotebookClient, recording the time, memory and output size of each cell"""
+
+        async def async_execute_cell(self, cell, cell_index, execution_count = None, store_history = True):
+            if cell.cell_type != "code" or not cell.source.strip():
+                return await super().async_execute_cell(cell, cell_index, execution_count, store_history)
+            if getattr(self, "sampler", None) is None:
+                pid = kernel_pid(self.km)
+                self.sampler = PeakMemorySampler(pid) if pid is not None else None
+            if self.sampler is not None:
+                self.sampler.reset()
+            record = { "index" : cell.metadata.get("original_index", cell_index), "label" : source_label(cell.source),
+                       "source_hash" : hashlib.sha256(cell.source.encode()).hexdigest()[:16],
+                       "start" : time.time() - self.started, "status" : "ok" }
+            records.append(record)
+            try:
+                return await super().async_execute_cell(cell, cell_index, execution_count, store_history)
+            except BaseException:
+                record["status"] = "error"
+                raise
+            finally:
+                record["end"] = time.time() - self.started
+                record["seconds"] = record["end"] - record["start"]
+                if self.sampler is not None:
+                    self.sampler.sample()
+                    record["peak_rss"] = self.sampler.peak
+                else:
+                    record["peak_rss"] = None
+                record["output_bytes"] = len(json.dumps(cell.get("outputs", [])))
+                if any(output.get("output_type") == "error" for output in cell.get("outputs", [])):
+                    record["status"] = "error"
+
+    client = ProfilingClient(notebook, **kwargs)
+    client.started = time.time()
+    client.sampler = None
+    return client
+
+def profile_path(output_dir, notebook_path):
+    name = os.path.relpath(os.path.abspath(notebook_path), ROOT).replace(os.sep, "/")
+    # Notebooks outside of the repository are named without the leading "../", so that their profiles aren't hidden files
+    return os.path.join(output_dir, name.replace("../", "").replace("/", "__") + ".json")
+
+def run_notebook(path, output_dir, check_kata = False, timeout = 300, allow_errors = False):
+    """Executes the notebook and writes its profile. Returns True if the notebook executed without errors."""
+    import nbformat
+
+    notebook = nbformat.read(path, as_version = 4)
+    # Like validate-notebooks.ps1, check the reference solutions instead of the stubs, except in the workbooks
+    convert = check_kata and "Workbook" not in os.path.basename(path)
+    cells = []
+    for (index, cell) in enumerate(notebook.cells):
+        if check_kata and set(cell.metadata.get("tags", [])).intersection(EXCLUDED_TAGS):
+            continue
+        if convert and cell.cell_type == "code":
+            cell.source = cell.source.replace("%kata", "%check_kata")
+        cell.metadata["original_index"] = index
+        cells.append(cell)
+    notebook.cells = cells
+
+    records = []
+    client = profiling_client(notebook, records, timeout = timeout, allow_errors = allow_errors,
+                              resources = { "metadata" : { "path" : os.path.dirname(os.path.abspath(path)) } })
+    started = time.time()
+    error = None
+    try:
+        client.execute()
+    except Exception as e:
+        error = f"{type(e).__name__}: {str(e)[-2000:]}"
+    finally:
+        if client.sampler is not None:
+            client.sampler.stop()
+
+    profile = { "notebook" : os.path.relpath(os.path.abspath(path), ROOT).replace(os.sep, "/"),
+                "mode" : "validate" if check_kata else "prebuild", "started" : started,
+                "seconds" : time.time() - started, "error" : error, "cells" : records }
+    os.makedirs(output_dir, exist_ok = True)
+    with open(profile_path(output_dir, path), "w") as f:
+        json.dump(profile, f, indent = 1)
+    return error is None
+
+# ------------------------------------------------------
+# Reports
+
+def load_profiles(profile_dir):
+    profiles = []
+    for name in sorted(os.listdir(profile_dir)):
+        if name.endswith(".json"):
+            with open(os.path.join(profile_dir, name)) as f:
+                profile = json.load(f)
+            # The folder can also hold the reports, which are not profiles of a notebook
+            if "notebook" in profile:
+                profiles.append(profile)
+    return profiles
+
+def cell_key(notebook, cell):
+    return f"{notebook}#{cell['index']}:{cell['source_hash']}"
+
+def build_report(profiles, baseline = None):
+    """Ranks the cells of all profiles by their time, and compares them with the cells of the baseline report"""
+    previous = { cell["key"] : cell for cell in baseline["cells"] } if baseline else {}
+    cells = []
+    for profile in profiles:
+        for cell in profile["cells"]:
+            entry = dict(cell, notebook = profile["notebook"], key = cell_key(profile["notebook"], cell))
+            if entry["key"] in previous:
+                entry["previous_seconds"] = previous[entry["key"]]["seconds"]
+                entry["change"] = (entry["seconds"] - entry["previous_seconds"]) / max(entry["previous_seconds"], 1e-3)
+            cells.append(entry)
+    cells.sort(key = lambda cell: -cell["seconds"])
+    total = sum(cell["seconds"] for cell in cells)
+    cumulative = 0.0
+    for (rank, cell) in enumerate(cells, 1):
+        cumulative += cell["seconds"]
+        cell["rank"] = rank
+        cell["share"] = cell["seconds"] / total if total > 0 else 0.0
+        cell["cumulative_share"] = cumulative / total if total > 0 else 0.0
+
+    notebooks = sorted(({ "notebook" : p["notebook"], "mode" : p["mode"], "seconds" : p["seconds"], "error" : p["error"],
+                          "cells" : len(p["cells"]),
+                          "peak_rss" : max([c["peak_rss"] for c in p["cells"] if c.get("peak_rss") is not None], default = None) }
+                        for p in profiles), key = lambda n: -n["seconds"])
+    report = { "generated" : time.strftime("%Y-%m-%dT%H:%M:%S"), "total_seconds" : total,
+               "notebooks" : notebooks, "cells" : cells }
+    if baseline:
+        current = set(cell["key"] for cell in cells)
+        report["previous_total_seconds"] = baseline["total_seconds"]
+        report["slower"] = [cell["key"] for cell in cells if cell.get("change", 0) > CHANGE_THRESHOLD and cell["seconds"] >= 1]
+        report["faster"] = [cell["key"] for cell in cells if cell.get("change", 0) < -CHANGE_THRESHOLD and cell["previous_seconds"] >= 1]
+        report["removed"] = [key for key in previous if key not in current]
+    return report
+
+def format_bytes(value):
+    if value is None:
+        return ""
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1024 or unit == "GB":
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+
+def format_change(cell):
+    if "change" not in cell:
+        return "new"
+    return f"{cell['previous_seconds']:.2f} s ({cell['change']:+.0%})"
+
+def html_report(report):
+    rows = []
+    for cell in report["cells"]:
+        style = ""
+        if cell.get("change", 0) > CHANGE_THRESHOLD and cell["seconds"] >= 1:
+            style = ' class="slower"'
+        elif cell["status"] != "ok":
+            style = ' class="error"'
+        rows.append(f"<tr{style}><td>{cell['rank']}</td><td>{html.escape(cell['notebook'])}</td><td>{cell['index']}</td>"
+                    f"<td><code>{html.escape(cell['label'])}</code></td><td>{cell['seconds']:.2f} s</td>"
+                    f"<td>{cell['share']:.1%}</td><td>{cell['cumulative_share']:.1%}</td><td>{format_change(cell)}</td>"
+                    f"<td>{format_bytes(cell.get('peak_rss'))}</td><td>{format_bytes(cell['output_bytes'])}</td>"
+                    f"<td>{cell['status']}</td></tr>")
+    notebook_rows = [f"<tr><td>{html.escape(n['notebook'])}</td><td>{n['mode']}</td><td>{n['seconds']:.1f} s</td>"
+                     f"<td>{n['cells']}</td><td>{format_bytes(n['peak_rss'])}</td><td>{html.escape(n['error'] or '')}</td></tr>"
+                     for n in report["notebooks"]]
+    summary = f"Total cell time: {report['total_seconds']:.1f} s"
+    if "previous_total_seconds" in report:
+        summary += (f" (previous run: {report['previous_total_seconds']:.1f} s; {len(report['slower'])} cells slower, "
+                    f"{len(report['faster'])} faster, {len(report['removed'])} removed)")
+    return f"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Notebook cell profile</title>
+<style>
+  body {{ font-family: sans-serif; }}
+  table {{ border-collapse: collapse; }}
+  th, td {{ border: 1px solid #ccc; padding: 2px 6px; text-align: left; }}
+  tr.slower {{ background: #fdd; }}
+  tr.error {{ background: #ffd; }}
+</style>
+</head>
+<body>
+<h1>Notebook cell profile</h1>
+<p>Generated {report['generated']}. {html.escape(summary)}</p>
+<h2>Cells, slowest first</h2>
+<table>
+<tr><th>Rank</th><th>Notebook</th><th>Cell</th><th>First line</th><th>Time</th><th>Share</th><th>Cumulative</th><th>Previous</th><th>Peak kernel memory</th><th>Output size</th><th>Status</th></tr>
+{chr(10).join(rows)}
+</table>
+<h2>Notebooks</h2>
+<table>
+<tr><th>Notebook</th><th>Mode</th><th>Time</th><th>Cells</th><th>Peak kernel memory</th><th>Error</th></tr>
+{chr(10).join(notebook_rows)}
+</table>
+</body>
+</html>
+"""
+
+def main():
+    parser = argparse.ArgumentParser(description = "Profiles the execution of Jupyter notebooks cell by cell.")
+    commands = parser.add_subparsers(dest = "command", required = True)
+    run = commands.add_parser("run", help = "execute notebooks and record the profile of each cell")
+    run.add_argument("notebooks", nargs = "+", help = "the notebooks to execute")
+    run.add_argument("--output-dir", default = "notebook-profile", help = "the folder to write the profiles to")
+    run.add_argument("--check-kata", action = "store_true",
+                     help = "check the reference solutions, like validate-notebooks.ps1 (%%kata becomes %%check_kata)")
+    run.add_argument("--allow-errors", action = "store_true", help = "keep executing the notebook after a cell fails, like prebuild-kata.sh")
+    run.add_argument("--timeout", type = int, default = 300, help = "the time limit for each cell, in seconds")
+    report = commands.add_parser("report", help = "aggregate the profiles into a ranked report")
+    report.add_argument("profile_dir", help = "the folder with the profiles")
+    report.add_argument("--output", default = "notebook-report", help = "the path of the report, without the .json and .html extensions")
+    report.add_argument("--baseline", help = "the JSON report of the previous run (by default, the existing report at --output)")
+    report.add_argument("--top", type = int, default = 20, help = "the number of slowest cells to print")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        ok = True
+        for notebook in args.notebooks:
+            print(f"Profiling {notebook}...", flush = True)
+            ok = run_notebook(notebook, args.output_dir, args.check_kata, args.timeout, args.allow_errors) and ok
+        return 0 if ok else 1
+
+    baseline_path = args.baseline or args.output + ".json"
+    baseline = None
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+    result = build_report(load_profiles(args.profile_dir), baseline)
+    with open(args.output + ".json", "w") as f:
+        json.dump(result, f, indent = 1)
+    with open(args.output + ".html", "w", encoding = "utf-8") as f:
+        f.write(html_report(result))
+    for cell in result["cells"][:args.top]:
+        print(f"{cell['rank']:>4} {cell['seconds']:>8.2f} s {cell['share']:>6.1%}  {format_change(cell):<18} "
+              f"{cell['notebook']} #{cell['index']}: {cell['label'][:60]}")
+    print(f"Total cell time: {result['total_seconds']:.1f} s in {len(result['notebooks'])} notebooks")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -23,6 +23,11 @@
     .PARAMETER EndIndex
         The index of the last notebook to be checked (in the list of all possible notebooks)
         If not set, will default to the index of the last notebook in the list to validate all notebooks to the end of the list
+    .PARAMETER ProfileFolder
+        Path to the folder to write the execution profile of each notebook to.
+        If set, the notebooks are executed by profile_notebooks.py, which records the time, the peak kernel memory
+        and the output size of each cell, and the ranked report of the slowest cells is written to
+        notebook-report.json and notebook-report.html in that folder (compared with the previous report, if it exists).
 #>
 
 [CmdletBinding()]
@@ -30,7 +35,8 @@ Param(
     [Parameter(Position=1)]
     $Notebook = "",
     [int]$StartIndex = -1.0,
-    [int]$EndIndex = -1.0
+    [int]$EndIndex = -1.0,
+    [string]$ProfileFolder = ""
 )
 
 
@@ -44,6 +50,11 @@ if ($IsAzurePipelines) {
 
 $all_ok = $True
 
+if ($ProfileFolder -ne "") {
+    New-Item -ItemType Directory -Force -Path $ProfileFolder | Out-Null
+    $ProfileFolder = Resolve-Path $ProfileFolder
+}
+
 function Validate {
     Param($Notebook)
 
@@ -98,7 +109,11 @@ function Validate {
         # dotnet-iqsharp writes some output to stderr, which causes PowerShell to throw
         # unless $ErrorActionPreference is set to 'Continue'.
         $ErrorActionPreference = 'Continue'
-        if ($env:SYSTEM_DEBUG -eq "true") {
+        if ($ProfileFolder -ne "") {
+            # The profiler applies the same %check_kata conversion and tag exclusions to the original notebook,
+            # so that the profile is recorded under the kata's own name rather than under Check.ipynb.
+            python "$PSScriptRoot/profile_notebooks.py" run $Notebook.FullName --check-kata --timeout 300 --output-dir $ProfileFolder 2>&1 | %{ "$_"}
+        } elseif ($env:SYSTEM_DEBUG -eq "true") {
             # Redirect stderr output to stdout to prevent an exception being incorrectly thrown.
             jupyter nbconvert $CheckNotebook --TagRemovePreprocessor.remove_cell_tags=$exclude_from_validation  --execute --to html --ExecutePreprocessor.timeout=300 --log-level=DEBUG 2>&1 | %{ "$_"}
         } else {
@@ -161,6 +176,10 @@ if ($Notebook -ne "") {
     }
 }
 
+if ($ProfileFolder -ne "") {
+    python "$PSScriptRoot/profile_notebooks.py" report $ProfileFolder --output (Join-Path $ProfileFolder 'notebook-report')
+}
+
 if (-not $all_ok) {
     Write-Host "##vso[task.logissue type=error;]Validation errors for Jupyter notebooks."
     throw "At least one test failed execution. Check the logs."
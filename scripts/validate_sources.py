@@ -0,0 +1,239 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+"""Validates the Q# sources and the Jupyter notebooks of the katas and tutorials.
+
+The checks are:
+  * Q# files and notebooks must use U+27E8 and U+27E9 for the bra and ket symbols
+    (not the similar-looking U+3008 and U+3009), as validate-unicode.ps1 checks for Q# files;
+  * notebooks must be well-formed: a "cells" array of cell objects with a list or string source;
+  * each %kata cell must name a test operation defined in the Q# files of the notebook's folder,
+    and define (at least) the task it tests: an operation or function of the kata's Tasks.qs, if the kata has one.
+
+The files are checked in parallel by a thread pool. Each file is memory-mapped and scanned once by a single
+compiled regular expression that matches all the patterns, and the notebooks are parsed one cell at a time.
+The results are cached per file, keyed by the hash of its contents, so repeated runs only check the changed files
+(files whose size and modification time didn't change aren't even read).
+
+Usage:
+
+    python scripts/validate_sources.py           # exits with code 1 if any issues are found
+    python scripts/validate_sources.py --fix     # replaces the wrong bra and ket characters, like fix-unicode.ps1
+"""
+
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import mmap
+import os
+import re
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CACHE = os.path.join(ROOT, ".validate-sources-cache.json")
+# Bump when the checks change, so that the cached results of the previous version are discarded
+CACHE_VERSION = 1
+
+SKIPPED_FOLDERS = { ".git", "bin", "obj", "node_modules", ".ipynb_checkpoints", "__pycache__" }
+
+# The wrong characters and their replacements; notebooks can also contain them as JSON escapes
+REPLACEMENTS = {
+    "\u3008" : "\u27e8",
+    "\u3009" : "\u27e9",
+}
+
+# All the patterns the files are scanned for, combined into one expression with a named group per pattern
+PATTERNS = re.compile(
+    rb"(?P<bad_char>" + b"|".join(re.escape(c.encode("utf-8")) for c in REPLACEMENTS) + rb")"
+    + rb"|(?P<bad_escape>\\u300[89])"
+    + rb"|(?P<callable>\b(?:operation|function)\s+(?P<name>\w+)\s*[(<])"
+)
+
+# ------------------------------------------------------
+def find_files(root):
+    for (folder, subfolders, files) in os.walk(root):
+        subfolders[:] = sorted(s for s in subfolders if s not in SKIPPED_FOLDERS)
+        for file_name in sorted(files):
+            if file_name.endswith((".qs", ".ipynb")):
+                yield os.path.join(folder, file_name)
+
+def line_number(data, offset):
+    return data[:offset].count(b"\n") + 1
+
+def scan(data):
+    """Scans the file contents once for all patterns.
+    Returns the list of (line, message) issues and the names of the operations and functions defined in the file.
+    """
+    issues = []
+    operations = set()
+    for match in PATTERNS.finditer(data):
+        kind = match.lastgroup if match.lastgroup != "name" else "callable"
+        if kind in ("bad_char", "bad_escape"):
+            character = match.group().decode("utf-8") if kind == "bad_char" else chr(int(match.group()[2:], 16))
+            issues.append((line_number(data, match.start()),
+                           "U+{0:04X} used instead of U+{1:04X}; please use U+27E8 for the bra symbol and U+27E9 for the ket symbol"
+                           .format(ord(character), ord(REPLACEMENTS[character]))))
+        else:
+            operations.add(match.group("name").decode("utf-8"))
+    return (issues, operations)
+
+def iter_cells(text):
+    """Yields the cells of a notebook one at a time, without parsing the whole document at once"""
+    decoder = json.JSONDecoder()
+    match = re.search(r'"cells"\s*:\s*\[', text)
+    if match is None:
+        raise ValueError('the notebook has no "cells" array')
+    position = match.end()
+    while True:
+        while text[position] in " \t\r\n,":
+            position += 1
+        if text[position] == "]":
+            return
+        (cell, position) = decoder.raw_decode(text, position)
+        yield cell
+
+def kata_cells(text):
+    """Returns the list of (cell index, test name, names of the callables defined in the cell) of the %kata cells"""
+    found = []
+    for (index, cell) in enumerate(iter_cells(text)):
+        if not isinstance(cell, dict) or "cell_type" not in cell:
+            raise ValueError(f"cell {index} is not a cell object")
+        source = cell.get("source", "")
+        if not isinstance(source, (list, str)):
+            raise ValueError(f"the source of cell {index} is not a string or a list of strings")
+        source = "".join(source) if isinstance(source, list) else source
+        if cell["cell_type"] == "code" and source.lstrip().startswith("%kata"):
+            lines = source.lstrip().splitlines()
+            arguments = lines[0].split()
+            test = arguments[1] if len(arguments) > 1 else None
+            code = re.sub(r"//[^\n]*", "", "\n".join(lines[1:]))
+            operations = re.findall(r"\b(?:operation|function)\s+(\w+)\s*[(<]", code)
+            found.append((index, test, operations))
+    return found
+
+def check_file(path, cached):
+    """Checks one file, reusing the cached result if the file didn't change. Runs on a worker thread."""
+    stat = os.stat(path)
+    if cached is not None and cached["size"] == stat.st_size and cached["mtime"] == stat.st_mtime_ns:
+        return cached
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) if stat.st_size > 0 else b""
+        try:
+            digest = hashlib.sha256(data).hexdigest()
+            if cached is not None and cached["hash"] == digest:
+                return dict(cached, size = stat.st_size, mtime = stat.st_mtime_ns)
+            (issues, operations) = scan(data)
+            result = { "size" : stat.st_size, "mtime" : stat.st_mtime_ns, "hash" : digest,
+                       "operations" : sorted(operations), "katas" : [] }
+            if path.endswith(".ipynb"):
+                try:
+                    result["katas"] = kata_cells(bytes(data).decode("utf-8-sig"))
+                except (ValueError, IndexError, UnicodeDecodeError) as e:
+                    issues.append((1, f"malformed notebook: {e}"))
+                # Only Q# files define the operations which the %kata cells refer to
+                result["operations"] = []
+            result["issues"] = issues
+            return result
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
+
+# ------------------------------------------------------
+def cross_check(results):
+    """Checks the %kata cells of the notebooks against the operations defined in the Q# files of their folders.
+    Returns the list of (path, line, message) issues.
+    """
+    folders = {}
+    for (path, result) in results.items():
+        if path.endswith(".qs"):
+            folder = folders.setdefault(os.path.dirname(path), { "all" : set(), "tasks" : None })
+            folder["all"].update(result["operations"])
+            if os.path.basename(path) == "Tasks.qs":
+                folder["tasks"] = set(result["operations"])
+    issues = []
+    for (path, result) in sorted(results.items()):
+        if not result["katas"]:
+            continue
+        folder = folders.get(os.path.dirname(path), { "all" : set(), "tasks" : None })
+        for (index, test, operations) in result["katas"]:
+            if test is None:
+                issues.append((path, 1, f"cell {index}: %kata must be followed by the name of the test operation"))
+            elif test not in folder["all"]:
+                issues.append((path, 1, f"cell {index}: test operation {test} is not defined in the Q# files of the kata"))
+            # The cell can define helpers as well as the task
+            if folder["tasks"] is not None and not folder["tasks"].intersection(operations):
+                issues.append((path, 1, f"cell {index} (%kata {test}): the cell doesn't define any of the tasks in Tasks.qs"))
+    return issues
+
+def fix_file(path):
+    """Replaces the wrong bra and ket characters in the file (and their JSON escapes, in notebooks)"""
+    with open(path, encoding = "utf-8-sig") as f:
+        text = f.read()
+    fixed = text
+    for (wrong, right) in REPLACEMENTS.items():
+        fixed = fixed.replace(wrong, right)
+        fixed = re.sub(r"\\u(?i:{0})".format("{0:04x}".format(ord(wrong))), r"\\u{0:04x}".format(ord(right)), fixed)
+    if fixed != text:
+        # Write the file without BOM, same as fix-unicode.ps1
+        with open(path, "w", encoding = "utf-8", newline = "") as f:
+            f.write(fixed)
+        return True
+    return False
+
+def load_cache(path):
+    if path is None or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        cache = json.load(f)
+    return cache.get("files", {}) if cache.get("version") == CACHE_VERSION else {}
+
+def save_cache(path, results):
+    if path is None:
+        return
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump({ "version" : CACHE_VERSION, "files" : results }, f)
+    os.replace(temp_path, path)
+
+def main():
+    parser = argparse.ArgumentParser(description = "Validates the Unicode characters in Q# files and notebooks and the %kata cells of the notebooks.")
+    parser.add_argument("--root", default = ROOT, help = "the folder to validate (the repository root by default)")
+    parser.add_argument("--fix", action = "store_true", help = "replace the wrong bra and ket characters")
+    parser.add_argument("--workers", type = int, default = None, help = "the number of worker threads")
+    parser.add_argument("--cache", default = DEFAULT_CACHE, help = "the cache file")
+    parser.add_argument("--no-cache", action = "store_true", help = "check all files, ignoring and not updating the cache")
+    args = parser.parse_args()
+
+    cache_path = None if args.no_cache else args.cache
+    cache = load_cache(cache_path)
+    paths = [os.path.relpath(path, args.root).replace(os.sep, "/") for path in find_files(args.root)]
+    results = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers = args.workers) as pool:
+        futures = { pool.submit(check_file, os.path.join(args.root, path), cache.get(path)) : path for path in paths }
+        for future in concurrent.futures.as_completed(futures):
+            results[futures[future]] = future.result()
+
+    issues = [(path, line, message) for (path, result) in sorted(results.items()) for (line, message) in result["issues"]]
+    if args.fix:
+        fixed = sorted(set(path for (path, line, message) in issues if message.startswith("U+")))
+        for path in fixed:
+            if fix_file(os.path.join(args.root, path)):
+                print(f"Fixed {path}")
+                results[path] = check_file(os.path.join(args.root, path), None)
+        issues = [issue for issue in issues if issue[0] not in fixed]
+    save_cache(cache_path, results)
+    issues += cross_check(results)
+
+    # Azure Pipelines picks up the issues logged in its format
+    is_azure_pipelines = os.environ.get("AGENT_ID", "") != ""
+    for (path, line, message) in issues:
+        if is_azure_pipelines:
+            print(f"##vso[task.logissue type=error;sourcepath={path};linenumber={line}]{message}")
+        else:
+            print(f"{path}:{line}: {message}")
+    print(f"Validated {len(results)} files: {len(issues)} issues found")
+    return 1 if issues else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
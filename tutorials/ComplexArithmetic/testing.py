@@ -2,20 +2,78 @@
 # Licensed under the MIT License.
 
 import math as m
+import os
 import random as r
+import sys
 from pytest import approx
 
-tests = {}
+# The grading machinery shared by the tutorials
+harness_path = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'utilities', 'TutorialHarness'))
+if harness_path not in sys.path:
+    sys.path.append(harness_path)
+from tutorial_harness import Harness, harness_print, thread_output
+
+harness = Harness(__file__, globals())
+tests = harness.tests
+TUTORIAL = harness.tutorial
+
+# ------------------------------------------------------
+# Instrumentation of the tests: when enabled with instrument(), grading an exercise records the wall time,
+# CPU time and peak memory of every call to the learner's function and to the reference implementation
+# (the function named after the exercise with the _ref suffix), as well as the duration of the whole test.
+# The records can be exported with export_jsonl() and export_prometheus(); see utilities/TutorialHarness.
+# Setting the KATAS_INSTRUMENT_TESTS environment variable to 1 enables the instrumentation without changing the notebook.
+instrumentation = harness.instrumentation
+instrument = harness.instrument
+run_test = harness.run_test
+export_jsonl = harness.export_jsonl
+export_prometheus = harness.export_prometheus
+
+# ------------------------------------------------------
+# Result cache: when enabled with cache_results(), the output of each test is stored under a fingerprint
+# of the submitted function, the test and the seed set with set_seed(), and re-submitting an unchanged function
+# replays the stored output instead of running the test again; see utilities/TutorialHarness.
+result_cache = harness.result_cache
+cache_results = harness.cache_results
+set_seed = harness.set_seed
+result_cache_key = harness.result_cache_key
+run_cached_test = harness.run_cached_test
+
+# ------------------------------------------------------
+# Asynchronous grading: when enabled with grade_asynchronously(), the exercise decorator returns immediately
+# and the test runs on a background thread, so that the notebook stays responsive while large tests run.
+# The progress and then the test output are shown in the output of the cell that defined the exercise.
+# Grading is cancelled by interrupting the kernel or calling cancel_grading().
+grading = harness.grading
+grade_asynchronously = harness.grade_asynchronously
+cancel_grading = harness.cancel_grading
+wait_for_grading = harness.wait_for_grading
+grade_in_background = harness.grade_in_background
+
+# ------------------------------------------------------
+# Remote grading: when the KATAS_GRADING_SOCKET environment variable (or grade_remotely()) gives the path
+# of the Unix socket of a grading daemon (scripts/grading_daemon.py), the exercises are sent to the daemon to be graded;
+# see utilities/TutorialHarness.
+remote_grading = harness.remote_grading
+grade_remotely = harness.grade_remotely
+grade_on_daemon = harness.grade_on_daemon
+rebuild_function = harness.rebuild_function
+
+
+# ------------------------------------------------------
+# Trial scheduling: each test runs its edge cases first, then its random cases, and stops at the first failure.
+# adaptive_trials() makes the tests keep sampling random cases after they pass; see utilities/TutorialHarness.
+# The inputs of these exercises are single numbers, which have no size to grow, so the extra trials draw them
+# from the same distribution whatever their escalation level.
+trial_schedule = harness.trial_schedule
+adaptive_trials = harness.adaptive_trials
+trials = harness.trials
 
 # Exercise decorator, specifying that this function needs to be tested
-def exercise(fun):
-    tests[fun.__name__](fun)
-    return fun
+exercise = harness.exercise
 
 # Test decorator, specifying that this is a test for an exercise
-def test(fun):
-    tests[fun.__name__[:-5]] = fun
-    return fun
+test = harness.test
 
 # ------------------------------------------------------
 # Generates a random complex number in Cartesian form
@@ -30,6 +88,13 @@ def prep_random_polar():
     theta = (r.random() - 0.5) * m.pi
     return (rad, theta)
 
+# Edge cases of the exercises on numbers in Cartesian form, which the tests run before the random cases:
+# zero, the units on both axes and a number on the negative real axis (where the phase is pi)
+edge_cartesians = [(0, 0), (1, 0), (0, -1), (-2.5, 0)]
+
+# Edge cases of the exercises on numbers in polar form: a zero radius, a zero phase and the phases pi and -pi/2
+edge_polars = [(0, 1), (2, 0), (1, m.pi), (1, -m.pi / 2)]
+
 # ------------------------------------------------------
 # Assert that checks if the result is a tuple of length 2
 def assert_tuple(result):
@@ -72,13 +137,13 @@ def imaginary_power_test(fun):
         expected = imaginary_power_ref(n)
         actual = fun(n)
         if actual == None:
-            print("Your function must return a value!")
+            harness_print("Your function must return a value!")
             return
         if expected != actual:
             message = "Result of exponentiation doesn't seem to match expected value: expected (i)^{0} = {1}, got {2}"
-            print(message.format(n, expected, actual))
+            harness_print(message.format(n, expected, actual))
             return
-    print("Success!")
+    harness_print("Success!")
 
 # ------------------------------------------------------
 def complex_add_ref(x, y):
@@ -86,14 +151,14 @@ def complex_add_ref(x, y):
 
 @test
 def complex_add_test(fun):
-    for i in range(25):
-        x = prep_random_cartesian()
+    for i in trials(len(edge_cartesians) + 25):
+        x = edge_cartesians[i] if i < len(edge_cartesians) else prep_random_cartesian()
         y = prep_random_cartesian()
         expected = complex_add_ref(x, y)
         actual = fun(x, y)
         msg = assert_tuple(actual)
         if msg != None:
-            print(msg)
+            harness_print(msg)
             return
         msg = assert_cartesian(expected, actual,
                                "Sum doesn't seem to match expected value: expected ("
@@ -105,9 +170,9 @@ def complex_add_test(fun):
                                + ", got "
                                + format_cartesian(actual))
         if msg != None:
-            print(msg)
+            harness_print(msg)
             return
-    print("Success!")
+    harness_print("Success!")
 
 # ------------------------------------------------------
 def complex_mult_ref(x, y):
@@ -115,14 +180,14 @@ def complex_mult_ref(x, y):
 
 @test
 def complex_mult_test(fun):
-    for i in range(25):
-        x = prep_random_cartesian()
+    for i in trials(len(edge_cartesians) + 25):
+        x = edge_cartesians[i] if i < len(edge_cartesians) else prep_random_cartesian()
         y = prep_random_cartesian()
         expected = complex_mult_ref(x, y)
         actual = fun(x, y)
         msg = assert_tuple(actual)
         if msg != None:
-            print(msg)
+            harness_print(msg)
             return
         msg = assert_cartesian(expected, actual,
                                "Product doesn't seem to match expected value: expected ("
@@ -134,9 +199,9 @@ def complex_mult_test(fun):
                                + ", got "
                                + format_cartesian(actual))
         if msg != None:
-            print(msg)
+            harness_print(msg)
             return
-    print("Success!")
+    harness_print("Success!")
 
 # ------------------------------------------------------
 def conjugate_ref(x):
@@ -144,13 +209,13 @@ def conjugate_ref(x):
 
 @test
 def conjugate_test(fun):
-    for i in range(25):
-        x = prep_random_cartesian()
+    for i in trials(len(edge_cartesians) + 25):
+        x = edge_cartesians[i] if i < len(edge_cartesians) else prep_random_cartesian()
         expected = conjugate_ref(x)
         actual = fun(x)
         msg = assert_tuple(actual)
         if msg != None:
-            print(msg)
+            harness_print(msg)
             return
         msg = assert_cartesian(expected, actual,
                                "Conjugate doesn't seem to match expected value: expected conjugate of "
@@ -160,9 +225,9 @@ def conjugate_test(fun):
                                + ", got "
                                + format_cartesian(actual))
         if msg != None:
-            print(msg)
+            harness_print(msg)
             return
-    print("Success!")
+    harness_print("Success!")
 
 # ------------------------------------------------------
 def complex_div_ref(x, y):
@@ -173,8 +238,8 @@ def complex_div_ref(x, y):
 
 @test
 def complex_div_test(fun):
-    for i in range(25):
-        x = prep_random_cartesian()
+    for i in trials(len(edge_cartesians) + 25):
+        x = edge_cartesians[i] if i < len(edge_cartesians) else prep_random_cartesian()
         y = (0, 0)
         while y == (0, 0):
             y = prep_random_cartesian()
@@ -182,7 +247,7 @@ def complex_div_test(fun):
         actual = fun(x, y)
         msg = assert_tuple(actual)
         if msg != None:
-            print(msg)
+            harness_print(msg)
             return
         msg = assert_cartesian(expected, actual,
                                "Quotient doesn't seem to match expected value: expected ("
@@ -194,9 +259,9 @@ def complex_div_test(fun):
                                + ", got "
                                + format_cartesian(actual))
         if msg != None:
-            print(msg)
+            harness_print(msg)
             return
-    print("Success!")
+    harness_print("Success!")
 
 # ------------------------------------------------------
 def modulus_ref(x):
@@ -204,22 +269,22 @@ def modulus_ref(x):
 
 @test
 def modulus_test(fun):
-    for i in range(25):
-        x = prep_random_cartesian()
+    for i in trials(len(edge_cartesians) + 25):
+        x = edge_cartesians[i] if i < len(edge_cartesians) else prep_random_cartesian()
         expected = modulus_ref(x)
         actual = fun(x)
         if actual == None:
-            print("Your function must return a value!")
+            harness_print("Your function must return a value!")
             return
         if not (type(actual) is float or type(actual) is int):
-            print("Your function must return a number, returned " + type(actual).__name__ + ".")
+            harness_print("Your function must return a number, returned " + type(actual).__name__ + ".")
             return
         if actual != approx(expected):
-            print("Modulus doesn't seem to match expected value: expected |"
+            harness_print("Modulus doesn't seem to match expected value: expected |"
                   + format_cartesian(x)
                   + "| = {0:.3f}, got {1:.3f}".format(expected, actual))
             return
-    print("Success!")
+    harness_print("Success!")
 
 # ------------------------------------------------------
 def complex_exp_ref(x):
@@ -228,13 +293,13 @@ def complex_exp_ref(x):
 
 @test
 def complex_exp_test(fun):
-    for i in range(25):
-        x = prep_random_cartesian()
+    for i in trials(len(edge_cartesians) + 25):
+        x = edge_cartesians[i] if i < len(edge_cartesians) else prep_random_cartesian()
         expected = complex_exp_ref(x)
         actual = fun(x)
         msg = assert_tuple(actual)
         if msg != None:
-            print(msg)
+            harness_print(msg)
             return
         msg = assert_cartesian(expected, actual,
                                "Result of exponentiation doesn't seem to match expected value: expected e^("
@@ -244,9 +309,9 @@ def complex_exp_test(fun):
                                + ", got "
                                + format_cartesian(actual))
         if msg != None:
-            print(msg)
+            harness_print(msg)
             return
-    print("Success!")
+    harness_print("Success!")
 
 # ------------------------------------------------------
 def complex_exp_real_ref(r, x):
@@ -256,7 +321,7 @@ def complex_exp_real_ref(r, x):
 
 @test
 def complex_exp_real_test(fun):
-    for i in range(25):
+    for i in trials(25):
         base = r.random() * r.randint(1, 100)
         if i == 0:
             base = 0
@@ -265,7 +330,7 @@ def complex_exp_real_test(fun):
         actual = fun(base, x)
         msg = assert_tuple(actual)
         if msg != None:
-            print(msg)
+            harness_print(msg)
             return
         msg = assert_cartesian(expected, actual,
                                "Result of exponentiation doesn't seem to match expected value: "
@@ -276,9 +341,9 @@ def complex_exp_real_test(fun):
                                + ", got "
                                + format_cartesian(actual))
         if msg != None:
-            print(msg)
+            harness_print(msg)
             return
-    print("Success!")
+    harness_print("Success!")
 
 # ------------------------------------------------------
 def polar_convert_ref(x):
@@ -286,15 +351,13 @@ def polar_convert_ref(x):
 
 @test
 def polar_convert_test(fun):
-    for i in range(25):
-        x = prep_random_cartesian()
-        if i == 0:
-            x = (0, 0)
+    for i in trials(len(edge_cartesians) + 24):
+        x = edge_cartesians[i] if i < len(edge_cartesians) else prep_random_cartesian()
         expected = polar_convert_ref(x)
         actual = fun(x)
         msg = assert_tuple(actual)
         if msg != None:
-            print(msg)
+            harness_print(msg)
             return
         msg = assert_polar(expected, actual,
                            "Polar conversion doesn't seem to match expected value: expected "
@@ -304,9 +367,9 @@ def polar_convert_test(fun):
                            + ", got "
                            + format_polar(actual))
         if msg != None:
-            print(msg)
+            harness_print(msg)
             return
-    print("Success!")
+    harness_print("Success!")
 
 # ------------------------------------------------------
 def cartesian_convert_ref(x):
@@ -314,13 +377,13 @@ def cartesian_convert_ref(x):
 
 @test
 def cartesian_convert_test(fun):
-    for i in range(25):
-        x = prep_random_polar()
+    for i in trials(len(edge_polars) + 25):
+        x = edge_polars[i] if i < len(edge_polars) else prep_random_polar()
         expected = cartesian_convert_ref(x)
         actual = fun(x)
         msg = assert_tuple(actual)
         if msg != None:
-            print(msg)
+            harness_print(msg)
             return
         msg = assert_cartesian(expected, actual,
                                "Cartesian conversion doesn't seem to match expected value: expected "
@@ -330,9 +393,9 @@ def cartesian_convert_test(fun):
                                + ", got "
                                + format_cartesian(actual))
         if msg != None:
-            print(msg)
+            harness_print(msg)
             return
-    print("Success!")
+    harness_print("Success!")
 
 # ------------------------------------------------------
 def polar_mult_ref(x, y):
@@ -343,7 +406,7 @@ def polar_mult_ref(x, y):
 
 @test
 def polar_mult_test(fun):
-    for i in range(25):
+    for i in trials(25):
         x = prep_random_polar()
         y = prep_random_polar()
         if i == 0:
@@ -356,7 +419,7 @@ def polar_mult_test(fun):
         actual = fun(x, y)
         msg = assert_tuple(actual)
         if msg != None:
-            print(msg)
+            harness_print(msg)
             return
         msg = assert_polar(expected, actual,
                            "Product doesn't seem to match expected value: expected ("
@@ -368,9 +431,9 @@ def polar_mult_test(fun):
                            + ", got "
                            + format_polar(actual))
         if msg != None:
-            print(msg)
+            harness_print(msg)
             return
-    print("Success!")
+    harness_print("Success!")
 
 # ------------------------------------------------------
 def complex_exp_arbitrary_ref(x, y):
@@ -379,7 +442,7 @@ def complex_exp_arbitrary_ref(x, y):
 
 @test
 def complex_exp_arbitrary_test(fun):
-    for i in range(25):
+    for i in trials(25):
         x = prep_random_cartesian()
         y = prep_random_cartesian()
         if i == 0:
@@ -388,7 +451,7 @@ def complex_exp_arbitrary_test(fun):
         actual = fun(x, y)
         msg = assert_tuple(actual)
         if msg != None:
-            print(msg)
+            harness_print(msg)
             return
         msg = assert_cartesian(expected, actual,
                                "Result of exponentiation doesn't seem to match expected value: expected ("
@@ -400,8 +463,8 @@ def complex_exp_arbitrary_test(fun):
                                + ", got "
                                + format_cartesian(actual))
         if msg != None:
-            print(msg)
+            harness_print(msg)
             return
-    print("Success!")
+    harness_print("Success!")
 
-print("Success!")
+harness_print("Success!")
@@ -0,0 +1,194 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+
+# NumPy engine for the plots in VisualizingGroversAlgorithm.ipynb.
+# The success probability of Grover's search after k iterations depends only on
+# the number of solutions M and the size of the search space N = 2ⁿ:
+#     P(k) = sin²((2k+1)θ), where sin θ = √(M/N).
+# The functions below evaluate it for whole ranges of iterations in one call,
+# either analytically or by evolving a compact real-valued statevector.
+
+import numpy as np
+
+# ------------------------------------------------------
+# Computes the angle θ for the given number of qubits and solutions (broadcasts over arrays)
+def grover_angle(nQubit, nSol):
+    nSol = np.asarray(nSol, dtype=np.float64)
+    return np.arcsin(np.sqrt(nSol / 2.0 ** np.asarray(nQubit, dtype=np.float64)))
+
+# Computes the exact success probability of Grover's search after each of the given numbers of iterations.
+# iters, nQubit and nSol can be scalars or arrays; the result is broadcast across all of them,
+# so, for example, nSol = [[2], [3], [4], [5]] and iters = range(20) yields a 4 x 20 array.
+def success_probability(nQubit, nSol, iters):
+    theta = grover_angle(nQubit, nSol)
+    k = np.asarray(iters, dtype=np.float64)
+    return np.sin((2 * k + 1) * theta) ** 2
+
+# Computes the optimal number of iterations: the integer R closest to π/(4θ) - 1/2,
+# at which (2R+1)θ is closest to π/2 (0 if there are no solutions)
+def optimal_iterations(nQubit, nSol):
+    theta = grover_angle(nQubit, nSol)
+    with np.errstate(divide='ignore'):
+        r = np.where(theta > 0, np.maximum(np.rint(np.pi / (4 * theta) - 0.5), 0), 0)
+    return r.astype(np.int64)
+
+# ------------------------------------------------------
+# Evaluates one clause of a SAT instance on all assignments of the variables it uses.
+# Returns the sorted list of these variables and a Boolean array of shape (2, ..., 2),
+# with the axes ordered from the highest variable index to the lowest.
+def clause_table(N, clause):
+    variables = sorted(set(index for (index, _) in clause), reverse=True)
+    for index in variables:
+        if not 0 <= index < N:
+            raise ValueError("Variable index {0} is out of range for {1} variables".format(index, N))
+    table = np.zeros((2,) * len(variables), dtype=bool)
+    for (index, isTrue) in clause:
+        shape = [1] * len(variables)
+        shape[variables.index(index)] = 2
+        table = table | np.array([not isTrue, isTrue]).reshape(shape)
+    return (variables, table)
+
+# Returns a Boolean array of length 2ᴺ marking the basis states that satisfy the SAT instance.
+# The instance uses the notebook's format: a list of clauses, each clause a list of (variable index, is true) pairs.
+# Variable i corresponds to bit i of the basis state index (little-endian, as in Q#).
+def sat_solution_mask(N, instance):
+    mask = np.ones(2 ** N, dtype=bool)
+    for clause in instance:
+        (variables, table) = clause_table(N, clause)
+        # View the mask with one axis per clause variable and one axis per run of the remaining bits in between,
+        # so that the clause table broadcasts over a handful of axes instead of N of them
+        shape = []
+        tableShape = []
+        bit = N
+        for index in variables:
+            if bit - 1 > index:
+                shape.append(2 ** (bit - 1 - index))
+                tableShape.append(1)
+            shape.append(2)
+            tableShape.append(2)
+            bit = index
+        if bit > 0:
+            shape.append(2 ** bit)
+            tableShape.append(1)
+        mask.reshape(shape)[...] &= table.reshape(tableShape)
+    return mask
+
+# Counts the solutions of the SAT instance.
+# For sparse instances the count is the contraction of the clause tables over all variables
+# (times 2 for each variable which doesn't appear in any clause), which doesn't need the 2ᴺ mask at all.
+# If the contraction would need large intermediate tables, the solutions are counted on the mask,
+# built in chunks of 2²⁰ basis states at a time.
+def count_sat_solutions(N, instance):
+    operands = []
+    axes = []
+    for clause in instance:
+        (variables, table) = clause_table(N, clause)
+        operands.append(table.astype(np.float64))
+        axes.append(set(N - 1 - index for index in variables))
+    used = set().union(*axes)
+    if N <= 52 and max_contraction_size(operands, axes) <= 2 ** 20:
+        args = []
+        for (table, ax) in zip(operands, axes):
+            args += [table, sorted(ax)]
+        count = np.einsum(*args, [], optimize='greedy') if args else 1
+        return int(round(float(count))) * 2 ** (N - len(used))
+    return count_sat_solutions_chunked(N, instance)
+
+# Estimates the size of the largest intermediate table in the greedy contraction of the clause tables
+def max_contraction_size(operands, axes):
+    if not operands:
+        return 1
+    args = []
+    for (table, ax) in zip(operands, axes):
+        args += [table, sorted(ax)]
+    path = np.einsum_path(*args, [], optimize='greedy')[0][1:]
+    axes = list(axes)
+    largest = max(2 ** len(ax) for ax in axes)
+    for step in path:
+        merged = set().union(*(axes[i] for i in step))
+        axes = [ax for (i, ax) in enumerate(axes) if i not in step]
+        # Axes which don't appear in any other table are summed out
+        others = set().union(*axes)
+        largest = max(largest, 2 ** len(merged))
+        axes.append(merged & others)
+    return largest
+
+# Counts the solutions of the SAT instance by fixing the values of the high variables
+# and evaluating the remaining instance on the 2²⁰ assignments of the low ones
+def count_sat_solutions_chunked(N, instance, chunkBits = 20):
+    low = min(N, chunkBits)
+    count = 0
+    for high in range(2 ** (N - low)):
+        reduced = []
+        for clause in instance:
+            satisfied = False
+            rest = []
+            for (index, isTrue) in clause:
+                if index >= low:
+                    if ((high >> (index - low)) & 1) == isTrue:
+                        satisfied = True
+                        break
+                else:
+                    rest.append((index, isTrue))
+            if satisfied:
+                continue
+            if not rest:
+                break
+            reduced.append(rest)
+        else:
+            count += int(np.count_nonzero(sat_solution_mask(low, reduced)))
+    return count
+
+# Returns a Boolean array of length 2ⁿ marking the first nSol basis states as solutions,
+# same as Oracle_SolutionCount does in Q#
+def solution_count_mask(nQubit, nSol):
+    mask = np.zeros(2 ** nQubit, dtype=bool)
+    mask[:nSol] = True
+    return mask
+
+# ------------------------------------------------------
+# Evolves the statevector of Grover's search with the phase oracle given by the mask
+# and returns the success probability after each of the given numbers of iterations.
+# All amplitudes stay real, so the state is stored as a float64 array of length 2ⁿ, which is updated in place;
+# the amplitudes of the solutions are gathered by their indices once per iteration.
+def statevector_success_probability(mask, iters):
+    mask = np.asarray(mask, dtype=bool)
+    k = np.asarray(iters, dtype=np.int64)
+    if k.size == 0:
+        return np.zeros(k.shape)
+    if k.min() < 0:
+        raise ValueError("The number of iterations must be non-negative")
+    probs = np.empty(k.max() + 1)
+    solutions = np.flatnonzero(mask)
+    psi = np.full(mask.shape, 1 / np.sqrt(mask.size))
+    for i in range(len(probs)):
+        marked = psi[solutions]
+        probs[i] = marked @ marked
+        # Phase oracle followed by the reflection about the mean
+        psi[solutions] = -marked
+        np.subtract(2 * psi.mean(), psi, out=psi)
+    return probs[k]
+
+# ------------------------------------------------------
+# Fast equivalent of Grover.SuccessProbability_Sol.simulate for a range of iterations
+def success_probability_sol(nQubit, nSol, iters, statevector = False):
+    if statevector:
+        return statevector_success_probability(solution_count_mask(nQubit, nSol), iters)
+    return success_probability(nQubit, nSol, iters)
+
+# Fast equivalent of Grover.SuccessProbability_SAT.simulate for a range of iterations
+def success_probability_sat(N, instance, iters, statevector = False):
+    if statevector:
+        return statevector_success_probability(sat_solution_mask(N, instance), iters)
+    return success_probability(N, count_sat_solutions(N, instance), iters)
+
+# ------------------------------------------------------
+# Checks that success probabilities estimated by the Q# operations (which run the algorithm `shots` times)
+# agree with the exact ones within the statistical error of the estimate.
+# Returns the list of (index, expected, estimated) triples for which they don't.
+def check_against_simulation(expected, estimated, shots = 100, sigmas = 4):
+    expected = np.asarray(expected, dtype=np.float64)
+    estimated = np.asarray(estimated, dtype=np.float64)
+    tolerance = sigmas * np.sqrt(expected * (1 - expected) / shots) + 1 / shots
+    bad = np.flatnonzero(np.abs(expected - estimated) > tolerance)
+    return [(int(i), expected.flat[i], estimated.flat[i]) for i in bad]
@@ -1,21 +1,222 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
 
+import os
 import random as r
+from random import Random
+import sys
+import time
 from cmath import sqrt
+import numpy as np
 from pytest import approx
 
-tests = {}
+# The grading machinery shared by the tutorials
+harness_path = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'utilities', 'TutorialHarness'))
+if harness_path not in sys.path:
+    sys.path.append(harness_path)
+from tutorial_harness import Harness, harness_print, thread_output
+
+harness = Harness(__file__, globals())
+tests = harness.tests
+TUTORIAL = harness.tutorial
+
+# ------------------------------------------------------
+# Instrumentation of the tests: when enabled with instrument(), grading an exercise records the wall time,
+# CPU time and peak memory of every call to the learner's function and to the reference implementation
+# (the function named after the exercise with the _ref suffix), as well as the duration of the whole test.
+# The records can be exported with export_jsonl() and export_prometheus(); see utilities/TutorialHarness.
+# Setting the KATAS_INSTRUMENT_TESTS environment variable to 1 enables the instrumentation without changing the notebook.
+instrumentation = harness.instrumentation
+instrument = harness.instrument
+run_test = harness.run_test
+export_jsonl = harness.export_jsonl
+export_prometheus = harness.export_prometheus
+
+# ------------------------------------------------------
+# Result cache: when enabled with cache_results(), the output of each test is stored under a fingerprint
+# of the submitted function, the test and the seed set with set_seed(), and re-submitting an unchanged function
+# replays the stored output instead of running the test again; see utilities/TutorialHarness.
+result_cache = harness.result_cache
+cache_results = harness.cache_results
+set_seed = harness.set_seed
+result_cache_key = harness.result_cache_key
+run_cached_test = harness.run_cached_test
+
+# ------------------------------------------------------
+# Asynchronous grading: when enabled with grade_asynchronously(), the exercise decorator returns immediately
+# and the test runs on a background thread, so that the notebook stays responsive while large tests run.
+# The progress and then the test output are shown in the output of the cell that defined the exercise.
+# Grading is cancelled by interrupting the kernel or calling cancel_grading().
+grading = harness.grading
+grade_asynchronously = harness.grade_asynchronously
+cancel_grading = harness.cancel_grading
+wait_for_grading = harness.wait_for_grading
+grade_in_background = harness.grade_in_background
+
+# ------------------------------------------------------
+# Remote grading: when the KATAS_GRADING_SOCKET environment variable (or grade_remotely()) gives the path
+# of the Unix socket of a grading daemon (scripts/grading_daemon.py), the exercises are sent to the daemon to be graded;
+# see utilities/TutorialHarness.
+remote_grading = harness.remote_grading
+grade_remotely = harness.grade_remotely
+grade_on_daemon = harness.grade_on_daemon
+rebuild_function = harness.rebuild_function
+
+# ------------------------------------------------------
+# Shared input pool: grade_notebook() grades all the exercises submitted so far in one pass over a single seeded pool
+# of inputs, rather than letting each test generate its own. Within a trial, the dimensions and the matrices a test
+# draws are taken from the pool by the trial number and the order of the draws, so related tests get the same inputs:
+# the k-th n by m matrix drawn in trial i is the same in every test. The reference implementations marked @pooled are
+# memoized on the values of their arguments, so the intermediate results they share are computed once for all the tests
+# (and kept for the next passes with the same seed): adjoint_ref reuses the results of transpose_ref and conjugate_ref,
+# inner_prod_ref and outer_prod_ref reuse adjoint_ref, normalize_ref reuses inner_prod_ref, is_matrix_unitary_ref reuses
+# adjoint_ref and so on. The pool and the memo hand out copies of the matrices they keep, and the learner's functions
+# get copies of their arguments, so a test or a function that changes a matrix in place doesn't change the inputs
+# of the other tests. The other random draws of a test on the pool come from its own generator, seeded by the pool seed
+# and the exercise, so grading on the pool doesn't disturb the random module. share_inputs() makes every exercise
+# graded afterwards use the pool too, so that running the notebook from top to bottom shares the inputs as well.
+input_pool = { 'enabled' : False, 'active' : False, 'seed' : 0, 'trial' : None, 'draws' : {},
+               'values' : {}, 'memo' : {} }
+
+# The last function submitted for each exercise
+submitted = harness.submitted
+
+# The cached test results depend on the pool seed when the pool is used
+harness.input_seed = lambda: input_pool['seed'] if input_pool['enabled'] else None
+
+def share_inputs(enabled = True, seed = 0):
+    if seed != input_pool['seed']:
+        clear_pool()
+    input_pool['enabled'] = enabled
+    input_pool['seed'] = seed
+
+def clear_pool():
+    input_pool['values'].clear()
+    input_pool['memo'].clear()
+
+# Grades all the submitted exercises on the shared input pool, printing the output of each test under the exercise name
+def grade_notebook(seed = None):
+    wait_for_grading()
+    enabled = input_pool['enabled']
+    share_inputs(True, input_pool['seed'] if seed is None else seed)
+    try:
+        for name in tests:
+            if name not in submitted:
+                continue
+            harness_print(name + ":")
+            try:
+                run_test(submitted[name])
+            except Exception as e:
+                harness_print("Your function raised an exception: {0!r}".format(e))
+    finally:
+        input_pool['enabled'] = enabled
+
+# Runs the test of the exercise, on the input pool if it is enabled
+def run_on_pool(test, fun):
+    global r
+    if not input_pool['enabled']:
+        test(fun)
+        return
+    # The draws that don't come from the pool (such as scalars) are the same in every pass too; they come from
+    # a generator of their own, which the tests use as r while they run, instead of reseeding the random module
+    random_module = r
+    r = Random('{0}:{1}'.format(input_pool['seed'], fun.__name__))
+    input_pool['active'] = True
+    input_pool['trial'] = None
+    input_pool['draws'] = {}
+    try:
+        test(with_copied_arguments(fun))
+    finally:
+        input_pool['active'] = False
+        r = random_module
+
+# The daemon doesn't have the kernel's input pool, so the exercises graded on the pool are graded here
+harness.run_test_function = run_on_pool
+harness.remote_grader = lambda fun: not input_pool['enabled'] and grade_on_daemon(fun)
+
+def with_copied_arguments(fun):
+    def wrapper(*args):
+        return fun(*[copy_value(arg) for arg in args])
+    wrapper.__name__ = fun.__name__
+    return wrapper
+
+def copy_value(value):
+    return [copy_value(item) for item in value] if isinstance(value, list) else value
+
+# Starts a new trial of the test: the draws of the trial are numbered from 0
+def start_pool_trial(trial):
+    input_pool['trial'] = trial
+    input_pool['draws'] = {}
+
+# Returns the seed of the next draw of the given kind in the current trial
+def pool_draw(kind):
+    k = input_pool['draws'].get(kind, 0)
+    input_pool['draws'][kind] = k + 1
+    return '{0}:{1}:{2}:{3}'.format(input_pool['seed'], input_pool['trial'], kind, k)
+
+# Returns a random size from low to high; the same draw in the same trial gives the same fraction of the range
+def pooled_dimension(low, high):
+    key = pool_draw('dimension')
+    if key not in input_pool['values']:
+        input_pool['values'][key] = Random(key).random()
+    return low + int(input_pool['values'][key] * (high - low + 1))
+
+# Returns a random matrix populated with complex numbers, as gen_complex_matrix does
+def pooled_matrix(h, w):
+    key = pool_draw('{0}x{1}'.format(h, w))
+    if key not in input_pool['values']:
+        rng = Random(key)
+        input_pool['values'][key] = [[(rng.random() - 0.5) * rng.randint(1, 10) + (rng.random() - 0.5) * rng.randint(1, 10) * 1j
+                                      for j in range(w)] for i in range(h)]
+    return matrix_copy(input_pool['values'][key])
+
+# Returns the memo key of an argument (its value, with the lists turned into tuples), or None if results for it can't be memoized
+def pool_key(value):
+    if isinstance(value, list):
+        items = tuple(pool_key(item) for item in value)
+        return None if None in items else ('list', items)
+    if isinstance(value, (int, float, complex)):
+        return ('value', value)
+    return None
+
+# Reference decorator, memoizing the reference implementation on the values of its arguments while a test runs on the pool
+def pooled(ref):
+    def wrapper(*args):
+        if not input_pool['active']:
+            return ref(*args)
+        key = (ref.__name__,) + tuple(pool_key(arg) for arg in args)
+        if None in key:
+            return ref(*args)
+        if key not in input_pool['memo']:
+            input_pool['memo'][key] = ref(*args)
+        return copy_value(input_pool['memo'][key])
+    wrapper.__name__ = ref.__name__
+    return wrapper
+
+# ------------------------------------------------------
+# Trial scheduling: each test runs its edge cases first, then the random cases of the original sizes,
+# and stops at the first failure. adaptive_trials() makes the tests keep sampling random cases after they pass,
+# with the dimensions growing by the escalation level of the trial; see utilities/TutorialHarness.
+trial_schedule = harness.trial_schedule
+adaptive_trials = harness.adaptive_trials
+trials = harness.trials
+
+# The draws of each trial of a test on the input pool are numbered from 0
+harness.trial_started = lambda trial: start_pool_trial(trial) if input_pool['active'] else None
+
+# Returns a random size from low to high, drawn from the pool when the test runs on it;
+# the extra trials of adaptive_trials() raise the upper bound by their escalation level
+def gen_dimension(low = 1, high = 5):
+    high += harness.trial_state['escalation']
+    if input_pool['active']:
+        return pooled_dimension(low, high)
+    return r.randint(low, high)
 
 # Exercise decorator, specifying that this function needs to be tested
-def exercise(fun):
-    tests[fun.__name__](fun)
-    return fun
+exercise = harness.exercise
 
 # Test decorator, specifying that this is a test for an exercise
-def test(fun):
-    tests[fun.__name__[:-5]] = fun
-    return fun
+test = harness.test
 
 # Generates a random number from -5 to 5
 def randnum():
@@ -28,8 +229,10 @@ def randcomplex():
 # Height (number of rows) is the first dimension for matrices
 # Generates a random matrix populated with complex numbers
 def gen_complex_matrix(h = -1, w = -1):
-    if h == -1: h = r.randint(1, 5)
-    if w == -1: w = r.randint(1, 5)
+    if h == -1: h = gen_dimension()
+    if w == -1: w = gen_dimension()
+    if input_pool['active']:
+        return pooled_matrix(h, w)
     ans = []
     for i in range(h):
         temp = []
@@ -147,7 +350,7 @@ def format_matrix(matrix, label):
 # ------------------------------------------------------
 # Checks that two matrices are (approximately) equal to each other
 def matrix_equal(act, exp):
-    if act == ... or exp == ...:
+    if act is ... or exp is ...:
         return False
     
     h = len(act)
@@ -181,6 +384,16 @@ def create_empty_matrix(n, m):
     return ans
 
 # ------------------------------------------------------
+# Edge cases of the matrix exercises, which the tests run before the random cases: a 1 by 1 zero matrix,
+# a single row, a single column and a purely imaginary matrix.
+# The tests pass copies of them, so that a function which changes its inputs doesn't change the edge cases.
+edge_operand_matrices = [[[0]], [[1, -2j, 0.5]], [[1j], [-3], [0]], [[2j, -1j], [0.5j, 1j]]]
+
+# Edge cases of the vector exercises: a vector of length 1, a vector with a zero component and purely imaginary vectors
+edge_column_vectors = [[[1j]], [[0], [3]], [[1], [-1j]], [[0.5j], [0], [-2j]]]
+
+# ------------------------------------------------------
+@pooled
 def matrix_add_ref(a, b):
     n = len(a)
     m = len(a[0])
@@ -193,23 +406,27 @@ def matrix_add_ref(a, b):
 
 @test
 def matrix_add_test(fun):
-    for i in range(10):
-        a = gen_complex_matrix()
+    for i in trials(len(edge_operand_matrices) + 10):
+        if i < len(edge_operand_matrices):
+            a = matrix_copy(edge_operand_matrices[i])
+        else:
+            a = gen_complex_matrix()
         b = gen_complex_matrix(len(a), len(a[0]))
         expected = matrix_add_ref(a, b)
         actual = fun(a, b)
         if actual == None:
-            print("Your function must return a value!")
+            harness_print("Your function must return a value!")
             return
         if not matrix_equal(actual, expected):
-            print("Unexpected results of addition: \n"
+            harness_print("Unexpected results of addition: \n"
                   + gen_labeled_message([a, b, expected, actual],
                                         ["A: ", "B: ", "Expected: ", "You returned: "])
                   + "Try again!")
             return
-    print("Success!")
+    harness_print("Success!")
 
 # ------------------------------------------------------
+@pooled
 def scalar_mult_ref(x, a):
     ans = []
     for row in a:
@@ -219,25 +436,29 @@ def scalar_mult_ref(x, a):
         ans.append(temp)
     return ans
 
+# Multiplying by 0, 1 and -i are the edge cases
+edge_scalars = [0, 1, -1j]
+
 @test
 def scalar_mult_test(fun):
-    for i in range(10):
+    for i in trials(len(edge_scalars) + 10):
         a = gen_complex_matrix()
-        x = randcomplex()
+        x = edge_scalars[i] if i < len(edge_scalars) else randcomplex()
         expected = scalar_mult_ref(x, a)
         actual = fun(x, a)
         if actual == None:
-            print("Your function must return a value!")
+            harness_print("Your function must return a value!")
             return
         if not matrix_equal(actual, expected):
-            print("Unexpected results of scalar multiplication: \nScalar: {0:.3f}\n\n".format(x)
+            harness_print("Unexpected results of scalar multiplication: \nScalar: {0:.3f}\n\n".format(x)
                   + gen_labeled_message([a, expected, actual],
                                         ["A: ", "Expected: ", "You returned: "])
                   + "Try again!")
             return
-    print("Success!")
+    harness_print("Success!")
 
 # ------------------------------------------------------
+@pooled
 def matrix_mult_ref(a, b):
     h = len(a)
     common = len(a[0]) # = len(b)
@@ -251,22 +472,26 @@ def matrix_mult_ref(a, b):
 
 @test
 def matrix_mult_test(fun):
-    for i in range(10):
-        a = gen_complex_matrix()
+    for i in trials(len(edge_operand_matrices) + 10):
+        if i < len(edge_operand_matrices):
+            a = matrix_copy(edge_operand_matrices[i])
+        else:
+            a = gen_complex_matrix()
         b = gen_complex_matrix(len(a[0]))
         expected = matrix_mult_ref(a, b)
         actual = fun(a, b)
         if actual == None:
-            print("Your function must return a value!")
+            harness_print("Your function must return a value!")
         if not matrix_equal(actual, expected):
-            print("Unexpected results of matrix multiplication: \n"
+            harness_print("Unexpected results of matrix multiplication: \n"
                   + gen_labeled_message([a, b, expected, actual],
                                         ["A: ", "B: ", "Expected: ", "You returned: "])
                   + "Try again!")
             return
-    print("Success!")
+    harness_print("Success!")
 
 # ------------------------------------------------------
+@pooled
 def matrix_inverse_ref(m):
     a = m[0][0]
     b = m[0][1]
@@ -275,27 +500,34 @@ def matrix_inverse_ref(m):
     det = (a * d) - (b * c)
     return [[d / det, -b / det], [-c / det, a / det]]
 
+# The identity, a matrix with zeros on the diagonal and a purely imaginary matrix
+edge_invertible_matrices = [[[1, 0], [0, 1]], [[0, 2], [-1, 0]], [[1j, 2j], [0, -1j]]]
+
 @test
 def matrix_inverse_test(fun):
-    for i in range(10):
+    for i in trials(len(edge_invertible_matrices) + 10):
         a = None
         det = 0
         while det == 0:
-            a = gen_complex_matrix(2,2)
+            if i < len(edge_invertible_matrices):
+                a = matrix_copy(edge_invertible_matrices[i])
+            else:
+                a = gen_complex_matrix(2,2)
             det = (a[0][0] * a[1][1]) - (a[0][1] * a[1][0])
         expected = matrix_inverse_ref(a)
         actual = fun(a)
         if actual == None:
-            print("Your function must return a value!")
+            harness_print("Your function must return a value!")
         if not matrix_equal(actual, expected):
-            print("Inverse doesn't seem to match expected:\n"
+            harness_print("Inverse doesn't seem to match expected:\n"
                   + gen_labeled_message([a, expected, actual],
                                         ["A: ", "Expected: ", "You returned: "])
                   + "Try again!")
             return
-    print("Success!")
+    harness_print("Success!")
 
 # ------------------------------------------------------
+@pooled
 def transpose_ref(a):
     ans = []
     n = len(a)
@@ -309,22 +541,26 @@ def transpose_ref(a):
 
 @test
 def transpose_test(fun):
-    for i in range(10):
-        a = gen_complex_matrix()
+    for i in trials(len(edge_operand_matrices) + 10):
+        if i < len(edge_operand_matrices):
+            a = matrix_copy(edge_operand_matrices[i])
+        else:
+            a = gen_complex_matrix()
         expected = transpose_ref(a)
         actual = fun(a)
         if actual == None:
-            print("Your function must return a value!")
+            harness_print("Your function must return a value!")
             return
         if not matrix_equal(actual, expected):
-            print("Unexpected result of a transpose:\n"
+            harness_print("Unexpected result of a transpose:\n"
                   + gen_labeled_message([a, expected, actual],
                                         ["A: ", "Expected: ", "You returned: "])
                   + "Try again!")
             return
-    print("Success!")
+    harness_print("Success!")
 
 # ------------------------------------------------------
+@pooled
 def conjugate_ref(a):
     ans = []
     for row in a:
@@ -336,41 +572,48 @@ def conjugate_ref(a):
 
 @test
 def conjugate_test(fun):
-    for i in range(10):
-        a = gen_complex_matrix()
+    for i in trials(len(edge_operand_matrices) + 10):
+        if i < len(edge_operand_matrices):
+            a = matrix_copy(edge_operand_matrices[i])
+        else:
+            a = gen_complex_matrix()
         expected = conjugate_ref(a)
         actual = fun(a)
         if actual == None:
-            print("Your function must return a value!")
+            harness_print("Your function must return a value!")
             return
         if not matrix_equal(actual, expected):
-            print("Unexpected result of matrix conjugate:\n"
+            harness_print("Unexpected result of matrix conjugate:\n"
                   + gen_labeled_message([a, expected, actual],
                                         ["A: ","Expected: ","You returned: "])
                   + "Try again!")
             return
-    print("Success!")
+    harness_print("Success!")
 
 # ------------------------------------------------------
+@pooled
 def adjoint_ref(a):
     return conjugate_ref(transpose_ref(a))
 
 @test
 def adjoint_test(fun):
-    for i in range(10):
-        a = gen_complex_matrix()
+    for i in trials(len(edge_operand_matrices) + 10):
+        if i < len(edge_operand_matrices):
+            a = matrix_copy(edge_operand_matrices[i])
+        else:
+            a = gen_complex_matrix()
         expected = adjoint_ref(a)
         actual = fun(a)
         if actual == None:
-            print("Your function must return a value!")
+            harness_print("Your function must return a value!")
             return
         if not matrix_equal(actual, expected):
-            print("Unexpected result of adjoint operation:\n"
+            harness_print("Unexpected result of adjoint operation:\n"
                   + gen_labeled_message([a, expected, actual],
                                         ["A: ","Expected: ","You returned: "])
                   + "Try again!")
             return
-    print("Success!")
+    harness_print("Success!")
 
 # ------------------------------------------------------
 # Projection operator - returns (<v,w>/<v,v>)*v
@@ -384,7 +627,7 @@ def append_vector(m,v):
 
 # Generates a unitary matrix via the Gram-Schmidt process
 def gen_unitary_matrix(n = -1):
-    if n == -1: n = r.randint(1, 5)
+    if n == -1: n = gen_dimension()
     temp = gen_complex_matrix(n, n)
     
     # Split the generated matrix into vectors
@@ -411,6 +654,7 @@ def gen_unitary_matrix(n = -1):
 
 edge_unitary_matrices = [[[0, 0], [0, 0]], [[1/sqrt(2), 1/sqrt(2)], [1/sqrt(2), 1/sqrt(2)]]]
 
+@pooled
 def is_matrix_unitary_ref(a):
     n = len(a)
     prod = matrix_mult_ref(a, adjoint_ref(a))
@@ -424,7 +668,7 @@ def is_matrix_unitary_ref(a):
 
 @test
 def is_matrix_unitary_test(fun):
-    for testId in range(12):
+    for testId in trials(12):
         a = []
         # The first two tests are edge cases, after that unitary and non-unitary matrices alternate
         if testId < 2:
@@ -432,94 +676,107 @@ def is_matrix_unitary_test(fun):
         elif testId % 2 == 0:
             a = gen_unitary_matrix()
         else:
-            n = r.randint(1,5)
+            n = gen_dimension()
             a = gen_complex_matrix(n,n)
         expected = is_matrix_unitary_ref(a)
         actual = fun(a)
         if actual == None:
-            print("Your function must return a value!")
+            harness_print("Your function must return a value!")
             return
         if actual != expected:
-            print("Unexpected result:\n"
+            harness_print("Unexpected result:\n"
                   + gen_matrix_message([a],
                                        ["Matrix ", (" is " if expected else " is not ")
                                                    + "unitary, but misidentified as " 
                                                    + ("unitary" if actual else "not unitary")]))
             return
-    print("Success!")
+    harness_print("Success!")
 
 # ------------------------------------------------------
+@pooled
 def inner_prod_ref(v, w):
     return matrix_mult_ref(adjoint_ref(v), w)[0][0]
 
 @test
 def inner_prod_test(fun):
-    for i in range(10):
-        v = gen_complex_matrix(w = 1)
+    for i in trials(len(edge_column_vectors) + 10):
+        if i < len(edge_column_vectors):
+            v = matrix_copy(edge_column_vectors[i])
+        else:
+            v = gen_complex_matrix(w = 1)
         w = gen_complex_matrix(len(v), 1)
         expected = inner_prod_ref(v, w)
         actual = fun(v, w)
         if type(actual) == list:
-            print("You should return a number, not a matrix")
+            harness_print("You should return a number, not a matrix")
             return
         if actual == None or actual == ...:
-            print("Your function must return a value!")
+            harness_print("Your function must return a value!")
             return
         if actual != approx(expected):
-            print("Unexpected result of inner product:\n"
+            harness_print("Unexpected result of inner product:\n"
                   + gen_labeled_message([v, w], ["V: ", "W: "])
                   + "Expected: {0:.3f}\n\n".format(expected)
                   + "You returned: {0:.3f}\n\nTry again!".format(actual))
             return
-    print("Success!")
+    harness_print("Success!")
 
 # ------------------------------------------------------
+@pooled
 def normalize_ref(v):
     return scalar_mult_ref(1 / sqrt(inner_prod_ref(v,v).real), v)
 
 @test
 def normalize_test(fun):
-    for i in range(10):
+    for i in trials(len(edge_column_vectors) + 10):
         v = None
         norm = 0
         while norm == 0:
-            v = gen_complex_matrix(w = 1)
+            if i < len(edge_column_vectors):
+                v = matrix_copy(edge_column_vectors[i])
+            else:
+                v = gen_complex_matrix(w = 1)
             norm = inner_prod_ref(v, v)
         expected = normalize_ref(v)
         actual = fun(v)
         if actual == None:
-            print("Your function must return a value!")
+            harness_print("Your function must return a value!")
             return
         if not matrix_equal(actual, expected):
-            print("Unexpected result of normalization:\n"
+            harness_print("Unexpected result of normalization:\n"
                   + gen_labeled_message([v, expected, actual], ["V: ", "Expected: ", "You returned: "])
                   + "Try again!")
             return
-    print("Success!")
+    harness_print("Success!")
 
 # ------------------------------------------------------
+@pooled
 def outer_prod_ref(v, w):
     return matrix_mult_ref(v, adjoint_ref(w))
 
 @test
 def outer_prod_test(fun):
-    for i in range(10):
-        v = gen_complex_matrix(w = 1)
+    for i in trials(len(edge_column_vectors) + 10):
+        if i < len(edge_column_vectors):
+            v = matrix_copy(edge_column_vectors[i])
+        else:
+            v = gen_complex_matrix(w = 1)
         w = gen_complex_matrix(w = 1)
         expected = outer_prod_ref(v, w)
         actual = fun(v, w)
         if actual == None:
-            print("Your function must return a value!")
+            harness_print("Your function must return a value!")
             return
         if not matrix_equal(actual, expected):
-            print("Unexpected result of outer product:\n"
+            harness_print("Unexpected result of outer product:\n"
                   + gen_labeled_message([v, w, expected, actual],
                                         ["V: ", "W: ", "Expected: ", "You returned: "])
                   + "Try again!")
             return
-    print("Success!")
+    harness_print("Success!")
 
 # ------------------------------------------------------
+@pooled
 def tensor_product_ref(a, b):
     n = len(a)
     m = len(a[0])
@@ -539,25 +796,142 @@ def tensor_product_ref(a, b):
     
     return ans
 
+# A 1 by 1 factor, a column times a row and a matrix times a column
+edge_tensor_factors = [([[1]], [[2j, -1]]), ([[0], [1]], [[1, 0]]), ([[1j, 0], [0, 1]], [[0], [1]])]
+
 @test
 def tensor_product_test(fun):
-    for i in range(10):
+    for i in trials(len(edge_tensor_factors) + 10):
         (a, b) = ([[1, 1, 1]], [[1, 1, 1]])
+        if i < len(edge_tensor_factors):
+            (a, b) = (matrix_copy(edge_tensor_factors[i][0]), matrix_copy(edge_tensor_factors[i][1]))
         while len(a[0]) * len(b[0]) >= 8:
             a = gen_complex_matrix()
             b = gen_complex_matrix()
         expected = tensor_product_ref(a, b)
         actual = fun(a, b)
         if actual == None:
-            print("Your function must return a value!")
+            harness_print("Your function must return a value!")
             return
         if not matrix_equal(actual, expected):
-            print("Unexpected result of tensor product:\n"
+            harness_print("Unexpected result of tensor product:\n"
                   + gen_labeled_message([a, b, expected, actual],
                                         ["A: ", "B: ", "Expected: ", "You returned: "])
                   + "Try again!")
             return
-    print("Success!")
+    harness_print("Success!")
+
+# ------------------------------------------------------
+# Applies a gate acting on the target qubits (controlled on the control qubits being in the |1⟩ state)
+# to a state vector of n qubits, given as a list of 2ⁿ amplitudes. Qubit 0 is the leftmost factor
+# of the tensor product (the most significant bit of the basis state index), and the gate matrix
+# uses the same order for its targets. Instead of building the 2ⁿ x 2ⁿ matrix of the whole operation,
+# the state is viewed as an n-dimensional 2 x ... x 2 array, and the gate is applied along the target axes
+# of the part of it in which all controls are 1, which takes O(2ⁿ) time for 1- and 2-qubit gates.
+def apply_gate_ref(state, gate, targets, controls = None):
+    if controls is None:
+        controls = []
+    n = len(state).bit_length() - 1
+    k = len(targets)
+    psi = np.array(state, dtype=complex).reshape((2,) * n)
+    u = np.asarray(gate, dtype=complex).reshape((2,) * (2 * k))
+    index = [slice(None)] * n
+    for c in controls:
+        index[c] = 1
+    index = tuple(index)
+    # Fixing the control axes removes them, so the target axes shift accordingly
+    axes = [t - sum(1 for c in controls if c < t) for t in targets]
+    part = np.tensordot(u, psi[index], axes=(list(range(k, 2 * k)), axes))
+    psi[index] = np.moveaxis(part, list(range(k)), axes)
+    return psi.reshape(-1)
+
+# Generates a random normalized state vector of n qubits
+def gen_state_vector(n):
+    rng = np.random.default_rng(r.getrandbits(64))
+    state = rng.normal(size=2 ** n) + 1j * rng.normal(size=2 ** n)
+    return state / np.linalg.norm(state)
+
+# Generates a random gate application: a 1- or 2-qubit unitary, distinct target qubits and up to 2 control qubits
+def gen_gate_application(n):
+    qubits = list(range(n))
+    r.shuffle(qubits)
+    k = r.randint(1, min(2, n))
+    controls = sorted(qubits[k : k + r.randint(0, min(2, n - k))])
+    return (gen_unitary_matrix(2 ** k), qubits[:k], controls)
+
+# Checks that two state vectors are (approximately) equal to each other
+def state_equal(act, exp):
+    try:
+        act = np.asarray(act, dtype=complex).reshape(-1)
+    except (TypeError, ValueError):
+        return False
+    return act.shape == exp.shape and np.allclose(act, exp, rtol=1e-6, atol=1e-9)
+
+edge_gate_applications = [
+    # X gate on |0⟩
+    ([1, 0], [[0, 1], [1, 0]], [0], []),
+    # CNOT with qubit 0 as control on |10⟩
+    ([0, 0, 1, 0], [[0, 1], [1, 0]], [1], [0]),
+    # CNOT as a 2-qubit gate on qubits 1 and 0 (in this order) of |01⟩
+    ([0, 1, 0, 0], [[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 0, 1], [0, 0, 1, 0]], [1, 0], []),
+]
+
+# Checks the learner's function on one gate application, printing the difference if it fails
+def check_gate_application(fun, state, gate, targets, controls):
+    expected = apply_gate_ref(state, gate, targets, controls)
+    actual = fun(list(state), matrix_copy(gate), targets[:], controls[:])
+    if actual is None or actual is ...:
+        harness_print("Your function must return a value!")
+        return False
+    if not state_equal(actual, expected):
+        n = len(expected).bit_length() - 1
+        message = "Unexpected result of applying the gate to the {0}-qubit state with targets {1} and controls {2}:\n\n".format(n, targets, controls)
+        message += gen_labeled_message([gate], ["Gate: "])
+        try:
+            act = np.asarray(actual, dtype=complex).reshape(-1)
+        except (TypeError, ValueError):
+            act = None
+        if act is None or act.shape != expected.shape:
+            message += "Expected a list of {0} amplitudes, but you returned {1}\n\n".format(len(expected), actual if n <= 3 else type(actual).__name__)
+        elif n <= 3:
+            message += gen_labeled_message([[[a] for a in state], [[a] for a in expected], [[a] for a in act]],
+                                           ["State: ", "Expected: ", "You returned: "])
+        else:
+            j = int(np.argmax(np.abs(act - expected)))
+            message += "The amplitude of basis state {0} is {1:.3f}, expected {2:.3f}\n\n".format(j, act[j], expected[j])
+        harness_print(message + "Try again!")
+        return False
+    return True
+
+# After the random cases of 1 to 5 qubits, the test checks larger states within a time budget of their own:
+# a size is only run if its time, estimated from the previous size (the time of an O(2ⁿ) function doubles
+# with every qubit), fits in the rest of the budget, so a slow function stops at the size it can handle
+large_state_sizes = [8, 12, 16, 20]
+large_state_budget = 2.0
+
+@test
+def apply_gate_test(fun):
+    for i in trials(10):
+        if i < len(edge_gate_applications):
+            (state, gate, targets, controls) = edge_gate_applications[i]
+        else:
+            n = gen_dimension(1, 5)
+            state = gen_state_vector(n)
+            (gate, targets, controls) = gen_gate_application(n)
+        if not check_gate_application(fun, state, gate, targets, controls):
+            return
+    deadline = time.perf_counter() + large_state_budget
+    (previous_n, previous_time) = (None, None)
+    for n in large_state_sizes:
+        if previous_time is not None and time.perf_counter() + previous_time * 2 ** (n - previous_n) > deadline:
+            break
+        state = gen_state_vector(n)
+        (gate, targets, controls) = gen_gate_application(n)
+        start = time.perf_counter()
+        if not check_gate_application(fun, state, gate, targets, controls):
+            return
+        (previous_n, previous_time) = (n, time.perf_counter() - start)
+    harness_print("Success!")
 
 # ------------------------------------------------------
 edge_matrices = [
@@ -602,7 +976,7 @@ def determinant(mat):
 # Generates a matrix and an eigenvalue by generating a square matrix,
 # taking the top right element as the eigenvalue, and solving for what to replace it with
 def gen_eigenmatrix(n = -1):
-    if n == -1: n = r.randint(2, 5)
+    if n == -1: n = gen_dimension(2, 5)
     
     ans = [[0]]
     while ans[0][-1] == 0:
@@ -669,7 +1043,7 @@ def find_eigenvector_ref(a, x):
 
 @test
 def find_eigenvalue_test(fun):
-    for i in range(10):
+    for i in trials(10):
         (a, expected, v) = (None, None, None)
         if i < 3:
             (a, expected) = (edge_matrices[i], edge_values[i])
@@ -679,22 +1053,22 @@ def find_eigenvalue_test(fun):
             v = find_eigenvector_ref(a, expected)
         actual = fun(a, v)
         if actual == None or actual == ...:
-            print("Your function must return a value!")
+            harness_print("Your function must return a value!")
             return
         if actual != approx(expected):
-            print("Wrong eigenvalue!\n"
+            harness_print("Wrong eigenvalue!\n"
                   + gen_labeled_message([a, v], ["A: ", "V: "])
                   + "Expected "
                   + "{0:.3f}\n\n".format(expected)
                   + "You returned: {0:.3f}\n\n".format(actual)
                   + "Try again!")
             return
-    print("Success!")
+    harness_print("Success!")
 
 # ------------------------------------------------------
 @test
 def find_eigenvector_test(fun):
-    for i in range(10):
+    for i in trials(10):
         (a, x) = (None, None)
         if i < 3:
             (a, x) = (edge_matrices[-1-i], edge_values[-1-i])
@@ -703,18 +1077,18 @@ def find_eigenvector_test(fun):
         
         result = fun(a, x)
         if result == None or result == ...:
-            print("Your function must return a value!")
+            harness_print("Your function must return a value!")
             return
         if result == [[0], [0]]:
-            print("The eigenvector must be non-zero!")
+            harness_print("The eigenvector must be non-zero!")
             return
         matrix_product = matrix_mult_ref(a, result)
         scalar_product = scalar_mult_ref(x, result)
         if not matrix_equal(matrix_product, scalar_product):
-            print("Wrong eigenvector!\nEigenvalue: {0:.3f}\n\n".format(x)
+            harness_print("Wrong eigenvector!\nEigenvalue: {0:.3f}\n\n".format(x)
                   + gen_labeled_message([a, result, matrix_product, scalar_product], ["A: ", "You returned V: ", "Matrix product AV:", "Scalar product xV: "])
                   + "Try again!")
             return
-    print("Success!")
+    harness_print("Success!")
 
-print("Success!")
+harness_print("Success!")
@@ -0,0 +1,168 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""Data generation, plotting and evaluation helpers shared by the quantum classification tutorials.
+
+All datasets have 2 features drawn uniformly from the square [min, max] x [min, max] and 2 classes.
+The generators are vectorized with NumPy, can be seeded for reproducibility, and can stream
+the samples in chunks, so that the tutorial pipelines can be run on 10⁵-10⁶ samples.
+"""
+
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+# The number of samples generated at once by the streaming generators
+DEFAULT_CHUNK_SIZE = 65_536
+
+# ------------------------------------------------------
+# Labeling rules: each function takes the arrays of x and y coordinates and returns the array of labels.
+
+def angular_labels(x : np.ndarray, y : np.ndarray, separation_angles : List[float]) -> np.ndarray:
+    """Class 1 lies between two lines that go through the origin at the given angles, class 0 outside of them"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        angle = np.arctan(y / x)
+    return np.where((angle < separation_angles[0]) | (angle > separation_angles[1]), 0, 1)
+
+def vertical_labels(x : np.ndarray, y : np.ndarray, separation_vertical : float) -> np.ndarray:
+    """Class 0 lies to the left of a vertical line, class 1 to the right of it"""
+    return np.where(x < separation_vertical, 0, 1)
+
+def horizontal_labels(x : np.ndarray, y : np.ndarray, separation_horizontal : float) -> np.ndarray:
+    """Class 0 lies between two horizontal lines y = ±separation_horizontal, class 1 outside of them"""
+    return np.where(np.abs(y) < separation_horizontal, 0, 1)
+
+def circle_labels(x : np.ndarray, y : np.ndarray, separation_r : float) -> np.ndarray:
+    """Class 0 lies inside a circle centered at the origin, class 1 outside of it"""
+    return np.where(x ** 2 + y ** 2 < separation_r ** 2, 0, 1)
+
+def hyperbola_labels(x : np.ndarray, y : np.ndarray, separation_r : float) -> np.ndarray:
+    """Class 0 lies between the branches of the hyperbola y² - x² = separation_r², class 1 above and below them"""
+    return np.where(separation_r ** 2 + x ** 2 > y ** 2, 0, 1)
+
+# ------------------------------------------------------
+def stream_data(samples_number : int, min : float, max : float,
+                labeling : Callable[[np.ndarray, np.ndarray], np.ndarray],
+                seed = None, chunk_size : int = DEFAULT_CHUNK_SIZE) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Generates the samples in chunks of at most chunk_size, yielding a pair (features, labels) of arrays
+    of shapes (n, 2) and (n,) for each chunk.
+    For the same seed, the concatenation of the chunks doesn't depend on the chunk size.
+    """
+    rng = np.random.default_rng(seed)
+    for start in range(0, samples_number, chunk_size):
+        # min and max name the range of the features here, so the chunk length is computed without the built-in min
+        count = chunk_size if samples_number - start > chunk_size else samples_number - start
+        features = rng.random((count, 2)) * (max - min) + min
+        yield (features, labeling(features[:, 0], features[:, 1]))
+
+def generate_data(samples_number : int, min : float, max : float,
+                  labeling : Callable[[np.ndarray, np.ndarray], np.ndarray],
+                  seed = None, as_arrays : bool = False, chunk_size : int = DEFAULT_CHUNK_SIZE) -> Dict[str, list]:
+    """Generates a dataset in the format used by the tutorials: { 'Features' : features, 'Labels' : labels }.
+    By default the features and the labels are lists that can be passed to Q# operations directly;
+    set as_arrays to True to keep them as NumPy arrays.
+    """
+    chunks = list(stream_data(samples_number, min, max, labeling, seed, chunk_size))
+    features = np.concatenate([f for (f, _) in chunks]) if chunks else np.zeros((0, 2))
+    labels = np.concatenate([l for (_, l) in chunks]) if chunks else np.zeros(0, dtype=int)
+    if as_arrays:
+        return { 'Features' : features, 'Labels' : labels }
+    return { 'Features' : features.tolist(), 'Labels' : labels.tolist() }
+
+def generate_angular_data(samples_number : int, min : float, max : float, separation_angles : List[float], **kwargs):
+    """Generates data with 2 features and 2 classes separable by a pair of lines that go through the origin"""
+    return generate_data(samples_number, min, max, lambda x, y: angular_labels(x, y, separation_angles), **kwargs)
+
+def generate_vertically_separated_data(samples_number : int, min : float, max : float, separation_vertical : float, **kwargs):
+    """Generates data with 2 features and 2 classes separable by a vertical line"""
+    return generate_data(samples_number, min, max, lambda x, y: vertical_labels(x, y, separation_vertical), **kwargs)
+
+def generate_horizontally_separated_data(samples_number : int, min : float, max : float, separation_horizontal : float, **kwargs):
+    """Generates data with 2 features and 2 classes separable by horizontal lines"""
+    return generate_data(samples_number, min, max, lambda x, y: horizontal_labels(x, y, separation_horizontal), **kwargs)
+
+def generate_circle_separated_data(samples_number : int, min : float, max : float, separation_r : float, **kwargs):
+    """Generates data with 2 features and 2 classes separable by a circle"""
+    return generate_data(samples_number, min, max, lambda x, y: circle_labels(x, y, separation_r), **kwargs)
+
+def generate_hyperbola_separated_data(samples_number : int, min : float, max : float, separation_r : float, **kwargs):
+    """Generates data with 2 features and 2 classes separable by a hyperbola"""
+    return generate_data(samples_number, min, max, lambda x, y: hyperbola_labels(x, y, separation_r), **kwargs)
+
+# ------------------------------------------------------
+# Plotting configuration: the four combinations of the actual and the classified labels
+cases = [(0, 0), (0, 1), (1, 1), (1, 0)]
+markers = [
+    '.' if actual == classified else 'X'
+    for (actual, classified) in cases
+]
+colors = ['blue', 'blue', 'red', 'red']
+
+def plot_data(features : list, actual_labels : list, classified_labels : list = None, extra_lines : list = None,
+              marker_size : float = 300):
+    """Plots the data, labeling it with actual labels if there are no classification results provided,
+    and with the classification results (indicating their correctness) if they are provided.
+    """
+    from matplotlib import pyplot
+
+    samples = np.asarray(features)
+    actual_labels = np.asarray(actual_labels)
+    classified = actual_labels if classified_labels is None else np.asarray(classified_labels)
+    # Encode each combination of labels as a single integer once, instead of building the masks from scratch for each case
+    case_codes = 2 * actual_labels + classified
+    pyplot.figure(figsize=(8, 8))
+    for ((actual, classified_label), marker, color) in zip(cases, markers, colors):
+        mask = case_codes == 2 * actual + classified_label
+        if not np.any(mask): continue
+        pyplot.scatter(
+            samples[mask, 0], samples[mask, 1],
+            label = f"Class {actual}" if classified_labels is None else f"Was {actual}, classified {classified_label}",
+            marker = marker, s = marker_size, c = [color],
+        )
+    # Add the lines to show the true classes boundaries, if provided
+    if extra_lines is not None:
+        for line in extra_lines:
+            pyplot.plot(line[0], line[1], color = 'gray')
+    pyplot.legend()
+
+# ------------------------------------------------------
+def confusion_matrix(actual_labels, classified_labels) -> np.ndarray:
+    """Returns the 2 x 2 matrix of counts, in which element [a][c] is the number of samples of class a classified as c"""
+    actual_labels = np.asarray(actual_labels, dtype=np.int64)
+    classified_labels = np.asarray(classified_labels, dtype=np.int64)
+    if actual_labels.shape != classified_labels.shape:
+        raise ValueError(f"Got {actual_labels.size} actual labels but {classified_labels.size} classified labels")
+    return np.bincount(2 * actual_labels + classified_labels, minlength=4).reshape(2, 2)
+
+def miss_rate(actual_labels, classified_labels) -> float:
+    """Returns the fraction of the samples which were classified incorrectly"""
+    return miss_rate_of(confusion_matrix(actual_labels, classified_labels))
+
+def miss_rate_of(confusion : np.ndarray) -> float:
+    """Returns the miss rate given the confusion matrix"""
+    total = confusion.sum()
+    return float(confusion[0, 1] + confusion[1, 0]) / total if total > 0 else 0.0
+
+def evaluate_batches(batches : Iterable[Tuple[list, list]]) -> np.ndarray:
+    """Accumulates the confusion matrix over a stream of (actual labels, classified labels) pairs"""
+    confusion = np.zeros((2, 2), dtype=np.int64)
+    for (actual_labels, classified_labels) in batches:
+        confusion += confusion_matrix(actual_labels, classified_labels)
+    return confusion
+
+def evaluate_classifier(classify : Callable[[list], list],
+                        data : Iterable[Tuple[np.ndarray, np.ndarray]],
+                        batch_size : int = 10_000) -> np.ndarray:
+    """Classifies a stream of (features, labels) chunks in batches of at most batch_size samples
+    and returns the confusion matrix of the results.
+    classify takes a list of samples and returns the list of their labels, for example,
+    lambda samples: ClassifyAngularData.simulate(samples=samples, parameters=parameters, bias=bias)
+    """
+    def classified_batches():
+        for (features, labels) in data:
+            features = np.asarray(features)
+            labels = np.asarray(labels)
+            for start in range(0, len(labels), batch_size):
+                batch = features[start : start + batch_size]
+                yield (labels[start : start + batch_size], classify(batch.tolist()))
+    return evaluate_batches(classified_batches())
@@ -0,0 +1,155 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""Evaluation and plotting of the decision boundary of a trained classifier on a 2D grid.
+
+Classifying every point of a dense uniform grid is expensive, since each point requires
+an estimate of the classification probability over many measurements.
+Instead, the grid is refined adaptively, quadtree-style: it starts with a coarse grid,
+and only the cells with corners classified differently (the cells the boundary goes through)
+are split into four, until the finest resolution is reached. Cells with all corners in the same class
+are filled with that class without classifying the points inside them, so the number of classifier
+evaluations grows with the length of the boundary rather than with the area of the grid.
+This assumes that the classes don't have features smaller than a coarse grid cell.
+
+The points are classified in chunks, which are processed in parallel by worker processes,
+and the results are cached, so re-evaluating the boundary at a higher resolution reuses them.
+
+Example:
+
+    boundary = evaluate_boundary("Microsoft.Quantum.Kata.QuantumClassification.ClassifyLinearlySeparableModel",
+                                 (0, 1), (0, 1), parameters = parameters, bias = bias,
+                                 tolerance = 0.0005, nMeasurements = 10_000)
+    plot_boundary(boundary)
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from hyperparameter_search import Routine, resolve
+
+# ------------------------------------------------------
+def classify_chunk(job : Tuple[Routine, List[List[float]], Dict]) -> List[int]:
+    """Classifies one chunk of points. Runs in a worker process."""
+    (classify, samples, kwargs) = job
+    return list(resolve(classify)(samples = samples, **kwargs))
+
+def classify_points(classify : Routine, points : List[Tuple[float, float]], kwargs : Dict,
+                    batch_size : int, pool : ProcessPoolExecutor = None) -> List[int]:
+    """Classifies the points in chunks of at most batch_size, in parallel if a process pool is given"""
+    jobs = [(classify, [list(point) for point in points[start : start + batch_size]], kwargs)
+            for start in range(0, len(points), batch_size)]
+    chunks = pool.map(classify_chunk, jobs) if pool is not None else map(classify_chunk, jobs)
+    return [label for chunk in chunks for label in chunk]
+
+# ------------------------------------------------------
+def evaluate_boundary(classify : Routine, x_range : Tuple[float, float], y_range : Tuple[float, float],
+                      initial_resolution : int = 8, max_depth : int = 5,
+                      batch_size : int = 1_000, max_workers : int = 0,
+                      cache : Dict[Tuple[float, float], int] = None, **kwargs) -> Dict:
+    """Classifies the points of a grid over x_range x y_range, refining it adaptively near the decision boundary.
+
+    The grid starts with initial_resolution x initial_resolution cells, and each cell the boundary goes through
+    is split up to max_depth times, so the finest resolution is initial_resolution * 2^max_depth cells per side.
+    classify is the fully qualified name of a Q# classification operation or a picklable Python function;
+    it is called with samples = a chunk of points and the remaining keyword arguments (such as parameters and bias).
+    max_workers is the number of worker processes classifying the chunks in parallel (0 to classify in this process).
+    cache maps the points classified before to their labels; it is updated with the newly classified points,
+    so passing the same dictionary to several calls with the same classifier avoids re-classifying the points.
+
+    Returns a dictionary with the grid coordinates 'x' and 'y', the 'labels' array with a row per y coordinate,
+    and the statistics: 'evaluations' (the number of points classified), 'cache_hits',
+    and 'uniform_evaluations' (the number of points a uniform grid of the same resolution would classify).
+    """
+    if initial_resolution < 1 or max_depth < 0:
+        raise ValueError("initial_resolution must be positive and max_depth non-negative")
+    cache = {} if cache is None else cache
+    n = initial_resolution * 2 ** max_depth
+    # Computing the coordinates as x0 + (x1 - x0) * i / n gives the same floating-point value for the same point
+    # on grids of different resolution (doubling both i and n is exact), so the cache can be shared between them
+    xs = [x_range[0] + (x_range[1] - x_range[0]) * i / n for i in range(n + 1)]
+    ys = [y_range[0] + (y_range[1] - y_range[0]) * j / n for j in range(n + 1)]
+    labels = {}
+    stats = { 'evaluations' : 0, 'cache_hits' : 0 }
+
+    def label_all(nodes, pool):
+        missing = []
+        for node in nodes:
+            if node in labels:
+                continue
+            point = (xs[node[0]], ys[node[1]])
+            if point in cache:
+                labels[node] = cache[point]
+                stats['cache_hits'] += 1
+            else:
+                missing.append(node)
+        missing = list(dict.fromkeys(missing))
+        results = classify_points(classify, [(xs[i], ys[j]) for (i, j) in missing], kwargs, batch_size, pool)
+        if len(results) != len(missing):
+            raise RuntimeError(f"The classifier returned {len(results)} labels for {len(missing)} samples")
+        for (node, label) in zip(missing, results):
+            labels[node] = int(label)
+            cache[(xs[node[0]], ys[node[1]])] = int(label)
+        stats['evaluations'] += len(missing)
+
+    def corners(cell):
+        (i, j, size) = cell
+        return [(i, j), (i + size, j), (i, j + size), (i + size, j + size)]
+
+    # Each cell is (i, j, size): its lower left corner in grid steps and its side length
+    size = 2 ** max_depth
+    cells = [(i, j, size) for i in range(0, n, size) for j in range(0, n, size)]
+    uniform_cells = []
+    pool = ProcessPoolExecutor(max_workers = max_workers, mp_context = multiprocessing.get_context('spawn')) \
+           if max_workers else None
+    try:
+        while cells:
+            label_all([node for cell in cells for node in corners(cell)], pool)
+            split = []
+            for cell in cells:
+                cell_labels = set(labels[node] for node in corners(cell))
+                if len(cell_labels) == 1:
+                    uniform_cells.append((cell, cell_labels.pop()))
+                elif cell[2] > 1:
+                    (i, j, size) = cell
+                    half = size // 2
+                    split += [(i, j, half), (i + half, j, half), (i, j + half, half), (i + half, j + half, half)]
+            cells = split
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    # Fill the cells with all corners in the same class, then put in the labels of all the points classified explicitly
+    grid = np.zeros((n + 1, n + 1), dtype=np.int8)
+    for ((i, j, size), label) in uniform_cells:
+        grid[j : j + size + 1, i : i + size + 1] = label
+    for ((i, j), label) in labels.items():
+        grid[j, i] = label
+
+    return dict(stats, x = np.array(xs), y = np.array(ys), labels = grid, uniform_evaluations = (n + 1) ** 2)
+
+# ------------------------------------------------------
+def plot_boundary(boundary : Dict, features : list = None, actual_labels : list = None, ax = None):
+    """Plots the classes regions and the decision boundary evaluated by evaluate_boundary,
+    optionally with the samples on top of them, colored by their actual labels.
+    """
+    from matplotlib import pyplot
+
+    if ax is None:
+        ax = pyplot.figure(figsize=(8, 8)).add_subplot(111)
+    (x, y) = np.meshgrid(boundary['x'], boundary['y'])
+    ax.contourf(x, y, boundary['labels'], levels = [-0.5, 0.5, 1.5], colors = ['blue', 'red'], alpha = 0.2)
+    ax.contour(x, y, boundary['labels'], levels = [0.5], colors = 'gray')
+    if features is not None:
+        samples = np.asarray(features)
+        labels = np.asarray(actual_labels)
+        for (label, color) in [(0, 'blue'), (1, 'red')]:
+            mask = labels == label
+            ax.scatter(samples[mask, 0], samples[mask, 1], c = color, marker = '.', label = f"Class {label}")
+        ax.legend()
+    ax.set_title(f"Decision boundary: {boundary['evaluations']} points classified "
+                 f"(uniform grid: {boundary['uniform_evaluations']})")
+    return ax
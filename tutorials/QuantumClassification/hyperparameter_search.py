@@ -0,0 +1,163 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""Parallel multi-start hyperparameter search for the classifiers trained in the quantum classification tutorials.
+
+Training a classifier from a single starting point often ends in a poor local optimum,
+and running restarts one after another takes too long. This module runs many training jobs
+with different initial parameters, tolerances and measurement counts in worker processes.
+
+The search uses successive halving: all jobs are trained for the first (small) number of epochs
+and validated, and only the best fraction of them continues training, starting from the parameters
+found so far, for the next number of epochs. Losing runs are thus stopped early, and most of the
+training budget goes to the promising ones.
+
+Example:
+
+    (parameters, bias, table) = search(training_data, validation_data,
+                                       initial_parameters = random_initial_parameters(16, 1, seed = 42),
+                                       tolerances = [0.0005, 0.005], n_measurements = [1_000, 10_000])
+"""
+
+import importlib
+import itertools
+import math
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+
+from classification_data import miss_rate
+
+# The Q# operations used by default; see Backend.qs
+DEFAULT_TRAIN_OPERATION = "Microsoft.Quantum.Kata.QuantumClassification.TrainLinearlySeparableModelWithOptions"
+DEFAULT_CLASSIFY_OPERATION = "Microsoft.Quantum.Kata.QuantumClassification.ClassifyLinearlySeparableModel"
+
+# A training or classification routine: either the fully qualified name of a Q# operation,
+# or a top-level Python function that takes the same keyword arguments (it has to be picklable to run in a worker process)
+Routine = Union[str, Callable]
+
+# ------------------------------------------------------
+def random_initial_parameters(count : int, parameters_number : int, seed = None,
+                              low : float = 0.0, high : float = 2 * math.pi) -> List[List[float]]:
+    """Generates count random starting points for training, each of them a list of parameters_number rotation angles"""
+    rng = np.random.default_rng(seed)
+    return rng.uniform(low, high, (count, parameters_number)).tolist()
+
+def resolve(routine : Routine) -> Callable:
+    """Returns a Python function for the given routine.
+    Q# operations are imported by name in the worker process; the imported namespaces are cached,
+    so each worker loads them only once.
+    """
+    if not isinstance(routine, str):
+        return routine
+    import qsharp  # noqa: F401 -- registers the import hook for Q# namespaces
+    (namespace, name) = routine.rsplit('.', 1)
+    return getattr(importlib.import_module(namespace), name).simulate
+
+# ------------------------------------------------------
+def run_job(job : Dict) -> Dict:
+    """Trains a model for one job for the job's number of epochs and validates it. Runs in a worker process."""
+    start = time.perf_counter()
+    result = dict(job)
+    try:
+        train = resolve(job['train'])
+        classify = resolve(job['classify'])
+        (parameters, bias) = train(
+            trainingVectors = job['training_features'],
+            trainingLabels = job['training_labels'],
+            initialParameters = [job['start_parameters']],
+            learningRate = job['learning_rate'],
+            tolerance = job['tolerance'],
+            nMeasurements = job['n_measurements'],
+            maxEpochs = job['new_epochs']
+        )
+        classified_labels = classify(
+            samples = job['validation_features'],
+            parameters = parameters, bias = bias,
+            tolerance = job['tolerance'], nMeasurements = job['n_measurements']
+        )
+        result.update(parameters = list(parameters), bias = bias,
+                      miss_rate = miss_rate(job['validation_labels'], classified_labels), status = 'trained')
+    except Exception as e:
+        result.update(parameters = None, bias = None, miss_rate = math.inf, status = f'failed: {e}')
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+def search(training_data : Dict[str, list], validation_data : Dict[str, list],
+           initial_parameters : Sequence[Sequence[float]],
+           tolerances : Sequence[float] = (0.0005,),
+           n_measurements : Sequence[int] = (10_000,),
+           learning_rates : Sequence[float] = (2.0,),
+           epochs : Sequence[int] = (4, 16),
+           keep_fraction : float = 0.25,
+           max_workers : int = None,
+           train : Routine = DEFAULT_TRAIN_OPERATION,
+           classify : Routine = DEFAULT_CLASSIFY_OPERATION) -> Tuple[List[float], float, List[Dict]]:
+    """Runs a training job for every combination of the initial parameters, tolerances, measurement counts
+    and learning rates, and returns the best (parameters, bias) by validation miss rate, together with the full result table.
+
+    epochs lists the cumulative training budget of each round of successive halving: after each round except the last,
+    only the keep_fraction of the runs with the lowest validation miss rate (but at least one) continue training.
+    The result table has one row per job and round, with the job settings, the trained parameters and bias,
+    the validation miss rate, the time it took, and the status of the run ('trained', 'stopped' for runs that didn't
+    make it to the next round, 'best', or the failure message).
+    """
+    if not epochs or any(b <= a for (a, b) in zip(epochs, epochs[1:])):
+        raise ValueError("epochs must be a non-empty increasing sequence")
+    if not 0 < keep_fraction <= 1:
+        raise ValueError("keep_fraction must be between 0 and 1")
+
+    shared = {
+        'train' : train, 'classify' : classify,
+        'training_features' : list(training_data['Features']), 'training_labels' : list(training_data['Labels']),
+        'validation_features' : list(validation_data['Features']), 'validation_labels' : list(validation_data['Labels']),
+    }
+    runs = [
+        dict(shared, job = job, start_parameters = list(start), tolerance = tolerance,
+             n_measurements = measurements, learning_rate = rate)
+        for (job, (start, tolerance, measurements, rate))
+        in enumerate(itertools.product(initial_parameters, tolerances, n_measurements, learning_rates))
+    ]
+    if not runs:
+        raise ValueError("The search needs at least one initial parameters guess")
+
+    table = []
+    done = 0
+    # Q# operations run through a connection to the IQ# kernel, which must not be shared with forked processes
+    with ProcessPoolExecutor(max_workers = max_workers, mp_context = multiprocessing.get_context('spawn')) as pool:
+        for (stage, total) in enumerate(epochs):
+            for run in runs:
+                run.update(round = stage, epochs = total, new_epochs = total - done)
+            results = list(pool.map(run_job, runs))
+            done = total
+            results.sort(key = lambda result: result['miss_rate'])
+            keep = max(1, math.ceil(len(results) * keep_fraction)) if stage < len(epochs) - 1 else len(results)
+            for (rank, result) in enumerate(results):
+                if rank >= keep and result['status'] == 'trained':
+                    result['status'] = 'stopped'
+                table.append(result)
+            # Surviving runs continue training from the parameters they have reached
+            runs = [dict(result, start_parameters = result['parameters'])
+                    for result in results[:keep] if result['status'] == 'trained']
+            if not runs:
+                break
+
+    table = [{key : value for (key, value) in row.items() if key not in shared and key != 'new_epochs'} for row in table]
+    finished = [row for row in table if row['status'] == 'trained' and row['round'] == len(epochs) - 1]
+    if not finished:
+        raise RuntimeError("All training runs failed: " + "; ".join(sorted(set(row['status'] for row in table))))
+    best = min(finished, key = lambda row: row['miss_rate'])
+    best['status'] = 'best'
+    return (best['parameters'], best['bias'], table)
+
+def format_table(table : List[Dict]) -> str:
+    """Formats the search result table as text, one row per job and round"""
+    lines = ["  job  round  epochs  tolerance  nMeasurements  learning rate  miss rate  seconds  status"]
+    for row in table:
+        lines.append(f"{row['job']:>5}  {row['round']:>5}  {row['epochs']:>6}  {row['tolerance']:>9g}  "
+                     f"{row['n_measurements']:>13}  {row['learning_rate']:>13g}  {row['miss_rate']:>9.2%}  "
+                     f"{row['seconds']:>7.1f}  {row['status']}")
+    return "\n".join(lines)
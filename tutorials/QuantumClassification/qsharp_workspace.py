@@ -0,0 +1,77 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""Loads the Q# workspace of a Python notebook (the Q# files and the project of the notebook's folder),
+skipping the package resolution and the recompilation when the kernel has already compiled the current workspace.
+
+Starting the IQ# kernel already compiles the workspace and loads the packages the project references
+(the project sets IQSharpLoadAutomatically), so adding those packages and calling qsharp.reload() at the start
+of a notebook only repeats that work. load_workspace() does it only if it is needed: the kernel remembers
+the hash of the sources it compiled, taken when this module is imported (the notebook imports qsharp, which starts
+the kernel, just before it) and updated whenever load_workspace() recompiles. If the sources still match it and
+no requested package is missing, the workspace is used as it is; otherwise the missing packages are added
+and the workspace is recompiled.
+"""
+
+import glob
+import hashlib
+import os
+import re
+import time
+from typing import Dict, List, Sequence
+
+FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+def source_files(folder : str = FOLDER) -> List[str]:
+    """Returns the files that the compiled workspace depends on: the Q# files and the project files of the folder,
+    and the global.json of the repository, which pins the version of the QDK
+    """
+    files = sorted(glob.glob(os.path.join(folder, "*.qs")) + glob.glob(os.path.join(folder, "*.csproj")))
+    parent = folder
+    while os.path.dirname(parent) != parent:
+        parent = os.path.dirname(parent)
+        if os.path.exists(os.path.join(parent, "global.json")):
+            files.append(os.path.join(parent, "global.json"))
+            break
+    return files
+
+def sources_hash(folder : str = FOLDER) -> str:
+    """Returns the hash of the files that the compiled workspace depends on"""
+    h = hashlib.sha256()
+    for path in source_files(folder):
+        h.update(os.path.basename(path).encode() + b"\0")
+        with open(path, "rb") as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+def project_packages(folder : str = FOLDER) -> List[str]:
+    """Returns the names of the packages referenced by the project files of the folder"""
+    packages = []
+    for path in glob.glob(os.path.join(folder, "*.csproj")):
+        with open(path, encoding = "utf-8-sig") as f:
+            packages += re.findall(r'<PackageReference\s+Include="([^"]+)"', f.read())
+    return packages
+
+def load_workspace(packages : Sequence[str] = (), force : bool = False) -> Dict:
+    """Makes the Q# workspace of the folder and the given packages available to the notebook,
+    recompiling the workspace only if it changed since this kernel compiled it (or if force is set).
+    Returns a dictionary that says whether the 'cached' workspace was used, and how many 'seconds' loading took.
+    """
+    import qsharp
+
+    started = time.perf_counter()
+    sources = sources_hash()
+    # The packages referenced by the project are loaded with it; the ones added to the kernel are listed as "name::version"
+    loaded = set(project_packages()) | set(str(package).split("::")[0] for package in qsharp.packages)
+    missing = [package for package in packages if package not in loaded]
+    if not force and not missing and kernel_workspace["sources"] == sources:
+        return { "cached" : True, "seconds" : time.perf_counter() - started }
+
+    for package in missing:
+        qsharp.packages.add(package)
+    qsharp.reload()
+    kernel_workspace["sources"] = sources
+    return { "cached" : False, "seconds" : time.perf_counter() - started }
+
+# The hash of the sources which this kernel compiled
+kernel_workspace = { "sources" : sources_hash() }
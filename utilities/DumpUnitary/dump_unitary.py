@@ -0,0 +1,262 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+"""Python version of the DumpUnitary tool, which extracts the unitary implemented by a Q# operation
+and its pattern of zero and non-zero elements, as used in the UnitaryPatterns kata.
+
+The unitary is obtained column by column: the operation is applied to each basis state in turn,
+and the resulting state is dumped with DumpMachine. All columns are extracted in a single simulation,
+and the amplitudes go straight from the simulator diagnostics into a complex128 NumPy array,
+so, unlike Driver.cs, the extraction isn't limited to 3 qubits (10 qubits take a 1024 x 1024 matrix).
+The pattern is stored bit-packed: one bit per element, 1 for 'X' and 0 for '.'.
+The same bridge returns the state prepared by an operation (extract_state), optionally restricted
+to a subset of its qubits, for the notebooks that inspect quantum states.
+The real and imaginary parts of the amplitudes are written straight into the memory of the array,
+without parsing strings or creating a Python complex number per amplitude.
+
+The rows and the columns are ordered as described in the kata (little-endian), and, as with Driver.cs,
+the relative phase between the columns is not preserved.
+
+Usage from Python (for example, a Python notebook), in the folder that contains the Q# code of the operation:
+
+    import dump_unitary
+    matrix = dump_unitary.extract_unitary("Quantum.Kata.UnitaryPatterns.MainDiagonal", 3)
+    pattern = dump_unitary.unitary_pattern(matrix)
+    print("\\n".join(dump_unitary.pattern_lines(pattern, len(matrix))))
+    state = dump_unitary.extract_state("Quantum.Kata.Superposition.AllBasisVectorsSuperposition", 3, qubits = [0])
+
+Or from the command line:
+
+    python dump_unitary.py Quantum.DumpUnitaryTest.BlockDiagonalUnitary 3 --expected ../DumpUnitaryTest/BlockDiagonalPattern.txt
+"""
+
+import argparse
+import itertools
+import sys
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+# The square of the absolute value of the amplitude has to be less than or equal to eps to be considered 0
+EPS = 1E-5
+
+# ------------------------------------------------------
+def columns_program(operation : str, n : int) -> str:
+    """Returns the Q# code of an operation that applies the given operation to each basis state
+    of n qubits in turn (in the order of the columns of the unitary) and dumps the resulting state.
+    """
+    return f"""
+        open Microsoft.Quantum.Intrinsic;
+        open Microsoft.Quantum.Diagnostics;
+
+        operation DumpUnitaryColumns() : Unit {{
+            use qs = Qubit[{n}];
+            for column in 0 .. (1 <<< {n}) - 1 {{
+                // Prepare the basis state |column⟩ in little-endian encoding
+                for i in 0 .. {n} - 1 {{
+                    if ((column >>> i) &&& 1) == 1 {{
+                        X(qs[i]);
+                    }}
+                }}
+                {operation}(qs);
+                DumpMachine();
+                ResetAll(qs);
+            }}
+        }}
+    """
+
+def amplitude_parts(amplitudes : Sequence) -> Iterator[float]:
+    """Yields the real and imaginary parts of the amplitudes of a state dump, in turn.
+    The format of the amplitudes (dictionaries, pairs or numbers) is detected once, from the first one.
+    """
+    if len(amplitudes) == 0:
+        return iter(())
+    first = amplitudes[0]
+    if isinstance(first, dict):
+        (real, imag) = ('Real', 'Imaginary') if 'Real' in first else ('real', 'imag')
+        return itertools.chain.from_iterable((a[real], a[imag]) for a in amplitudes)
+    if isinstance(first, (list, tuple)):
+        return itertools.chain.from_iterable((a[0], a[1]) for a in amplitudes)
+    return itertools.chain.from_iterable((a.real, a.imag) for a in amplitudes)
+
+def state_from_diagnostic(diagnostic : Dict, size : int, out : np.ndarray = None) -> np.ndarray:
+    """Reads the amplitudes of a DumpMachine diagnostic into a contiguous complex128 array of the given size
+    (or into out, which must be a contiguous complex128 array of that size).
+    The amplitudes can be given as a list indexed by basis state, or as a dictionary keyed by basis state
+    (in which case the basis states which aren't listed have zero amplitude).
+    The parts of the amplitudes are written straight into the array, without creating a Python complex number per amplitude.
+    """
+    state = np.empty(size, dtype=np.complex128) if out is None else out
+    # The same memory, seen as pairs of (real, imaginary) float64 values
+    parts = state.view(np.float64).reshape(size, 2)
+    amplitudes = diagnostic['amplitudes']
+    if isinstance(amplitudes, dict):
+        state[:] = 0
+        if amplitudes:
+            indices = np.fromiter(amplitudes.keys(), dtype=np.int64, count=len(amplitudes))
+            values = list(amplitudes.values())
+            parts[indices] = np.fromiter(amplitude_parts(values), dtype=np.float64, count=2 * len(values)).reshape(-1, 2)
+    else:
+        if len(amplitudes) != size:
+            raise ValueError(f"Expected a state of {size} amplitudes, got {len(amplitudes)}")
+        parts.reshape(-1)[:] = np.fromiter(amplitude_parts(amplitudes), dtype=np.float64, count=2 * size)
+    return state
+
+def state_dumps(diagnostics : List) -> List[Dict]:
+    """Returns the DumpMachine diagnostics among the captured diagnostics"""
+    return [d for d in diagnostics if isinstance(d, dict) and 'amplitudes' in d]
+
+def matrix_from_diagnostics(diagnostics : List[Dict], n : int) -> np.ndarray:
+    """Assembles the unitary from the state dumps of its columns, in order"""
+    size = 1 << n
+    states = state_dumps(diagnostics)
+    if len(states) != size:
+        raise ValueError(f"Expected {size} state dumps, got {len(states)}")
+    # Each column is read into a contiguous row of the transposed matrix, which is transposed back once at the end
+    columns = np.empty((size, size), dtype=np.complex128)
+    for (index, diagnostic) in enumerate(states):
+        state_from_diagnostic(diagnostic, size, columns[index])
+    return np.ascontiguousarray(columns.T)
+
+def extract_unitary(operation : str, n : int) -> np.ndarray:
+    """Returns the matrix of the unitary implemented by the Q# operation on n qubits.
+    operation is the (fully qualified or opened) name of an operation that takes a Qubit[] argument.
+    """
+    if n < 1:
+        raise ValueError("The number of qubits must be positive")
+    import qsharp
+
+    program = qsharp.compile(columns_program(operation, n))
+    with qsharp.capture_diagnostics() as diagnostics:
+        program.simulate()
+    return matrix_from_diagnostics(diagnostics, n)
+
+# ------------------------------------------------------
+def state_program(operation : str, n : int) -> str:
+    """Returns the Q# code of an operation that applies the given operation to n qubits in the |0...0⟩ state
+    and dumps the resulting state.
+    """
+    return f"""
+        open Microsoft.Quantum.Intrinsic;
+        open Microsoft.Quantum.Diagnostics;
+
+        operation DumpPreparedState() : Unit {{
+            use qs = Qubit[{n}];
+            {operation}(qs);
+            DumpMachine();
+            ResetAll(qs);
+        }}
+    """
+
+def restrict_state(state : np.ndarray, n : int, qubits : Sequence[int], eps : float = EPS) -> np.ndarray:
+    """Returns the state of the given qubits of an n-qubit state, in little-endian order of the qubits as listed
+    (qubits[0] is the least significant bit of the index). The global phase is taken from the full state.
+    Raises ValueError if the qubits are entangled with the rest of the register, since they don't have a state of their own.
+    """
+    state = np.asarray(state, dtype=np.complex128)
+    if len(set(qubits)) != len(qubits) or any(q < 0 or q >= n for q in qubits):
+        raise ValueError(f"The qubits {list(qubits)} must be distinct indices of a register of {n} qubits")
+    # Qubit q is the axis n - 1 - q of the state seen as an n-dimensional 2 x ... x 2 array (C order is big-endian)
+    kept = [n - 1 - q for q in reversed(qubits)]
+    rest = [axis for axis in range(n) if axis not in kept]
+    amplitudes = state.reshape((2,) * n).transpose(kept + rest).reshape(1 << len(qubits), -1)
+    # The qubits are not entangled with the rest if the amplitudes are the outer product of the two parts' states
+    column = np.argmax(np.einsum('ij,ij->j', amplitudes, amplitudes.conj()).real)
+    restricted = amplitudes[:, column] / np.linalg.norm(amplitudes[:, column])
+    remainder = restricted.conj() @ amplitudes
+    if np.max(np.abs(amplitudes - np.outer(restricted, remainder)) ** 2) > eps:
+        raise ValueError(f"The qubits {list(qubits)} are entangled with the rest of the register")
+    return np.ascontiguousarray(restricted)
+
+def extract_state(operation : str, n : int, qubits : Sequence[int] = None) -> np.ndarray:
+    """Returns the state vector prepared by the Q# operation from the |0...0⟩ state of n qubits,
+    as a contiguous complex128 array in little-endian order, or the state of the given qubits only.
+    operation is the (fully qualified or opened) name of an operation that takes a Qubit[] argument.
+    """
+    if n < 1:
+        raise ValueError("The number of qubits must be positive")
+    import qsharp
+
+    program = qsharp.compile(state_program(operation, n))
+    with qsharp.capture_diagnostics() as diagnostics:
+        program.simulate()
+    states = state_dumps(diagnostics)
+    if len(states) != 1:
+        raise ValueError(f"Expected 1 state dump, got {len(states)}")
+    state = state_from_diagnostic(states[0], 1 << n)
+    return state if qubits is None else restrict_state(state, n, qubits)
+
+# ------------------------------------------------------
+def unitary_pattern(matrix : np.ndarray, eps : float = EPS) -> np.ndarray:
+    """Returns the bit-packed pattern of the matrix: bit j of row i (in np.packbits order) is set
+    if the square of the absolute value of element [i][j] is greater than eps
+    """
+    matrix = np.asarray(matrix)
+    return np.packbits(matrix.real ** 2 + matrix.imag ** 2 > eps, axis=1)
+
+def unpack_pattern(pattern : np.ndarray, size : int) -> np.ndarray:
+    """Returns the pattern as a size x size Boolean array"""
+    return np.unpackbits(pattern, axis=1, count=size).astype(bool)
+
+def read_pattern(path : str) -> Tuple[np.ndarray, int]:
+    """Reads a pattern file such as BlockDiagonalPattern.txt (rows of 'X' and '.')
+    and returns the bit-packed pattern and its size
+    """
+    with open(path, 'rb') as f:
+        rows = [row for row in f.read().lstrip(b'\xef\xbb\xbf').split() if row]
+    size = len(rows)
+    if any(len(row) != size for row in rows):
+        raise ValueError(f"The pattern in {path} is not square")
+    cells = np.frombuffer(b''.join(rows), dtype=np.uint8).reshape(size, size)
+    if not np.all((cells == ord('X')) | (cells == ord('.'))):
+        raise ValueError(f"The pattern in {path} must consist of 'X' and '.' characters")
+    return (np.packbits(cells == ord('X'), axis=1), size)
+
+def pattern_lines(pattern : np.ndarray, size : int) -> List[str]:
+    """Returns the rows of the pattern as strings of 'X' and '.', for printing or writing to a file"""
+    cells = np.where(unpack_pattern(pattern, size), ord('X'), ord('.')).astype(np.uint8)
+    return [row.tobytes().decode('ascii') for row in cells]
+
+def pattern_mismatches(actual : np.ndarray, expected : np.ndarray, size : int) -> List[Tuple[int, int]]:
+    """Returns the (row, column) positions at which two bit-packed patterns of the same size differ"""
+    if actual.shape != expected.shape:
+        raise ValueError(f"Can't compare patterns of shapes {actual.shape} and {expected.shape}")
+    differences = unpack_pattern(np.bitwise_xor(actual, expected), size)
+    return [(int(i), int(j)) for (i, j) in np.argwhere(differences)]
+
+# ------------------------------------------------------
+def main() -> int:
+    parser = argparse.ArgumentParser(description = "Dumps the unitary implemented by a Q# operation and its pattern.")
+    parser.add_argument("operation", help = "the name of the operation, which takes a Qubit[] argument")
+    parser.add_argument("n", type = int, help = "the number of qubits on which the unitary acts")
+    parser.add_argument("--expected", help = "a pattern file to compare the pattern with, such as BlockDiagonalPattern.txt")
+    parser.add_argument("--pattern-output", default = "DumpUnitaryPattern.txt", help = "the file to write the pattern to")
+    parser.add_argument("--matrix-output", default = "DumpUnitary.npy", help = "the file to write the matrix to (NumPy format)")
+    parser.add_argument("--eps", type = float, default = EPS, help = "the threshold below which the elements are considered 0")
+    args = parser.parse_args()
+
+    matrix = extract_unitary(args.operation, args.n)
+    pattern = unitary_pattern(matrix, args.eps)
+    size = len(matrix)
+    np.save(args.matrix_output, matrix)
+    lines = pattern_lines(pattern, size)
+    with open(args.pattern_output, 'w') as f:
+        f.write("\n".join(lines) + "\n")
+    print("Unitary pattern:")
+    print("\n".join(lines))
+
+    if args.expected is not None:
+        (expected, expected_size) = read_pattern(args.expected)
+        if expected_size != size:
+            print(f"The expected pattern is {expected_size} x {expected_size}, but the unitary is {size} x {size}")
+            return 1
+        mismatches = pattern_mismatches(pattern, expected, size)
+        if mismatches:
+            print(f"The pattern differs from {args.expected} in {len(mismatches)} elements, for example, at (row, column) "
+                  + ", ".join(str(position) for position in mismatches[:10]))
+            return 1
+        print(f"The pattern matches {args.expected}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+"""Statistical tests for the katas and tutorials with probabilistic outcomes,
+such as RandomNumberGeneration, Measurements and CHSHGame.
+
+The outcomes are sampled in batches: a batch of shots is a single simulation of a Q# operation
+that runs the tested expression (or calls the tested operation) in a loop and returns the array of outcomes,
+instead of a separate simulate() call (and a round trip to the simulator) per shot.
+qsharp_sampler() samples an expression, such as a call to an operation without qubit parameters;
+operation_sampler() samples a Q# operation which allocates, prepares and measures its own qubits on every shot,
+as the tests of the Measurements and CHSHGame katas need.
+The outcomes of each batch are added to a fixed-size histogram of counts, and after each batch
+the histogram is tested against the expected distribution with a sequential stopping rule:
+
+  * the test fails as soon as an outcome that should never happen is observed,
+    or the chi-square test rejects the expected distribution;
+  * the test passes as soon as the Kolmogorov-Smirnov distance between the observed and the expected
+    distribution is at most tolerance / 2, and the Dvoretzky-Kiefer-Wolfowitz bound guarantees that
+    the true distance is within another tolerance / 2 of it (so the sampled distribution is within
+    tolerance of the expected one, in KS distance);
+  * otherwise, the batches keep doubling in size until max_shots or the time budget is reached,
+    and the result is inconclusive.
+
+The significance level is split evenly between all the looks at the data that the schedule allows,
+so a correct implementation fails with probability at most 1 - confidence.
+
+Example:
+
+    sampler = qsharp_sampler("Quantum.Kata.RandomNumberGeneration.RandomNBits(3)", "Int")
+    result = sequential_test(sampler, uniform(8), confidence = 0.999, tolerance = 0.02)
+    print(format_result(result))
+"""
+
+import math
+import re
+import time
+from typing import Callable, Dict, Sequence
+
+import numpy as np
+
+# Converts the outcome of each shot to an integer, by the Q# type of the tested expression
+CONVERSIONS = {
+    'Int' : "{0}",
+    'Bool' : "({0}) ? 1 | 0",
+    'Result' : "ResultAsBool({0}) ? 1 | 0",
+    'Bool[]' : "BoolArrayAsInt({0})",
+    'Result[]' : "ResultArrayAsInt({0})",
+}
+
+# A sampler takes the number of shots and returns the array of their outcomes
+Sampler = Callable[[int], np.ndarray]
+
+# ------------------------------------------------------
+def shots_program(expression : str, returns : str, opens : Sequence[str] = ()) -> str:
+    """Returns the Q# code of an operation RunShots(shots : Int) : Int[] that evaluates the expression once per shot"""
+    if returns not in CONVERSIONS:
+        raise ValueError(f"Unsupported outcome type {returns}, expected one of {', '.join(CONVERSIONS)}")
+    header = "\n".join(f"open {namespace};" for namespace in ("Microsoft.Quantum.Convert", *opens))
+    outcome = CONVERSIONS[returns].format(expression)
+    return f"""
+        {header}
+
+        operation RunShots(shots : Int) : Int[] {{
+            mutable outcomes = [0, size = shots];
+            for shot in 0 .. shots - 1 {{
+                set outcomes w/= shot <- {outcome};
+            }}
+            return outcomes;
+        }}
+    """
+
+def qsharp_sampler(expression : str, returns : str, opens : Sequence[str] = ()) -> Sampler:
+    """Compiles a Q# operation that evaluates the expression (of type Int, Bool, Result, Bool[] or Result[])
+    for a whole batch of shots in one simulation, and returns the sampler that runs it.
+    The expression can call the operations of the Q# files in the current folder, for example,
+    "Quantum.Kata.RandomNumberGeneration.RandomNBits(3)".
+    """
+    import qsharp
+
+    operation = qsharp.compile(shots_program(expression, returns, opens))
+    return lambda shots: np.asarray(operation.simulate(shots = shots), dtype = np.int64)
+
+def operation_sampler(operation : str, returns : str, opens : Sequence[str] = ()) -> Sampler:
+    """Compiles the Q# code of an operation without parameters (returning Int, Bool, Result, Bool[] or Result[])
+    and returns the sampler that calls it once per shot, for a whole batch of shots in one simulation.
+    The operation can allocate, prepare and measure qubits; it must reset them before releasing them.
+    For example, for the Measurements kata:
+
+        operation Sample() : Bool {
+            use q = Qubit();
+            H(q);
+            let outcome = Quantum.Kata.Measurements.IsQubitPlusOrZero(q);
+            Reset(q);
+            return outcome;
+        }
+    """
+    import qsharp
+
+    name = re.search(r"\boperation\s+(\w+)", operation)
+    if name is None:
+        raise ValueError("Expected the Q# code of an operation")
+    # The operation is compiled on its own, so that the batch operation can call it by name
+    qsharp.compile("\n".join(f"open {namespace};" for namespace in opens) + "\n" + operation)
+    return qsharp_sampler(f"{name.group(1)}()", returns)
+
+# ------------------------------------------------------
+# Expected distributions
+
+def uniform(outcomes : int) -> np.ndarray:
+    return np.full(outcomes, 1 / outcomes)
+
+def bernoulli(p : float) -> np.ndarray:
+    """The distribution of an outcome which is 1 with probability p and 0 otherwise"""
+    return np.array([1 - p, p])
+
+def uniform_range(min : int, max : int) -> np.ndarray:
+    """The distribution of a number from min to max inclusive, with the outcomes counted from 0"""
+    return uniform(max - min + 1)
+
+# ------------------------------------------------------
+def chi_square_p_value(counts : np.ndarray, probabilities : np.ndarray) -> float:
+    """Returns the p-value of the chi-square goodness of fit test of the counts against the probabilities
+    (the outcomes with probability 0 are left out; they are checked separately)
+    """
+    possible = probabilities > 0
+    total = counts.sum()
+    expected = total * probabilities[possible]
+    statistic = float(np.sum((counts[possible] - expected) ** 2 / expected))
+    degrees = int(np.count_nonzero(possible)) - 1
+    if degrees <= 0:
+        return 1.0
+    return regularized_upper_gamma(degrees / 2, statistic / 2)
+
+def regularized_upper_gamma(a : float, x : float) -> float:
+    """Q(a, x) = Γ(a, x) / Γ(a), evaluated by its series for x < a + 1 and by its continued fraction otherwise"""
+    if x <= 0:
+        return 1.0
+    log_prefactor = a * math.log(x) - x - math.lgamma(a)
+    if x < a + 1:
+        term = total = 1 / a
+        n = a
+        while abs(term) > abs(total) * 1e-15:
+            n += 1
+            term *= x / n
+            total += term
+        return max(0.0, 1 - total * math.exp(log_prefactor))
+    # Modified Lentz's method
+    tiny = 1e-300
+    b = x + 1 - a
+    c = 1 / tiny
+    d = 1 / b
+    h = d
+    for i in range(1, 1000):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = tiny if abs(d) < tiny else d
+        c = b + an / c
+        c = tiny if abs(c) < tiny else c
+        d = 1 / d
+        delta = d * c
+        h *= delta
+        if abs(delta - 1) < 1e-15:
+            break
+    return min(1.0, math.exp(log_prefactor) * h)
+
+def ks_distance(counts : np.ndarray, probabilities : np.ndarray) -> float:
+    """Returns the Kolmogorov-Smirnov distance between the observed and the expected cumulative distributions"""
+    observed = np.cumsum(counts) / counts.sum()
+    return float(np.max(np.abs(observed - np.cumsum(probabilities))))
+
+def dkw_bound(shots : int, alpha : float) -> float:
+    """With probability at least 1 - alpha, the observed cumulative distribution of the shots
+    is within this distance of the true one (Dvoretzky-Kiefer-Wolfowitz inequality)
+    """
+    return math.sqrt(math.log(2 / alpha) / (2 * shots))
+
+def shots_needed(tolerance : float, confidence : float, looks : int = 1) -> int:
+    """Returns the number of shots after which a correct implementation passes the test
+    with the given tolerance and confidence, when the significance is split between the given number of looks
+    """
+    alpha = (1 - confidence) / looks
+    return math.ceil(math.log(2 / alpha) / (2 * (tolerance / 2) ** 2))
+
+# ------------------------------------------------------
+def batch_schedule(batch_size : int, max_shots : int) -> list:
+    """Returns the sizes of the batches: doubling from batch_size until the total reaches max_shots"""
+    sizes = []
+    total = 0
+    size = batch_size
+    while total < max_shots:
+        size = min(size, max_shots - total)
+        sizes.append(size)
+        total += size
+        size *= 2
+    return sizes
+
+def sequential_test(sampler : Sampler, probabilities : Sequence[float], confidence : float = 0.999,
+                    tolerance : float = 0.02, batch_size : int = 1_000, max_shots : int = 1_000_000,
+                    time_budget : float = None, offset : int = 0) -> Dict:
+    """Samples the outcomes in batches until the observed distribution is shown to match the expected probabilities
+    of the outcomes 0, 1, ... within tolerance, or to differ from them, or the shots or the time run out.
+    offset is subtracted from the outcomes before they are counted (for example, min for RandomNumberInRange).
+
+    Returns a dictionary with the 'status' ('pass', 'fail' or 'inconclusive'), the 'reason' for it,
+    the number of 'shots' taken, the 'counts' of the outcomes, the chi-square 'p_value', the 'ks_distance',
+    its 'bound' at the last look, and 'shots_needed' for a correct implementation to pass.
+    """
+    probabilities = np.asarray(probabilities, dtype = np.float64)
+    if abs(probabilities.sum() - 1) > 1e-9 or np.any(probabilities < 0):
+        raise ValueError("The expected probabilities must be non-negative and add up to 1")
+    if not 0 < confidence < 1 or tolerance <= 0:
+        raise ValueError("confidence must be between 0 and 1 and tolerance must be positive")
+    schedule = batch_schedule(batch_size, max_shots)
+    alpha = (1 - confidence) / len(schedule)
+    counts = np.zeros(len(probabilities), dtype = np.int64)
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    result = { 'shots' : 0, 'p_value' : None, 'ks_distance' : None, 'bound' : None,
+               'shots_needed' : shots_needed(tolerance, confidence, len(schedule)) }
+
+    for size in schedule:
+        outcomes = np.asarray(sampler(size), dtype = np.int64) - offset
+        if len(outcomes) != size:
+            raise ValueError(f"The sampler returned {len(outcomes)} outcomes for {size} shots")
+        unexpected = (outcomes < 0) | (outcomes >= len(counts))
+        if np.any(unexpected):
+            return dict(result, status = 'fail', counts = counts,
+                        reason = f"Unexpected outcome {outcomes[unexpected][0] + offset}")
+        counts += np.bincount(outcomes, minlength = len(counts))
+        result['shots'] += size
+
+        impossible = np.flatnonzero((probabilities == 0) & (counts > 0))
+        if len(impossible) > 0:
+            return dict(result, status = 'fail', counts = counts,
+                        reason = f"Outcome {impossible[0] + offset} should never happen, but happened {counts[impossible[0]]} times")
+        result['p_value'] = chi_square_p_value(counts, probabilities)
+        result['ks_distance'] = ks_distance(counts, probabilities)
+        result['bound'] = dkw_bound(result['shots'], alpha)
+        if result['p_value'] < alpha:
+            return dict(result, status = 'fail', counts = counts,
+                        reason = f"The outcomes don't follow the expected distribution (chi-square p-value {result['p_value']:.2e})")
+        if result['ks_distance'] <= tolerance / 2 and result['bound'] <= tolerance / 2:
+            return dict(result, status = 'pass', counts = counts,
+                        reason = f"The distribution is within {tolerance} of the expected one")
+        if deadline is not None and time.perf_counter() > deadline:
+            break
+    return dict(result, status = 'inconclusive', counts = counts,
+                reason = f"Neither confirmed nor rejected the expected distribution after {result['shots']} shots")
+
+def format_result(result : Dict) -> str:
+    """Formats the result of sequential_test as a short report"""
+    lines = [f"{result['status']}: {result['reason']}",
+             f"  shots: {result['shots']} (a correct implementation needs about {result['shots_needed']})"]
+    if result['p_value'] is not None:
+        lines.append(f"  chi-square p-value: {result['p_value']:.4g}, KS distance: {result['ks_distance']:.4g} "
+                     f"(± {result['bound']:.4g})")
+    return "\n".join(lines)
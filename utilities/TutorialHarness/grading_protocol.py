@@ -0,0 +1,116 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+"""The protocol between the tutorial harnesses and the grading daemon (scripts/grading_daemon.py).
+
+Messages are pickled and sent as frames: the length of the pickled message as a 4-byte big-endian integer,
+followed by the message. A submitted function is sent as its compiled code together with the globals it refers to
+(see portable_function()), and the daemon turns it back into a function with rebuild_function().
+Only numbers, strings, tuples of them, modules, library functions and types, the functions of the harness
+and other functions written in the notebook can be sent; anything else raises Unportable.
+"""
+
+import builtins
+import importlib
+import marshal
+import pickle
+import struct
+import types
+
+FRAME_HEADER = struct.Struct('>I')
+
+class Unportable(Exception):
+    pass
+
+def encode_frame(message):
+    data = pickle.dumps(message)
+    return FRAME_HEADER.pack(len(data)) + data
+
+def send_frame(connection, message):
+    connection.sendall(encode_frame(message))
+
+def receive_exactly(connection, size):
+    chunks = []
+    while size > 0:
+        chunk = connection.recv(min(size, 1 << 20))
+        if not chunk:
+            raise EOFError("the grading daemon closed the connection")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+def receive_frame(connection):
+    (size,) = FRAME_HEADER.unpack(receive_exactly(connection, FRAME_HEADER.size))
+    return pickle.loads(receive_exactly(connection, size))
+
+# ------------------------------------------------------
+def global_names(code):
+    yield from code.co_names
+    for const in code.co_consts:
+        if hasattr(const, 'co_code'):
+            yield from global_names(const)
+
+def portable_value(value, module, harness_module, portable):
+    if isinstance(value, (bool, int, float, complex, str, bytes, type(None), type(...))):
+        return ('value', value)
+    if isinstance(value, tuple):
+        return ('tuple', tuple(portable_value(item, module, harness_module, portable) for item in value))
+    if isinstance(value, types.ModuleType):
+        return ('module', value.__name__)
+    if isinstance(value, types.FunctionType) and value.__module__ == module:
+        add_portable_function(value, harness_module, portable)
+        return ('function', value.__name__)
+    if getattr(value, '__module__', None) == harness_module:
+        # The functions of the harness are taken from the daemon's copy of it
+        return ('harness', value.__name__)
+    if isinstance(value, (types.FunctionType, types.BuiltinFunctionType, type)):
+        return ('import', value.__module__, value.__qualname__)
+    raise Unportable()
+
+def add_portable_function(fun, harness_module, portable):
+    if fun.__name__ in portable['functions']:
+        return
+    if fun.__closure__:
+        raise Unportable()
+    entry = { 'code' : marshal.dumps(fun.__code__) }
+    portable['functions'][fun.__name__] = entry
+    entry['defaults'] = [portable_value(value, fun.__module__, harness_module, portable) for value in fun.__defaults__ or ()]
+    entry['kwdefaults'] = { name : portable_value(value, fun.__module__, harness_module, portable)
+                            for (name, value) in (fun.__kwdefaults__ or {}).items() }
+    for name in global_names(fun.__code__):
+        if name in fun.__globals__ and name not in portable['globals']:
+            portable['globals'][name] = portable_value(fun.__globals__[name], fun.__module__, harness_module, portable)
+
+# Returns the description of the function and of everything it refers to, which rebuild_function() turns back into a function;
+# harness_module is the name of the tutorial's testing module
+def portable_function(fun, harness_module):
+    portable = { 'name' : fun.__name__, 'functions' : {}, 'globals' : {} }
+    add_portable_function(fun, harness_module, portable)
+    return portable
+
+# Rebuilds the function described by portable_function(), with the other notebook functions it uses;
+# harness_namespace is the global namespace of the daemon's copy of the testing module
+def rebuild_function(portable, harness_namespace):
+    namespace = { '__builtins__' : builtins, '__name__' : '__main__' }
+    functions = { name : types.FunctionType(marshal.loads(entry['code']), namespace, name)
+                  for (name, entry) in portable['functions'].items() }
+    def resolve(spec):
+        if spec[0] == 'value':
+            return spec[1]
+        if spec[0] == 'tuple':
+            return tuple(resolve(item) for item in spec[1])
+        if spec[0] == 'module':
+            return importlib.import_module(spec[1])
+        if spec[0] == 'function':
+            return functions[spec[1]]
+        if spec[0] == 'harness':
+            return harness_namespace[spec[1]]
+        value = importlib.import_module(spec[1])
+        for part in spec[2].split('.'):
+            value = getattr(value, part)
+        return value
+    namespace.update((name, resolve(spec)) for (name, spec) in portable['globals'].items())
+    for (name, entry) in portable['functions'].items():
+        functions[name].__defaults__ = tuple(resolve(spec) for spec in entry['defaults']) or None
+        functions[name].__kwdefaults__ = { key : resolve(spec) for (key, spec) in entry['kwdefaults'].items() } or None
+    return functions[portable['name']]
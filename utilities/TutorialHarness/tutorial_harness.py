@@ -0,0 +1,527 @@
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT license.
+
+"""Grading machinery shared by the Python test harnesses of the tutorials (tutorials/*/testing.py).
+
+Each testing.py defines the tests and the reference implementations of its exercises, and creates
+a Harness that keeps the registry of the tests and runs them. The harness records the instrumentation
+of the grading, caches the test results and grades the exercises in the background, so that these are implemented
+once for all the tutorials:
+
+    harness = Harness(__file__, globals())
+    exercise = harness.exercise
+    test = harness.test
+
+The tests print their results with harness_print(), which writes to the output of the exercise being graded
+(the stream set in thread_output for the thread that runs the test) or, by default, to the standard output.
+"""
+
+import builtins
+import concurrent.futures
+import hashlib
+import io
+import json
+import math
+import os
+import pickle
+import random
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+import types
+
+from grading_protocol import Unportable, portable_function, rebuild_function, receive_frame, send_frame
+
+# The largest escalation level of the extra trials run by adaptive_trials()
+MAX_ESCALATION = 3
+
+# The buckets of the grading duration histogram written by export_prometheus()
+GRADING_BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10]
+
+# How long (in seconds) the kernel waits for the grading daemon past the deadline it sends, so that the daemon's answer
+# (including "this submission timed out") always arrives before the kernel gives up and grades the exercise itself
+DAEMON_REPLY_MARGIN = 5
+
+# The output of the tests running on a background thread goes to the stream set for that thread
+thread_output = threading.local()
+
+def harness_print(*args, **kwargs):
+    stream = getattr(thread_output, 'stream', None)
+    if stream is not None:
+        kwargs['file'] = stream
+    builtins.print(*args, **kwargs)
+
+class Unfingerprintable(Exception):
+    pass
+
+def fingerprint_code(code, h, module, globals_dict, seen):
+    h.update(code.co_code)
+    h.update(repr((code.co_names, code.co_varnames, code.co_freevars, code.co_cellvars,
+                   code.co_argcount, code.co_kwonlyargcount, code.co_flags)).encode())
+    for const in code.co_consts:
+        if hasattr(const, 'co_code'):
+            fingerprint_code(const, h, module, globals_dict, seen)
+        else:
+            h.update(repr(const).encode())
+    for name in code.co_names:
+        if name in globals_dict:
+            h.update(name.encode())
+            fingerprint_value(globals_dict[name], h, module, seen)
+
+def fingerprint_value(value, h, module, seen):
+    if isinstance(value, (bool, int, float, complex, str, bytes, type(None), type(...))):
+        h.update(repr(value).encode())
+    elif isinstance(value, (tuple, frozenset)):
+        h.update(type(value).__name__.encode())
+        for item in (value if isinstance(value, tuple) else sorted(value, key=repr)):
+            fingerprint_value(item, h, module, seen)
+    elif isinstance(value, types.ModuleType):
+        h.update(('module ' + value.__name__).encode())
+    elif isinstance(value, types.FunctionType) and value.__module__ == module:
+        # Other functions written in the notebook are fingerprinted by their contents
+        if id(value) in seen:
+            h.update(('recursive ' + value.__qualname__).encode())
+            return
+        seen.add(id(value))
+        fingerprint_function(value, h, seen)
+    elif isinstance(value, (types.FunctionType, types.BuiltinFunctionType, type)):
+        # Library functions and types, as well as the functions of the harness, are identified by name
+        h.update('{0}.{1}'.format(getattr(value, '__module__', None), value.__qualname__).encode())
+    else:
+        try:
+            hash(value)
+        except TypeError:
+            raise Unfingerprintable()
+        text = repr(value)
+        if ' at 0x' in text:
+            # The default representation only identifies the object within the current session
+            raise Unfingerprintable()
+        h.update(text.encode())
+
+def fingerprint_function(fun, h, seen):
+    fingerprint_code(fun.__code__, h, fun.__module__, fun.__globals__, seen)
+    for value in (fun.__defaults__ or ()) + tuple((fun.__kwdefaults__ or {}).values()):
+        fingerprint_value(value, h, fun.__module__, seen)
+    for cell in fun.__closure__ or ():
+        fingerprint_value(cell.cell_contents, h, fun.__module__, seen)
+
+# The hash of the sources which define the tests: the tutorial's testing.py and this module
+def source_hash(path):
+    h = hashlib.sha256()
+    for source in (path, __file__):
+        with open(source, 'rb') as f:
+            h.update(f.read())
+    return h.digest()
+
+class GradingCancelled(Exception):
+    pass
+
+def ipython_shell():
+    try:
+        from IPython import get_ipython
+        return get_ipython()
+    except ImportError:
+        return None
+
+# Shows the grading status in the output of the exercise cell, or prints it if the notebook display isn't available
+def progress_display(text):
+    if ipython_shell() is None:
+        return None
+    from IPython.display import display
+    return display({ 'text/plain' : text }, raw=True, display_id=True)
+
+def show(handle, text):
+    if handle is not None:
+        handle.update({ 'text/plain' : text }, raw=True)
+    else:
+        builtins.print(text)
+
+class Harness:
+    """The test registry and the grading of one tutorial.
+
+    namespace is the global namespace of the tutorial's testing.py: the reference implementation of an exercise
+    is the function named after the exercise with the _ref suffix in it.
+    """
+
+    def __init__(self, path, namespace):
+        self.tutorial = os.path.basename(os.path.dirname(os.path.abspath(path)))
+        self.namespace = namespace
+        self.tests = {}
+        # Runs the test of an exercise on the submitted function; a tutorial can replace it to prepare the inputs
+        self.run_test_function = lambda test, fun: test(fun)
+        # Grades the submitted function somewhere else than in this kernel, returning False if it has to be graded here;
+        # by default, on the grading daemon if there is one
+        self.remote_grader = self.grade_on_daemon
+        # Returns the seed of the inputs shared between the tests, if the tutorial draws them from somewhere else than set_seed()
+        self.input_seed = lambda: None
+        # The last function submitted for each exercise
+        self.submitted = {}
+
+        # ------------------------------------------------------
+        # Instrumentation of the tests: when enabled with instrument(), grading an exercise records the wall time,
+        # CPU time and peak memory (traced with tracemalloc) of every call to the learner's function and to the reference
+        # implementation, as well as the duration of the whole test.
+        # The records can be exported with export_jsonl() and export_prometheus().
+        # Setting the KATAS_INSTRUMENT_TESTS environment variable to 1 enables the instrumentation without changing the notebook.
+        self.instrumentation = { 'enabled' : os.environ.get('KATAS_INSTRUMENT_TESTS') == '1', 'trace_memory' : True, 'records' : [] }
+        self.call_depth = [0]
+
+        # ------------------------------------------------------
+        # Asynchronous grading: when enabled with grade_asynchronously(), the exercise decorator returns immediately
+        # and the test runs on a background thread, so that the notebook stays responsive while large tests run.
+        # The progress (the number of trials run and their rate) and then the test output are shown in the output of the cell
+        # that defined the exercise. Grading is cancelled by interrupting the kernel or calling cancel_grading().
+        self.grading = { 'asynchronous' : False, 'executor' : None, 'pending' : [] }
+
+        # ------------------------------------------------------
+        # Result cache: when enabled with cache_results(), the output of each test is stored under a fingerprint
+        # of the submitted function and the test, and re-submitting an unchanged function replays the stored output
+        # instead of running the test again (for example, when all cells of a finished notebook are re-run).
+        # The fingerprint covers the function's code, constants, default arguments, the globals it refers to
+        # and its closure values (recursively for the other functions defined in the notebook),
+        # as well as the sources of testing.py and of this module and the seed set with set_seed().
+        # Functions that refer to values which can't be fingerprinted reliably (such as lists) are always graded.
+        self.result_cache = { 'enabled' : False, 'path' : None, 'results' : {}, 'seed' : None }
+        self.source_hash = source_hash(path)
+
+        # ------------------------------------------------------
+        # Trial scheduling: each test runs its edge cases first, since they are cheap and find most bugs,
+        # then its random cases, and stops at the first failure. With adaptive_trials(), a test whose trials have all passed
+        # keeps sampling random cases until the passed trials give the target confidence that the function fails
+        # on less than the given fraction of random cases, or until the time budget runs out. These extra trials escalate
+        # to larger cases: each block of as many trials as the test runs by default raises the escalation level by one
+        # (up to MAX_ESCALATION), and the generators of the tutorial grow the sizes of their inputs by that level.
+        self.trial_schedule = { 'adaptive' : False, 'confidence' : 0.99, 'failure_rate' : 0.05, 'time_budget' : 1.0, 'max_trials' : 1000 }
+        # The trial that is running (None outside of trials()) and its escalation level
+        self.trial_state = { 'trial' : None, 'escalation' : 0 }
+        # Called with the number of each trial before it runs; a tutorial can replace it to prepare the inputs of the trial
+        self.trial_started = lambda trial: None
+
+        # ------------------------------------------------------
+        # Remote grading: when the KATAS_GRADING_SOCKET environment variable (or grade_remotely()) gives the path
+        # of the Unix socket of a grading daemon (scripts/grading_daemon.py), the exercises are sent to the daemon to be graded.
+        # The daemon keeps the generated inputs and the results of the reference implementations warm and shares them
+        # between all the kernels that submit the same exercise, so its tests use its own fixed seed rather than set_seed().
+        # The function is sent as its compiled code together with the globals it refers to (see grading_protocol.py);
+        # functions that refer to values which can't be sent, instrumented tests and any failure to reach the daemon
+        # fall back to grading in the kernel.
+        self.remote_grading = { 'socket' : os.environ.get('KATAS_GRADING_SOCKET'), 'timeout' : 60 }
+
+    # Exercise decorator, specifying that this function needs to be tested
+    def exercise(self, fun):
+        self.submitted[fun.__name__] = fun
+        cache_key = self.result_cache_key(fun)
+        if self.grading['asynchronous']:
+            self.grade_in_background(fun, cache_key)
+        else:
+            self.run_cached_test(fun, cache_key)
+        return fun
+
+    # Test decorator, specifying that this is a test for an exercise
+    def test(self, fun):
+        self.tests[fun.__name__[:-5]] = fun
+        return fun
+
+    def instrument(self, enabled = True, trace_memory = True):
+        self.instrumentation['enabled'] = enabled
+        self.instrumentation['trace_memory'] = trace_memory
+
+    # Wraps the function so that each call to it is recorded as a trial of the exercise
+    # Each record holds the trial of the test in which the call was made (None outside of trials()) and its depth:
+    # 0 for a call made by the test, 1 for a call made during another measured call (such as a learner's function
+    # calling the reference implementation), and so on
+    def measured(self, fun, exercise_name, role):
+        call_depth = self.call_depth
+        def wrapper(*args, **kwargs):
+            depth = call_depth[0]
+            # Memory is only traced for the outermost measured call, since resetting the peak would affect the calls around it
+            trace = tracemalloc.is_tracing() and depth == 0
+            if trace:
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+            call_depth[0] += 1
+            wall = time.perf_counter()
+            cpu = time.process_time()
+            try:
+                return fun(*args, **kwargs)
+            finally:
+                cpu = time.process_time() - cpu
+                wall = time.perf_counter() - wall
+                call_depth[0] -= 1
+                peak = tracemalloc.get_traced_memory()[1] - base if trace else None
+                self.instrumentation['records'].append({ 'tutorial' : self.tutorial, 'exercise' : exercise_name, 'role' : role,
+                                                         'trial' : self.trial_state['trial'], 'depth' : depth,
+                                                         'wall_time' : wall, 'cpu_time' : cpu, 'peak_memory' : peak })
+        wrapper.__name__ = fun.__name__
+        return wrapper
+
+    # Runs the test of the exercise, recording the calls if the instrumentation is enabled; local_wrapper (if given) wraps the function when it is graded in the kernel,
+    # since the daemon is sent the submitted function itself
+    def run_test(self, fun, local_wrapper = None):
+        name = fun.__name__
+        if not self.instrumentation['enabled']:
+            if not self.remote_grader(fun):
+                self.run_test_function(self.tests[name], fun if local_wrapper is None else local_wrapper(fun))
+            return
+        ref_name = name + '_ref'
+        ref = self.namespace.get(ref_name)
+        if ref is not None:
+            self.namespace[ref_name] = self.measured(ref, name, 'reference')
+        started_tracing = self.instrumentation['trace_memory'] and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            self.run_test_function(self.tests[name], self.measured(fun if local_wrapper is None else local_wrapper(fun), name, 'learner'))
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+            if ref is not None:
+                self.namespace[ref_name] = ref
+            self.instrumentation['records'].append({ 'tutorial' : self.tutorial, 'exercise' : name, 'role' : 'test', 'trial' : None, 'depth' : None,
+                                                     'wall_time' : time.perf_counter() - wall,
+                                                     'cpu_time' : time.process_time() - cpu, 'peak_memory' : None })
+
+    # Writes the records as JSON lines, one record per line
+    def export_jsonl(self, path, append = True):
+        with open(path, 'a' if append else 'w') as f:
+            for record in self.instrumentation['records']:
+                f.write(json.dumps(record) + '\n')
+
+    # Writes the records aggregated per exercise and role in the Prometheus text format (e.g., for the node exporter textfile collector);
+    # only the calls made by the tests are counted, since the time of a nested call is part of the call around it
+    def export_prometheus(self, path):
+        calls = {}
+        for record in self.instrumentation['records']:
+            if record['role'] == 'test' or record['depth'] != 0: continue
+            key = (record['exercise'], record['role'])
+            total = calls.setdefault(key, { 'count' : 0, 'wall' : 0.0, 'cpu' : 0.0, 'peak' : 0 })
+            total['count'] += 1
+            total['wall'] += record['wall_time']
+            total['cpu'] += record['cpu_time']
+            total['peak'] = max(total['peak'], record['peak_memory'] or 0)
+        lines = []
+        metrics = [('calls_total', 'counter', 'Number of calls', 'count'),
+                   ('wall_seconds_total', 'counter', 'Total wall time of the calls', 'wall'),
+                   ('cpu_seconds_total', 'counter', 'Total CPU time of the calls', 'cpu'),
+                   ('peak_memory_bytes', 'gauge', 'Largest peak memory allocated during a call', 'peak')]
+        for (metric, kind, help_text, field) in metrics:
+            lines.append("# HELP tutorial_exercise_{0} {1}".format(metric, help_text))
+            lines.append("# TYPE tutorial_exercise_{0} {1}".format(metric, kind))
+            for ((exercise_name, role), total) in sorted(calls.items()):
+                lines.append('tutorial_exercise_{0}{{tutorial="{1}",exercise="{2}",role="{3}"}} {4}'
+                             .format(metric, self.tutorial, exercise_name, role, total[field]))
+
+        durations = {}
+        for record in self.instrumentation['records']:
+            if record['role'] == 'test':
+                durations.setdefault(record['exercise'], []).append(record['wall_time'])
+        lines.append("# HELP tutorial_grading_duration_seconds Duration of grading an exercise")
+        lines.append("# TYPE tutorial_grading_duration_seconds histogram")
+        for (exercise_name, values) in sorted(durations.items()):
+            labels = 'tutorial="{0}",exercise="{1}"'.format(self.tutorial, exercise_name)
+            for bound in GRADING_BUCKETS:
+                lines.append('tutorial_grading_duration_seconds_bucket{{{0},le="{1}"}} {2}'
+                             .format(labels, bound, sum(1 for v in values if v <= bound)))
+            lines.append('tutorial_grading_duration_seconds_bucket{{{0},le="+Inf"}} {1}'.format(labels, len(values)))
+            lines.append('tutorial_grading_duration_seconds_sum{{{0}}} {1}'.format(labels, sum(values)))
+            lines.append('tutorial_grading_duration_seconds_count{{{0}}} {1}'.format(labels, len(values)))
+
+        # Write to a temporary file and rename it, so that a scraper never reads a partially written file
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(temp_path, path)
+
+    def grade_remotely(self, socket_path, timeout = 60):
+        self.remote_grading['socket'] = socket_path
+        self.remote_grading['timeout'] = timeout
+
+    # Grades the exercise on the daemon and prints the output of the test; returns False if it has to be graded in the kernel.
+    # The daemon gets the timeout as a deadline: it doesn't start grading the submission after it, and stops grading it then
+    def grade_on_daemon(self, fun):
+        if self.remote_grading['socket'] is None:
+            return False
+        try:
+            portable = portable_function(fun, self.namespace['__name__'])
+        except Unportable:
+            return False
+        timeout = self.remote_grading['timeout']
+        request = { 'type' : 'grade', 'tutorial' : self.tutorial, 'exercise' : fun.__name__,
+                    'function' : portable, 'python' : sys.version, 'deadline' : time.time() + timeout }
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+                connection.settimeout(timeout + DAEMON_REPLY_MARGIN)
+                connection.connect(self.remote_grading['socket'])
+                send_frame(connection, request)
+                response = receive_frame(connection)
+        except (OSError, EOFError, pickle.PickleError):
+            return False
+        if response.get('status') != 'ok':
+            return False
+        harness_print(response['output'], end='')
+        return True
+
+    # Rebuilds a function sent by grade_on_daemon() (in the daemon), referring to the functions of this harness
+    def rebuild_function(self, portable):
+        return rebuild_function(portable, self.namespace)
+
+    def adaptive_trials(self, enabled = True, confidence = 0.99, failure_rate = 0.05, time_budget = 1.0, max_trials = 1000):
+        if not 0 < confidence < 1:
+            raise ValueError("confidence must be between 0 and 1 (exclusive), got {0}".format(confidence))
+        if not 0 < failure_rate < 1:
+            raise ValueError("failure_rate must be between 0 and 1 (exclusive), got {0}".format(failure_rate))
+        self.trial_schedule.update(adaptive = enabled, confidence = confidence, failure_rate = failure_rate,
+                                   time_budget = time_budget, max_trials = max_trials)
+
+    # Yields the trial numbers for a test that runs `count` trials (its edge cases followed by its random cases)
+    def trials(self, count):
+        try:
+            for trial in self.trial_numbers(count):
+                self.trial_state.update(trial = trial, escalation = self.escalation(trial, count))
+                self.trial_started(trial)
+                yield trial
+        finally:
+            self.trial_state.update(trial = None, escalation = 0)
+
+    # Returns how much larger than the original sizes the cases of the trial are: 0 for the trials the test runs
+    # by default, and one more for each block of `count` extra trials, up to MAX_ESCALATION
+    def escalation(self, trial, count):
+        if trial < count:
+            return 0
+        return min(MAX_ESCALATION, 1 + (trial - count) // count)
+
+    def trial_numbers(self, count):
+        schedule = self.trial_schedule
+        if not schedule['adaptive']:
+            yield from range(count)
+            return
+        # n passed trials rule out a failure rate of p or more with confidence 1 - (1 - p)^n
+        needed = math.ceil(math.log(1 - schedule['confidence']) / math.log(1 - schedule['failure_rate']))
+        deadline = time.perf_counter() + schedule['time_budget']
+        for trial in range(max(count, min(needed, schedule['max_trials']))):
+            if trial >= count and time.perf_counter() > deadline:
+                return
+            yield trial
+
+    def cache_results(self, enabled = True, path = None):
+        self.result_cache['enabled'] = enabled
+        self.result_cache['path'] = path
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.result_cache['results'].update(json.load(f))
+
+    # Seeds the random number generator before each test, so that the tests use the same inputs every time
+    def set_seed(self, seed):
+        self.result_cache['seed'] = seed
+
+    # Returns the key of the test results for the submitted function, or None if they shouldn't be cached
+    def result_cache_key(self, fun):
+        if not self.result_cache['enabled']:
+            return None
+        h = hashlib.sha256()
+        h.update(repr((sys.version, self.tutorial, fun.__name__, self.result_cache['seed'], self.input_seed())).encode())
+        h.update(self.source_hash)
+        try:
+            fingerprint_function(fun, h, set())
+        except (Unfingerprintable, ValueError):
+            return None
+        return h.hexdigest()
+
+    # Runs the test, replaying the stored output if the result for this key is cached
+    def run_cached_test(self, fun, cache_key, local_wrapper = None):
+        if self.result_cache['seed'] is not None:
+            random.seed('{0}:{1}'.format(self.result_cache['seed'], fun.__name__))
+        if cache_key is None:
+            self.run_test(fun, local_wrapper)
+            return
+        results = self.result_cache['results']
+        if cache_key in results:
+            harness_print(results[cache_key], end='')
+            return
+        stream = getattr(thread_output, 'stream', None)
+        thread_output.stream = io.StringIO()
+        try:
+            self.run_test(fun, local_wrapper)
+            output = thread_output.stream.getvalue()
+        finally:
+            captured = thread_output.stream.getvalue()
+            thread_output.stream = stream
+            harness_print(captured, end='')
+        results[cache_key] = output
+        if self.result_cache['path'] is not None:
+            temp_path = self.result_cache['path'] + '.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(results, f)
+            os.replace(temp_path, self.result_cache['path'])
+
+    def grade_asynchronously(self, enabled = True):
+        self.grading['asynchronous'] = enabled
+        if enabled and self.grading['executor'] is None:
+            # A single worker thread grades the exercises one at a time, in the order in which they were submitted
+            self.grading['executor'] = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='grading')
+            # Interrupting the kernel raises KeyboardInterrupt in the cell running at the time; cancel the grading then
+            shell = ipython_shell()
+            if shell is not None:
+                shell.events.register('post_run_cell', self.cancel_on_interrupt)
+
+    def cancel_on_interrupt(self, result):
+        if isinstance(result.error_in_exec, KeyboardInterrupt):
+            self.cancel_grading()
+
+    # Cancels all gradings which haven't finished yet
+    def cancel_grading(self):
+        for job in self.grading['pending']:
+            job['cancelled'].set()
+
+    # Waits for all pending gradings to finish
+    def wait_for_grading(self, timeout = None):
+        futures = [job['future'] for job in self.grading['pending']]
+        concurrent.futures.wait(futures, timeout)
+
+    def grade_in_background(self, fun, cache_key):
+        name = fun.__name__
+        job = { 'cancelled' : threading.Event(), 'trials' : 0 }
+        handle = progress_display(name + ": waiting for grading...")
+
+        # The trials are counted when the exercise is graded in the kernel; a daemon only reports the output of the test
+        def counted(fun):
+            def wrapper(*args, **kwargs):
+                if job['cancelled'].is_set():
+                    raise GradingCancelled()
+                result = fun(*args, **kwargs)
+                job['trials'] += 1
+                now = time.perf_counter()
+                if handle is not None and now - job['shown'] >= 0.25:
+                    job['shown'] = now
+                    rate = job['trials'] / (now - job['started'])
+                    show(handle, "{0}: grading... {1} trials run, {2:.1f} cases/s".format(name, job['trials'], rate))
+                return result
+            wrapper.__name__ = name
+            return wrapper
+
+        def run():
+            job['started'] = job['shown'] = time.perf_counter()
+            thread_output.stream = io.StringIO()
+            try:
+                if job['cancelled'].is_set():
+                    raise GradingCancelled()
+                if handle is not None:
+                    show(handle, name + ": grading...")
+                # The submitted function itself is tried on the daemon, which can't be sent the counting wrapper
+                self.run_cached_test(fun, cache_key, counted)
+                status = thread_output.stream.getvalue().rstrip('\n')
+            except GradingCancelled:
+                status = "{0}: grading cancelled after {1} trials".format(name, job['trials'])
+            except Exception as e:
+                status = thread_output.stream.getvalue() + "Your function raised an exception: {0!r}".format(e)
+            finally:
+                thread_output.stream = None
+                self.grading['pending'].remove(job)
+            show(handle, status)
+
+        self.grading['pending'].append(job)
+        job['future'] = self.grading['executor'].submit(run)